@@ -45,6 +45,10 @@ export function runEnvelopeFilesQAScript(id, fileId, scriptId) {
   return post(`envelopes/${id}/files/${fileId}/run_qa_script/`, { script_id: scriptId });
 }
 
+export function fetchEnvelopeFileScriptRunResult(id, fileId, jobId) {
+  return fetch(`envelopes/${id}/files/${fileId}/script-runs/${jobId}/download/`);
+}
+
 export function fetchEnvelopeFilesConvertScripts(id, fileId) {
   return fetch(`envelopes/${id}/files/${fileId}/conversion_scripts/`);
 }
@@ -56,6 +60,10 @@ export function fetchEnvelopeFeedback(id) {
   return fetch(`envelopes/${id}/feedback/`);
 }
 
+export function fetchEnvelopeFileQAResultBody(id, fileId, resultId) {
+  return fetch(`envelopes/${id}/files/${fileId}/qa-results/${resultId}/body/`);
+}
+
 export function runEnvelopeTransition(id, transitionName) {
   return post(`envelopes/${id}/transition/`, { transition_name: transitionName });
 }
@@ -12,11 +12,20 @@ export function runEnvelopeFilesConvertScript(id, fileId, scriptId) {
     xsrfCookieName: "csrftoken",
     xsrfHeaderName: "X-CSRFTOKEN",
     url: `envelopes/${id}/files/${fileId}/run_conversion_script/`,
-    responseType: 'arraybuffer',
     data: { convert_id: scriptId },
   })
 }
 
+export function downloadEnvelopeFilesConvertResult(id, fileId, jobId) {
+  return axios({
+    baseURL: apiURL,
+    withCredentials: true,
+    method: 'get',
+    url: `envelopes/${id}/files/${fileId}/script-runs/${jobId}/download/`,
+    responseType: 'arraybuffer',
+  })
+}
+
 export function updateFile(id, fileId, name) {
   return update(`envelopes/${id}/files/${fileId}/`, { name: name });
 }
@@ -0,0 +1,44 @@
+export default {
+  name: 'scriptRuns',
+
+  data() {
+    return {
+      // Callbacks of QA script & conversion runs in progress, by job id
+      scriptRuns: {},
+      // Outcomes announced before their run was tracked, by job id
+      announcedScriptRuns: {},
+    };
+  },
+
+  methods: {
+    isScriptRunMessage(message) {
+      return ['completed_script_run', 'failed_script_run'].includes(message.event);
+    },
+
+    /**
+     * Calls `callback` with the message announcing the outcome of run `jobId`.
+     * The outcome can be announced before the request queueing the run resolves,
+     * so messages of untracked runs are kept until their run is tracked.
+     */
+    trackScriptRun(jobId, callback) {
+      const message = this.announcedScriptRuns[jobId];
+      if (message) {
+        delete this.announcedScriptRuns[jobId];
+        callback(message);
+      } else {
+        this.scriptRuns[jobId] = callback;
+      }
+    },
+
+    handleScriptRunMessage(message) {
+      const jobId = message.data.job_id;
+      const callback = this.scriptRuns[jobId];
+      if (!callback) {
+        this.announcedScriptRuns[jobId] = message;
+        return;
+      }
+      delete this.scriptRuns[jobId];
+      callback(message);
+    },
+  },
+};
@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 from guardian.admin import GuardedModelAdmin
@@ -18,6 +18,7 @@ from .models import (
     DemoAutoQAWorkflow,
     TransitionEvent
 )
+from .script_listings import invalidate as invalidate_script_listings
 
 
 user_model = get_user_model()
@@ -78,8 +79,31 @@ class ObligationSpecReporterAdmin(admin.TabularInline):
 
 
 @admin.register(ObligationSpec)
-class ObligationSpecAdmin(admin.ModelAdmin):
+class ObligationSpecAdmin(DjangoObjectActions, admin.ModelAdmin):
     inlines = [ObligationSpecReporterAdmin, ]
+    actions = ['refresh_script_listings']
+    change_actions = ('refresh_script_listing',)
+
+    def invalidate_script_listings(self, request, uris):
+        for uri in uris:
+            invalidate_script_listings(uri)
+        self.message_user(
+            request,
+            f'Cached QA script & conversion listings cleared for: {", ".join(sorted(uris))}',
+            messages.SUCCESS
+        )
+
+    def refresh_script_listings(self, request, queryset):
+        uris = set(queryset.values_list('qa_xmlrpc_uri', flat=True))
+        self.invalidate_script_listings(request, uris)
+
+    refresh_script_listings.short_description = 'Refresh QA script & conversion listings'
+
+    def refresh_script_listing(self, request, obj):
+        self.invalidate_script_listings(request, {obj.qa_xmlrpc_uri})
+
+    refresh_script_listing.label = 'Refresh QA script listings'
+    refresh_script_listing.short_description = 'Refresh the cached QA script & conversion listings'
 
     def get_readonly_fields(self, request, obj=None):
         if obj and obj.is_current:
@@ -17,6 +17,8 @@ from .views import (
     EnvelopeSupportFileViewSet,
     EnvelopeLinkViewSet,
     EnvelopeWorkflowViewSet,
+    QAJobResultViewSet,
+    ScriptRunJobViewSet,
     UploadHookView,
     UploadTokenViewSet,
     WorkspaceProfileViewSet,
@@ -149,6 +151,22 @@ files_router.register(
     base_name='envelope-file'
 )
 
+script_runs_router = routers.NestedSimpleRouter(
+    files_router, 'files', lookup='file')
+script_runs_router.register(
+    'script-runs',
+    ScriptRunJobViewSet,
+    base_name='envelope-file-script-run'
+)
+
+qa_results_router = routers.NestedSimpleRouter(
+    files_router, 'files', lookup='file')
+qa_results_router.register(
+    'qa-results',
+    QAJobResultViewSet,
+    base_name='envelope-file-qa-result'
+)
+
 workflow_router = routers.NestedSimpleRouter(
     envelopes_router, 'envelopes', lookup='envelope')
 workflow_router.register(
@@ -214,6 +232,8 @@ main_routers = [
 
 nested_routers = [
     files_router,
+    script_runs_router,
+    qa_results_router,
     original_files_router,
     support_files_router,
     links_router,
@@ -1,5 +1,18 @@
 
-from rest_framework.pagination import LimitOffsetPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import date
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class DefaultPagination(LimitOffsetPagination):
@@ -7,6 +20,136 @@ class DefaultPagination(LimitOffsetPagination):
     max_limit = 100
 
 
+def estimate_count(queryset):
+    """
+    Returns the planner's estimate of the queryset's row count, without
+    running it: `pg_class.reltuples` for an unfiltered table,
+    the query plan's row estimate otherwise.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            # reltuples is -1 for never analyzed tables
+            return max(row[0], 0) if row else 0
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a composite ordering, for deep, stable traversals.
+
+    Instead of an offset, the cursor holds the ordering key values of the last
+    row served, and the next page is filtered to rows past that key, so every
+    page costs the same as the first, given an index matching `ordering`.
+    Pagination is forward-only. No exact count is computed - an estimate
+    is returned when requested with `count=estimate`.
+
+    `ordering` fields must be concrete (use `<fk>_id` for foreign keys),
+    and must end with a unique field to keep keys unambiguous.
+    """
+    ordering = ('-id',)
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    count_query_param = 'count'
+    default_limit = 20
+    max_limit = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count = estimate_count(queryset)
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        rows = list(queryset.order_by(*self.ordering)[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        self.page = rows[:self.limit]
+        return self.page
+
+    def get_paginated_response(self, data):
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_limit(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.limit_query_param],
+                strict=True,
+                cutoff=self.max_limit
+            )
+        except (KeyError, ValueError):
+            return self.default_limit
+
+    @property
+    def fields(self):
+        """The ordering as (field name, descending) pairs."""
+        return [(f.lstrip('-'), f.startswith('-')) for f in self.ordering]
+
+    def get_keyset_filter(self, position):
+        """
+        Rows strictly after `position` in `ordering`:
+        `(a > x) OR (a = x AND b > y) OR ...`, with `<` on descending fields.
+        The redundant bound on the leading field allows an index range scan.
+        """
+        clauses = []
+        for idx, (name, desc) in enumerate(self.fields):
+            clause = {n: v for (n, _), v in zip(self.fields[:idx], position)}
+            clause[f'{name}__{"lt" if desc else "gt"}'] = position[idx]
+            clauses.append(Q(**clause))
+
+        leading, desc = self.fields[0]
+        bound = Q(**{f'{leading}__{"lte" if desc else "gte"}': position[0]})
+        return bound & reduce(or_, clauses)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [getattr(last, name) for name, _ in self.fields]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    @staticmethod
+    def encode_cursor(position):
+        values = [v.isoformat() if isinstance(v, date) else v for v in position]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
 class MappedPermissionsMixin:
     """
     Provides a `get_permissions` implementation that sources permissions
@@ -1,16 +1,14 @@
-import os
-from pathlib import Path
-from zipfile import ZipFile, BadZipFile
 from collections import OrderedDict
 import logging
 from base64 import b64encode
 from django.views import static
-from django.db.models import Q, F, Exists, OuterRef
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q, F, Exists, OuterRef, BinaryField
+from django.db.models.functions import Cast
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from django.utils.text import slugify
-from django.core.files.base import ContentFile
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import detail_route, list_route
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
@@ -20,7 +18,6 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 
 
 from django.conf import settings
-from django.core.files import File
 
 from ...models import (
     Envelope,
@@ -33,7 +30,10 @@ from ...models import (
     Reporter,
     ReportekUser,
     UploadToken,
+    UploadIngestionJob,
     QAJob,
+    QAJobResult,
+    ScriptRunJob,
 )
 
 from ...serializers import (
@@ -45,17 +45,20 @@ from ...serializers import (
     NestedEnvelopeWorkflowSerializer,
     NestedUploadTokenSerializer,
     QAJobSerializer,
+    QAJobResultSerializer,
+    ScriptRunJobSerializer,
 )
 
 from ... import permissions
 
-from .base import MappedPermissionsMixin
+from .base import MappedPermissionsMixin, KeysetPagination
 
-from reportek.core.utils import path_parts
+from reportek.core.tasks import ingest_upload, cache_envelope_archive, run_script_job
+from reportek.core.archives import ArchiveCache, ZipStream, get_envelope_files_entries
+from reportek.core import script_listings, script_runs
 
-from reportek.core.qa import RemoteQA
-from reportek.core.conversion import RemoteConversion
-from reportek.core.utils import fully_qualify_url
+from reportek.core.models.fields import iter_decompressed
+from reportek.core.utils import fully_qualify_url, get_xsd_uri
 
 
 log = logging.getLogger('reportek')
@@ -71,6 +74,8 @@ __all__ = [
     'EnvelopeSupportFileViewSet',
     'EnvelopeLinkViewSet',
     'EnvelopeWorkflowViewSet',
+    'QAJobResultViewSet',
+    'ScriptRunJobViewSet',
     'UploadTokenViewSet',
     'UploadHookView',
 ]
@@ -81,9 +86,17 @@ class EnvelopeResultsSetPagination(LimitOffsetPagination):
     max_limit = 100
 
 
+class EnvelopeCursorPagination(KeysetPagination):
+    # Backed by the envelope listing index, see `Envelope.Meta`
+    ordering = ('reporter_id', '-updated_at', '-id')
+    default_limit = 20
+    max_limit = 100
+
+
 class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
     serializer_class = EnvelopeSerializer
     pagination_class = EnvelopeResultsSetPagination
+    cursor_pagination_class = EnvelopeCursorPagination
 
     permission_classes_map = {
         'default': [permissions.EnvelopePermissions],
@@ -91,18 +104,31 @@ class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
         'retrieve': [IsAuthenticatedOrReadOnly]
     }
 
+    @property
+    def paginator(self):
+        """
+        Limit/offset pagination by default, keyset pagination on `pagination=cursor`.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def get_queryset(self):
+        envelopes = Envelope.objects.for_listing()
         if self.request.user.is_anonymous:
-            return Envelope.objects.filter(finalized=True).prefetch_related('files')
+            return envelopes.filter(finalized=True)
         elif self.request.user.has_perm('core.act_as_reportnet_api'):
-            return Envelope.objects.all().prefetch_related('files')
+            return envelopes
 
         reporters = self.request.user.get_reporters()
         obligations = self.request.user.get_obligations()
 
-        return Envelope.objects.filter(
+        return envelopes.filter(
             Q(finalized=True) | Q(reporter__in=reporters, obligation_spec__obligation__in=obligations)
-        ).prefetch_related('files')
+        )
 
     @detail_route(methods=['post'])
     def transition(self, request, pk):
@@ -168,12 +194,14 @@ class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
             - `country`: an ISO country code (multiple occurences allowed)
             - `obligation`: an obligation id (multiple occurences allowed)
             - `finalized`: 0/1 flag indicating envelope finalization status
+        For deep traversals, use `pagination=cursor` and follow the `next` links
+        (add `count=estimate` for an approximate total).
         """
         reporters = request.query_params.getlist('reporter')
         obligations = request.query_params.getlist('obligation')
         finalized = request.query_params.get('finalized')
 
-        envelopes = Envelope.objects.prefetch_related('files')
+        envelopes = Envelope.objects.for_listing()
 
         if reporters:
             reporters = Reporter.objects.filter(abbr__in=reporters).all()
@@ -188,7 +216,7 @@ class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
                     pass
 
             obligations = Obligation.objects.filter(pk__in=obligation_ids).all()
-            envelopes = envelopes.filter(obligation__in=obligations)
+            envelopes = envelopes.filter(obligation_spec__obligation__in=obligations)
 
         if finalized is not None:
             try:
@@ -198,8 +226,9 @@ class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
                 pass
 
         envelopes = envelopes.order_by(
-            'reporter',
-            '-updated_at'
+            'reporter_id',
+            '-updated_at',
+            '-id'
         )
 
         page = self.paginate_queryset(envelopes)
@@ -226,9 +255,10 @@ class EnvelopeViewSet(MappedPermissionsMixin, viewsets.ModelViewSet):
     def feedback(self, request, pk):
         """
         Returns a paginated list of completed QA jobs for the envelope's files.
+        Result bodies are not included, see ``QAJobResultViewSet.body``.
         """
         envelope = self.get_object()
-        qa_jobs = QAJob.objects.filter(completed=True, envelope_file__envelope=envelope)
+        qa_jobs = QAJob.objects.filter(completed=True, envelope_file__envelope=envelope).with_results()
 
         page = self.paginate_queryset(qa_jobs)
         if page is not None:
@@ -409,6 +439,20 @@ class EnvelopeFileViewSet(MappedPermissionsMixin, EnvelopeFileMixin, viewsets.Mo
     _serializer = EnvelopeFileSerializer
     _create_serializer = CreateEnvelopeFileSerializer
 
+    def perform_create(self, serializer):
+        upload = serializer.validated_data.get('file')
+        xml_schema = None
+        if upload is not None and upload.name.split('.')[-1].lower() == 'xml':
+            # only the root element is read, then rewind for storage
+            xml_schema = get_xsd_uri(upload)
+            upload.seek(0)
+
+        serializer.save(
+            envelope_id=self.kwargs['envelope_pk'],
+            uploader_id=self.request.user.pk,
+            xml_schema=xml_schema,
+        )
+
     @staticmethod
     def get_ids_or_404(queryset, ids):
         """
@@ -470,6 +514,8 @@ class EnvelopeFileViewSet(MappedPermissionsMixin, EnvelopeFileMixin, viewsets.Mo
     def download_archive(self, request, envelope_pk):
         """
         List route for downloading a ZIP archive of envelope files, non-compressed.
+        The archive is streamed while it is generated, with a known ``Content-Length``.
+        Archives of finalized envelopes are cached, and served from the cache once built.
 
         The request can specify the query parameter `ids` as a comma separated list
         of envelope IDs, which must all match files on the envelope.
@@ -484,30 +530,62 @@ class EnvelopeFileViewSet(MappedPermissionsMixin, EnvelopeFileMixin, viewsets.Mo
             files = qs.filter(id__in=ids)
         envelope = Envelope.objects.get(pk=envelope_pk)
         archive_name = f'{slugify(envelope.name)}_files_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip'
-        archive_path = settings.DOWNLOAD_STAGING_ROOT / archive_name
-        with ZipFile(archive_path, 'w') as archive:
-            for f in files:
-                f_path = settings.PROTECTED_ROOT / f.file.name
-                if f_path is None or f_path == '':
-                    error(f'Envelope file not found: {f_path}')
-                    return Response(status=status.HTTP_404_NOT_FOUND)
-                archive.write(f_path, f_path.name)
-
-            if settings.DEBUG:
-                response = static.serve(
-                    request,
-                    path=archive_name,
-                    document_root=settings.DOWNLOAD_STAGING_ROOT)
-            else:
-                response = Response(
-                    headers={
-                        'X-Accel-Redirect': f'{settings.DOWNLOAD_STAGING_URL}{archive_name}'
-                    }
-                )
-                # TODO : Cleanup job for generated ZIPs (e.g. delete older than 1 day)
+        files = list(files)
+
+        # Finalized envelopes can't change, so their archives are cached
+        cache = ArchiveCache() if envelope.finalized else None
+        if cache is not None:
+            cache_key = cache.get_key(envelope.pk, files)
+            if cache.get(cache_key) is not None:
+                if settings.DEBUG:
+                    response = static.serve(
+                        request,
+                        path=cache.get_name(cache_key),
+                        document_root=str(cache.root))
+                else:
+                    response = Response(
+                        headers={
+                            'X-Accel-Redirect': cache.get_url(cache_key)
+                        }
+                    )
+                response['Content-Disposition'] = f'attachment; filename={archive_name}'
+                return response
 
-            response['Content-Disposition'] = f'attachment; filename={archive_name}'
-            return response
+        try:
+            entries = get_envelope_files_entries(files)
+        except FileNotFoundError as err:
+            error(f'Envelope file not found: {err.filename}')
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if cache is not None and cache.acquire_build_lock(cache_key):
+            cache_envelope_archive.delay(envelope.pk, [f.pk for f in files])
+
+        # The archive is generated while being sent, so the same response
+        # is used with or without nginx in front.
+        archive = ZipStream(entries)
+        response = StreamingHttpResponse(
+            iter(()) if request.method == 'HEAD' else archive,
+            content_type='application/zip'
+        )
+        response['Content-Length'] = len(archive)
+        response['Content-Disposition'] = f'attachment; filename={archive_name}'
+        # Don't let nginx buffer the archive to disk
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def get_script_listing(self, kind):
+        """
+        Returns the cached listing of ``kind`` for the file's schema(s),
+        see ``reportek.core.script_listings``.
+        """
+        envelope_file = self.get_object()
+        uri = envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
+
+        scripts = []
+        if envelope_file.xml_schema is not None:
+            for schema in envelope_file.xml_schema.split(' '):
+                scripts += script_listings.get_listing(kind, uri, schema)
+        return scripts
 
     @detail_route(methods=['get'])
     def qa_scripts(self, request, envelope_pk, pk):
@@ -519,43 +597,63 @@ class EnvelopeFileViewSet(MappedPermissionsMixin, EnvelopeFileMixin, viewsets.Mo
             `last_updated`
             `max_size`
         """
-        envelope_file = self.get_object()
-        remote_qa = RemoteQA(
-            envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
-        )
+        return Response(self.get_script_listing('qa_scripts'))
 
-        scripts = []
-        if envelope_file.xml_schema is not None:
-            for schema in envelope_file.xml_schema.split(' '):
-                scripts += remote_qa.get_scripts(schema)
+    def queue_script_run(self, request, kind, script_id):
+        """
+        Records a ``ScriptRunJob`` for the file, processed by the
+        ``run_script_job`` task.
+        """
+        if not script_id:
+            return Response(
+                {'error': 'missing script id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        return Response(scripts)
+        job = ScriptRunJob(
+            envelope_file=self.get_object(),
+            requested_by=request.user,
+            kind=kind.value,
+            script_id=str(script_id),
+        )
+        with transaction.atomic():
+            job.save()
+            # Conversions of unchanged files are served from the cache right away
+            if script_runs.use_cached_conversion(job):
+                job.status = ScriptRunJob.STATUSES.COMPLETED.value
+                job.save()
+                return Response({'job_id': job.pk, 'status': job.status})
+            transaction.on_commit(lambda: run_script_job.delay(job.pk))
+
+        info(f'SCRIPT RUN queued job {job.pk}: {job}')
+        return Response({'job_id': job.pk, 'status': job.status}, status=status.HTTP_202_ACCEPTED)
 
     @detail_route(methods=['post'])
     def run_qa_script(self, request, envelope_pk, pk):
         """
-        Runs the QA script with id POST-ed as ``script_id`` against the
-        XML file, and returns the result as dict with the keys:
-            `content-type`
-            `result`
-            `feedback_status`
-            `feedback_message`
+        Queues a run of the QA script with id POST-ed as ``script_id`` against
+        the XML file. The run is processed asynchronously, and its outcome is
+        announced on the envelope's WebSocket channel. The result can then be
+        downloaded from the file's ``script-runs`` route.
+
+        Returns::
+
+            {
+              'job_id': <script run job id>,
+              'status': 'PENDING'
+            }
+
         """
-        script_id = request.data.get('script_id')
-        envelope_file = self.get_object()
-        remote_qa = RemoteQA(
-            envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
-        )
-        file_url = envelope_file.fq_download_url
-        return Response(remote_qa.run_script(file_url, str(script_id)))
+        return self.queue_script_run(request, ScriptRunJob.KINDS.QA, request.data.get('script_id'))
 
     @detail_route(methods=['get'])
     def feedback(self, request, envelope_pk, pk):
         """
         Returns the QA feedback, if any, for the envelope file.
+        Result bodies are not included, see ``QAJobResultViewSet.body``.
         """
         envelope_file = self.get_object()
-        qa_jobs = QAJob.objects.filter(completed=True, envelope_file=envelope_file)
+        qa_jobs = QAJob.objects.filter(completed=True, envelope_file=envelope_file).with_results()
         serializer = QAJobSerializer(qa_jobs, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -571,42 +669,27 @@ class EnvelopeFileViewSet(MappedPermissionsMixin, EnvelopeFileMixin, viewsets.Mo
             `xsl'
             `convert_id`
         """
-        envelope_file = self.get_object()
-        remote_conversion = RemoteConversion(
-            envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
-        )
-
-        scripts = []
-        if envelope_file.xml_schema is not None:
-            for schema in envelope_file.xml_schema.split(' '):
-                scripts += remote_conversion.get_conversions(schema)
-
-        return Response(scripts)
+        return Response(self.get_script_listing('conversions'))
 
     @detail_route(methods=['post'])
     def run_conversion_script(self, request, envelope_pk, pk):
         """
-        Runs the conversion script with id POST-ed as ``convert_id`` against the
-        XML file, and returns the result as dict with the keys:
-            `content`
-            `content-type`
-            `filename`
-        """
-        script_id = request.data.get('convert_id')
-        envelope_file = self.get_object()
-        remote_conversion = RemoteConversion(
-            envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
-        )
-        file_url = envelope_file.fq_download_url
-        conversion_result = remote_conversion.convert_xml(file_url, str(script_id))
+        Queues a run of the conversion script with id POST-ed as ``convert_id``
+        against the XML file. The run is processed asynchronously, and its outcome
+        is announced on the envelope's WebSocket channel. The converted file can
+        then be downloaded from the file's ``script-runs`` route.
+        Results are cached by file checksum and conversion id: on a cache hit,
+        the job is completed right away, with no announcement.
 
-        response = HttpResponse()
-        # force browser to download file
-        response['Content-Disposition'] = f'attachment; filename={conversion_result["filename"]}'
-        response['Content-Type'] = conversion_result["content-type"]
-        response.write(conversion_result["content"].data)
+        Returns::
 
-        return response
+            {
+              'job_id': <script run job id>,
+              'status': 'PENDING' or 'COMPLETED'
+            }
+
+        """
+        return self.queue_script_run(request, ScriptRunJob.KINDS.CONVERSION, request.data.get('convert_id'))
 
     @detail_route(methods=['get'], renderer_classes=(TemplateHTMLRenderer,))
     def xml(self, request, envelope_pk, pk):
@@ -649,6 +732,98 @@ class EnvelopeWorkflowViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated, )
 
 
+class QAJobResultViewSet(mixins.ListModelMixin,
+                         mixins.RetrieveModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    QA job results of an envelope file, without their bodies.
+    """
+    serializer_class = QAJobResultSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return QAJobResult.objects.filter(
+            job__envelope_file_id=self.kwargs['file_pk'],
+            job__envelope_file__envelope_id=self.kwargs['envelope_pk']
+        ).defer('value')
+
+    @detail_route(methods=['get'], renderer_classes=(StaticHTMLRenderer,))
+    def body(self, request, envelope_pk, file_pk, pk):
+        """
+        Streams the result body (e.g. an HTML report), decompressed on the fly.
+        """
+        result = self.get_object()
+        # The compressed bytes, as stored
+        data = QAJobResult.objects.filter(pk=result.pk).annotate(
+            compressed=Cast('value', BinaryField())
+        ).values_list('compressed', flat=True).get()
+        if data is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return StreamingHttpResponse(
+            iter_decompressed(data),
+            content_type=f'{result.metatype or "text/plain"}; charset=utf-8'
+        )
+
+
+class ScriptRunJobViewSet(MappedPermissionsMixin,
+                          mixins.ListModelMixin,
+                          mixins.RetrieveModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    QA scripts and conversions run on demand against an envelope file.
+    """
+    serializer_class = ScriptRunJobSerializer
+
+    permission_classes_map = {
+        'default': [permissions.IsAuthenticated, permissions.EnvelopeFilePermissions],
+    }
+
+    def get_queryset(self):
+        jobs = ScriptRunJob.objects.filter(
+            envelope_file_id=self.kwargs['file_pk'],
+            envelope_file__envelope_id=self.kwargs['envelope_pk']
+        )
+        user = self.request.user
+        if user.is_superuser or user.has_perm('core.act_as_reportnet_api'):
+            return jobs
+
+        reporters = user.get_reporters()
+        obligations = user.get_obligations()
+        # Same envelopes as `EnvelopeViewSet`, without the restricted
+        # files of other reporters' final envelopes
+        return jobs.filter(
+            Q(envelope_file__envelope__reporter__in=reporters,
+              envelope_file__envelope__obligation_spec__obligation__in=obligations) |
+            Q(envelope_file__envelope__finalized=True, envelope_file__restricted=False)
+        )
+
+    @detail_route(methods=['get', 'head'], renderer_classes=(StaticHTMLRenderer,))
+    def download(self, request, envelope_pk, file_pk, pk):
+        """
+        Downloads the result of a completed run.
+        """
+        job = self.get_object()
+        if job.status != ScriptRunJob.STATUSES.COMPLETED.value or not job.result_path.is_file():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if settings.DEBUG:
+            response = static.serve(
+                request,
+                path=job.result_name,
+                document_root=str(settings.SCRIPT_RUNS_ROOT))
+        else:
+            response = Response(
+                headers={
+                    'X-Accel-Redirect': job.result_url
+                }
+            )
+
+        response['Content-Type'] = job.content_type
+        response['Content-Disposition'] = f'attachment; filename={job.filename}'
+        return response
+
+
 class UploadTokenViewSet(viewsets.ModelViewSet):
     queryset = UploadToken.objects.all()
     serializer_class = NestedUploadTokenSerializer
@@ -813,13 +988,18 @@ class UploadHookView(viewsets.ViewSet):
     def handle_post_finish(request):
         """
         Handles a post-finish notification from `tusd`.
-        The uploaded file is used to create an EnvelopeFile, or replace its
-        underlying file on disk if one with the same name exists.
 
-        Archives (only ZIPs currently) are extracted *without* directory structure.
-        If setting ``ARCHIVE_PATH_PREFIX`` is ``True`` (default), the files are saved with
-        a prefix of '_'-separated path components, i.e. 'dir1/dir2/file.xml' becomes
-        'dir1_dir2_file.xml'.
+        Validates the upload token and records an ``UploadIngestionJob``,
+        which is processed asynchronously by the ``ingest_upload`` task
+        (see ``reportek.core.ingestion``). Ingestion progress is announced
+        on the envelope's WebSocket channel.
+
+        Returns::
+
+            {
+              'job_id': <ingestion job id>
+            }
+
         """
 
         info(f'UPLOAD post-finish: {request.data}')
@@ -827,168 +1007,48 @@ class UploadHookView(viewsets.ViewSet):
         tok = meta_data.get('token', '')
         # filename presence was enforced during pre-create
         file_name = meta_data['filename']
-        file_ext = file_name.split('.')[-1].lower()
         is_support_file = meta_data.get('is_support_file', False)
         try:
             token = UploadToken.objects.get(token=tok)
-            # TODO Validate user access to envelope when roles are in place
-            if not token.user.is_authenticated():
-                error(f'UPLOAD denied on envelope "{token.envelope}" '
-                      f'for "{token.user}": NOT ALLOWED')
-                return Response(
-                    {'error': 'user not authenticated'},
-                    status=status.HTTP_403_FORBIDDEN
-                )
-
-            upload_id = request.data.get('ID')
-
-            file_path = os.path.join(
-                settings.TUSD_UPLOADS_DIR,
-                f'{upload_id}.bin'
+        except UploadToken.DoesNotExist:
+            error('UPLOAD denied: INVALID TOKEN')
+            return Response(
+                {'error': 'invalid token'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-            file_info_path = os.path.join(
-                settings.TUSD_UPLOADS_DIR,
-                f'{upload_id}.info'
+        # TODO Validate user access to envelope when roles are in place
+        if not token.user.is_authenticated():
+            error(f'UPLOAD denied on envelope "{token.envelope}" '
+                  f'for "{token.user}": NOT ALLOWED')
+            return Response(
+                {'error': 'user not authenticated'},
+                status=status.HTTP_403_FORBIDDEN
             )
 
-            file_path = Path(file_path).resolve()
-            file_info_path = Path(file_info_path).resolve()
-
-            for f in (file_path, file_info_path):
-                if not f.is_file():
-                    raise FileNotFoundError(f'UPLOAD tusd file not found: {f}')
-
-            info(f'file extension: {file_ext}')
-            info(f'allowed extensions: {settings.ALLOWED_UPLOADS_EXTENSIONS}')
-
-            # Support files
-            if is_support_file:
-                support_file, is_new = EnvelopeSupportFile.get_or_create(
-                    token.envelope,
-                    file_name
-                )
-                if not is_new:
-                    token.envelope.delete_disk_file(file_name)
-
-                support_file.file.save(file_name, File(file_path.open(mode='rb')))
-                support_file.uploader = token.user
-                support_file.save()
-
-            # Regular files
-            elif file_ext in settings.ALLOWED_UPLOADS_EXTENSIONS:
-                envelope_file, is_new = EnvelopeFile.get_or_create(
-                    token.envelope,
-                    file_name
-                )
-                if not is_new:
-                    token.envelope.delete_disk_file(file_name)
-
-                envelope_file.file.save(file_name, File(file_path.open(mode='rb')))
-                if file_ext == 'xml':
-                    envelope_file.xml_schema = envelope_file.extract_xml_schema()
-
-                envelope_file.uploader = token.user
-                envelope_file.save()
-
-            # Spreadsheet files that will generate XML on the envelopes
-            elif file_ext in settings.ALLOWED_UPLOADS_ORIGINAL_EXTENSIONS:
-                envelope_original_file, is_new = EnvelopeOriginalFile.get_or_create(
-                    token.envelope,
-                    file_name
-                )
-
-                # Save the original envelope file
-                envelope_original_file.file.save(file_name, File(file_path.open(mode='rb')))
-                envelope_original_file.uploader = token.user
-                envelope_original_file.save()
+        job = UploadIngestionJob(
+            envelope=token.envelope,
+            uploader=token.user,
+            filename=file_name,
+            tus_id=request.data.get('ID'),
+            is_support_file=bool(is_support_file),
+        )
 
-                # Try to convert to xml file(s)
-                file_url = envelope_original_file.fq_download_url
-                remote_conversion = RemoteConversion(
-                    token.envelope.obligation_spec.qa_xmlrpc_uri
+        for f in (job.upload_path, job.upload_info_path):
+            if not f.is_file():
+                error(f'UPLOAD tusd file not found: {f}')
+                return Response(
+                    {'error': 'file not found'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                result = remote_conversion.convert_spreadsheet_to_xml(file_url)
-
-                if result['resultCode'] != '0':
-                    # This also deletes the actual disk file
-                    envelope_original_file.delete()
-                    # TODO: also inform the user
-
-                # Now save every XML file resulted from the original's conversion
-                for converted_file in result['convertedFiles']:
-                    # TODO: factor this out in a func/method
-                    envelope_file, is_new = EnvelopeFile.get_or_create(
-                        token.envelope,
-                        converted_file['fileName']
-                    )
-                    if not is_new:
-                        token.envelope.delete_disk_file(converted_file['fileName'])
-                    envelope_file.file.save(envelope_file.name, ContentFile(converted_file['content'].data))
-
-                    file_ext = envelope_file.name.split('.')[-1].lower()
-                    if file_ext == 'xml':
-                        envelope_file.xml_schema = envelope_file.extract_xml_schema()
 
-                    envelope_file.uploader = token.user
-                    envelope_file.original_file = envelope_original_file
-                    envelope_file.save()
-
-            # Archives, currently zip only
-            elif file_ext == 'zip':
-                try:
-                    with ZipFile(file_path) as up_zip:
-                        for zip_member in up_zip.namelist():
-                            member_info = up_zip.getinfo(zip_member)
-                            # Skip directories and files with non-allowed extensions
-                            if member_info.is_dir() or not EnvelopeFile.has_valid_extension(member_info.filename):
-                                continue
-                            if not settings.ARCHIVE_PATH_PREFIX:
-                                member_name = os.path.basename(zip_member)
-                            else:
-                                member_name = '_'.join([p.replace(' ', '') for p in path_parts(zip_member)])
-                            member_ext = member_name.split('.')[-1].lower()
-                            envelope_file, is_new = EnvelopeFile.get_or_create(
-                                token.envelope,
-                                member_name
-                            )
-                            if not is_new:
-                                token.envelope.delete_disk_file(member_name)
-
-                            with up_zip.open(zip_member) as member_file:
-                                envelope_file.file.save(member_name, member_file)
-                                if member_ext == 'xml':
-                                    envelope_file.xml_schema = envelope_file.extract_xml_schema()
-
-                                envelope_file.uploader = token.user
-                                envelope_file.save()
-
-                except BadZipFile:
-                    error(f'UPLOAD Bad ZIP file: "{file_path}"')
-                    return Response(
-                        {'error': 'bad zip file'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            # Finally, remove the token and the tusd files pair
+        with transaction.atomic():
+            job.save()
             token.delete()
-            file_path.unlink()
-            file_info_path.unlink()
+            transaction.on_commit(lambda: ingest_upload.delay(job.pk))
 
-        except UploadToken.DoesNotExist:
-            error(f'UPLOAD denied on envelope "{token.envelope}" '
-                  f'for "{token.user}": INVALID TOKEN')
-            return Response(
-                {'error': 'invalid token'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        except FileNotFoundError as err:
-            error(f'{err}')
-            return Response(
-                {'error': 'file not found'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        return Response()
+        info(f'UPLOAD queued ingestion job {job.pk} on envelope "{job.envelope}"')
+        return Response({'job_id': job.pk})
 
     @staticmethod
     def handle_post_terminate(request):
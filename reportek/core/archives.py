@@ -0,0 +1,331 @@
+"""
+Streaming ZIP archives of envelope files.
+
+Archives are built on the fly from files on disk, as a generator of byte chunks:
+members are stored (no compression), so the total archive length is known before
+the first byte is sent, and memory use is constant regardless of archive size.
+ZIP64 extensions are used for members and archives over the 32-bit limits.
+
+Archives of finalized envelopes never change, so they are cached on disk
+(see ``ArchiveCache``), keyed by their contents.
+"""
+import os
+import time
+import struct
+import zlib
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from reportek.core.disk_cache import DiskCache
+
+
+__all__ = [
+    'ZipEntry',
+    'ZipStream',
+    'ArchiveCache',
+    'get_envelope_files_entries',
+]
+
+log = logging.getLogger('reportek.archives')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+ZipEntry = namedtuple('ZipEntry', ['name', 'path', 'size', 'modified'])
+ZipEntry.__doc__ = """
+A member of a ``ZipStream``: archive name, path on disk, size in bytes
+and modification time (``datetime``).
+"""
+
+# Same limits as the standard library's zipfile module
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_FILECOUNT_LIMIT = (1 << 16) - 1
+
+CHUNK_SIZE = 64 * 1024
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+CREATE_SYSTEM_UNIX = 3
+EXTERNAL_ATTR = (0o100644 & 0xFFFF) << 16
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+LOCAL_HEADER_SIG = b'PK\003\004'
+DATA_DESCRIPTOR = struct.Struct('<4sLLL')
+DATA_DESCRIPTOR64 = struct.Struct('<4sLQQ')
+DATA_DESCRIPTOR_SIG = b'PK\007\010'
+CENTRAL_DIR = struct.Struct('<4s4B4HL2L5H2L')
+CENTRAL_DIR_SIG = b'PK\001\002'
+END_ARCHIVE = struct.Struct('<4s4H2LH')
+END_ARCHIVE_SIG = b'PK\005\006'
+END_ARCHIVE64 = struct.Struct('<4sQ2H2L4Q')
+END_ARCHIVE64_SIG = b'PK\006\006'
+END_ARCHIVE64_LOCATOR = struct.Struct('<4sLQL')
+END_ARCHIVE64_LOCATOR_SIG = b'PK\006\007'
+ZIP64_EXTRA_ID = 0x0001
+
+
+def dos_date_time(dt):
+    """Packs a ``datetime`` into DOS date & time fields."""
+    if dt.year < 1980:
+        dt = datetime(1980, 1, 1)
+    date = (dt.year - 1980) << 9 | dt.month << 5 | dt.day
+    time = dt.hour << 11 | dt.minute << 5 | (dt.second // 2)
+    return date, time
+
+
+class _Member:
+    """Layout of a single archive member, computed before streaming."""
+
+    def __init__(self, entry, offset):
+        self.entry = entry
+        self.offset = offset
+        self.encoded_name = entry.name.encode('utf-8')
+        self.flags = FLAG_DATA_DESCRIPTOR
+        try:
+            entry.name.encode('ascii')
+        except UnicodeEncodeError:
+            self.flags |= FLAG_UTF8
+        self.zip64 = entry.size > ZIP64_LIMIT
+        self.version = VERSION_ZIP64 if self.zip64 or offset > ZIP64_LIMIT else VERSION_DEFAULT
+        self.date, self.time = dos_date_time(entry.modified)
+        self.crc = 0
+
+    @property
+    def local_extra(self):
+        if self.zip64:
+            # sizes are in the data descriptor
+            return struct.pack('<HHQQ', ZIP64_EXTRA_ID, 16, 0, 0)
+        return b''
+
+    @property
+    def descriptor_size(self):
+        return (DATA_DESCRIPTOR64 if self.zip64 else DATA_DESCRIPTOR).size
+
+    @property
+    def local_size(self):
+        """Length of the local header, data and data descriptor."""
+        return (LOCAL_HEADER.size + len(self.encoded_name) + len(self.local_extra) +
+                self.entry.size + self.descriptor_size)
+
+    def local_header(self):
+        size = 0xFFFFFFFF if self.zip64 else 0
+        return LOCAL_HEADER.pack(
+            LOCAL_HEADER_SIG, self.version, 0, self.flags, 0,
+            self.time, self.date, 0, size, size,
+            len(self.encoded_name), len(self.local_extra)
+        ) + self.encoded_name + self.local_extra
+
+    def data_descriptor(self):
+        descriptor = DATA_DESCRIPTOR64 if self.zip64 else DATA_DESCRIPTOR
+        return descriptor.pack(DATA_DESCRIPTOR_SIG, self.crc, self.entry.size, self.entry.size)
+
+    @property
+    def central_extra(self):
+        fields = []
+        if self.zip64:
+            fields += [self.entry.size, self.entry.size]
+        if self.offset > ZIP64_LIMIT:
+            fields.append(self.offset)
+        if not fields:
+            return b''
+        return struct.pack(f'<HH{len(fields)}Q', ZIP64_EXTRA_ID, 8 * len(fields), *fields)
+
+    @property
+    def central_size(self):
+        return CENTRAL_DIR.size + len(self.encoded_name) + len(self.central_extra)
+
+    def central_header(self):
+        size = 0xFFFFFFFF if self.zip64 else self.entry.size
+        offset = 0xFFFFFFFF if self.offset > ZIP64_LIMIT else self.offset
+        extra = self.central_extra
+        return CENTRAL_DIR.pack(
+            CENTRAL_DIR_SIG, self.version, CREATE_SYSTEM_UNIX, self.version, 0,
+            self.flags, 0, self.time, self.date, self.crc, size, size,
+            len(self.encoded_name), len(extra), 0, 0, 0, EXTERNAL_ATTR, offset
+        ) + self.encoded_name + extra
+
+
+class ZipStream:
+    """
+    Iterable, uncompressed ZIP archive of ``ZipEntry`` members.
+
+    ``len()`` gives the exact archive length in bytes, without reading any file.
+    Iterating streams the archive in chunks; member files must not change
+    between building the stream and iterating it.
+    """
+
+    def __init__(self, entries, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.members = []
+        offset = 0
+        for entry in entries:
+            member = _Member(entry, offset)
+            self.members.append(member)
+            offset += member.local_size
+
+        self.central_dir_offset = offset
+        self.central_dir_size = sum(m.central_size for m in self.members)
+        self.zip64 = (
+            len(self.members) > ZIP_FILECOUNT_LIMIT or
+            self.central_dir_offset > ZIP64_LIMIT or
+            self.central_dir_size > ZIP64_LIMIT
+        )
+
+    @classmethod
+    def from_paths(cls, paths, **kwargs):
+        """Builds a stream of files on disk, named after their base names."""
+        entries = []
+        for path in paths:
+            stat = os.stat(path)
+            entries.append(ZipEntry(
+                name=os.path.basename(path),
+                path=path,
+                size=stat.st_size,
+                modified=datetime.fromtimestamp(stat.st_mtime)
+            ))
+        return cls(entries, **kwargs)
+
+    def __len__(self):
+        end_size = END_ARCHIVE.size
+        if self.zip64:
+            end_size += END_ARCHIVE64.size + END_ARCHIVE64_LOCATOR.size
+        return self.central_dir_offset + self.central_dir_size + end_size
+
+    def __iter__(self):
+        for member in self.members:
+            yield member.local_header()
+            yield from self._member_data(member)
+            yield member.data_descriptor()
+
+        yield b''.join(m.central_header() for m in self.members)
+        yield self._end_records()
+
+    def _member_data(self, member):
+        crc = 0
+        remaining = member.entry.size
+        with open(member.entry.path, 'rb') as f:
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f'File shrunk while archiving: {member.entry.path}')
+                crc = zlib.crc32(chunk, crc)
+                remaining -= len(chunk)
+                yield chunk
+        member.crc = crc
+
+    def _end_records(self):
+        count = len(self.members)
+        records = b''
+        if self.zip64:
+            zip64_end_offset = self.central_dir_offset + self.central_dir_size
+            records += END_ARCHIVE64.pack(
+                END_ARCHIVE64_SIG, END_ARCHIVE64.size - 12, VERSION_ZIP64, VERSION_ZIP64,
+                0, 0, count, count, self.central_dir_size, self.central_dir_offset
+            )
+            records += END_ARCHIVE64_LOCATOR.pack(
+                END_ARCHIVE64_LOCATOR_SIG, 0, zip64_end_offset, 1
+            )
+        records += END_ARCHIVE.pack(
+            END_ARCHIVE_SIG, 0, 0,
+            min(count, 0xFFFF), min(count, 0xFFFF),
+            min(self.central_dir_size, 0xFFFFFFFF),
+            min(self.central_dir_offset, 0xFFFFFFFF),
+            0
+        )
+        return records
+
+
+def get_envelope_files_entries(files):
+    """
+    Builds the ``ZipEntry`` list for envelope files, ordered by name.
+    Raises ``FileNotFoundError`` if any file is missing from disk.
+    """
+    entries = []
+    for f in sorted(files, key=lambda f: f.name):
+        f_path = Path(settings.PROTECTED_ROOT) / f.file.name
+        entries.append(ZipEntry(
+            name=f_path.name,
+            path=str(f_path),
+            size=f_path.stat().st_size,
+            modified=timezone.localtime(f.updated)
+        ))
+    return entries
+
+
+class ArchiveCache(DiskCache):
+    """
+    On-disk cache of envelope archives.
+
+    Archives are keyed by the envelope id and the ids and update timestamps
+    of the archived files, so a key always designates the same content.
+    The cache is capped at ``ARCHIVE_CACHE_MAX_SIZE`` bytes, with least recently
+    used archives evicted first by ``sweep()``.
+    """
+
+    SUFFIX = '.zip'
+    # An archive is built by a single task at a time, for at most this long
+    BUILD_LOCK_TIMEOUT = 60 * 60
+
+    def __init__(self, root=None, url=None, max_size=None):
+        super().__init__(
+            root or settings.ARCHIVE_CACHE_ROOT,
+            url or settings.ARCHIVE_CACHE_URL,
+            max_size if max_size is not None else settings.ARCHIVE_CACHE_MAX_SIZE
+        )
+
+    @staticmethod
+    def get_key(envelope_id, files):
+        digest = hashlib.sha256(f'envelope:{envelope_id}'.encode())
+        for f in sorted(files, key=lambda f: f.pk):
+            digest.update(f'|{f.pk}:{f.updated.isoformat()}'.encode())
+        return digest.hexdigest()
+
+    def get_build_lock_path(self, key):
+        return self.root / f'.{self.get_name(key)}.lock'
+
+    def acquire_build_lock(self, key):
+        """
+        Returns whether the archive under ``key`` can be built - i.e. no other
+        build of it is already queued or running. The lock is a file next to
+        the archive, so it is shared by the web and worker processes.
+        Locks older than ``BUILD_LOCK_TIMEOUT`` are left by lost builds,
+        and are taken over.
+        """
+        path = self.get_build_lock_path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.BUILD_LOCK_TIMEOUT:
+                self.remove(path)
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(str(self.root), exist_ok=True)
+        try:
+            os.close(os.open(str(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return False
+        return True
+
+    def release_build_lock(self, key):
+        self.remove(self.get_build_lock_path(key))
+
+    def put(self, key, archive):
+        """
+        Writes the ``ZipStream`` archive to the cache.
+        The archive only becomes visible once completely written.
+        """
+        exists = self.get_path(key).exists()
+        path = super().put(key, archive)
+        if not exists:
+            info(f'Cached archive {path.name} ({len(archive)} bytes)')
+        return path
@@ -20,6 +20,14 @@ class EnvelopeEvents(Enum):
     RECEIVED_AUTO_QA_FEEDBACK = auto()
     COMPLETED_AUTO_QA = auto()
 
+    STARTED_INGESTION = auto()
+    INGESTED_FILE = auto()
+    COMPLETED_INGESTION = auto()
+    FAILED_INGESTION = auto()
+
+    COMPLETED_SCRIPT_RUN = auto()
+    FAILED_SCRIPT_RUN = auto()
+
 
 class EnvelopeWSConsumer(BaseWSConsumer):
     """Channels consumer for envelope notifications."""
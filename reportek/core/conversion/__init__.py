@@ -3,3 +3,4 @@ This package handles RPC calls with XMLConv
 """
 
 from .xml_rpc import RemoteConversion
+from .cache import ConversionCache
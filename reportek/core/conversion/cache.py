@@ -0,0 +1,75 @@
+import json
+import hashlib
+import logging
+
+from django.conf import settings
+
+from reportek.core.disk_cache import DiskCache
+
+log = logging.getLogger('reportek.conversions')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+class ConversionCache(DiskCache):
+    """
+    On-disk cache of conversion results.
+
+    Results are keyed by the SHA-256 checksum of the converted file and
+    the conversion id, so a key always designates the same content.
+    The content type and file name of each result are kept in a JSON file
+    alongside it. The cache is capped at ``CONVERSION_CACHE_MAX_SIZE`` bytes,
+    with least recently used results evicted first by ``sweep()``.
+    """
+
+    SUFFIX = '.result'
+    META_SUFFIX = '.json'
+
+    def __init__(self, root=None, url=None, max_size=None):
+        super().__init__(
+            root or settings.CONVERSION_CACHE_ROOT,
+            url or settings.CONVERSION_CACHE_URL,
+            max_size if max_size is not None else settings.CONVERSION_CACHE_MAX_SIZE
+        )
+
+    @staticmethod
+    def get_key(sha256, convert_id):
+        return hashlib.sha256(f'{sha256}:{convert_id}'.encode()).hexdigest()
+
+    def get_meta_path(self, key):
+        return self.root / f'{key}{self.META_SUFFIX}'
+
+    def get_meta(self, key):
+        """
+        Returns the cached result's metadata, as a dict with the keys
+        `content-type` and `filename`, or `None` on a cache miss.
+        """
+        if self.get(key) is None:
+            return None
+        try:
+            with self.get_meta_path(key).open() as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key, content, content_type, filename):
+        """
+        Writes a conversion result to the cache.
+        ``content`` is a Django ``File``, e.g. a streamed ``BinaryFile``.
+        """
+        path = self.get_path(key)
+        if path.exists():
+            return path
+
+        # The metadata is in place before the result becomes visible
+        meta = {'content-type': content_type, 'filename': filename}
+        self.write_file(self.get_meta_path(key), [json.dumps(meta).encode()])
+        self.write_file(path, content.chunks())
+        info(f'Cached conversion result {path.name} ({path.stat().st_size} bytes)')
+        return path
+
+    def remove(self, path):
+        super().remove(path)
+        super().remove(path.with_suffix(self.META_SUFFIX))
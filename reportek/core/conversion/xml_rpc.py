@@ -1,6 +1,7 @@
 import xmlrpc.client
 import logging
 
+from reportek.core.rpc import server_proxy
 from reportek.core.utils import log_xmlrpc_errors
 
 log = logging.getLogger('reportek.conversions')
@@ -22,7 +23,7 @@ class RemoteConversion:
         """
         Returns the distinct list of XML Schemas that have conversions available.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ConversionService.getXMLSchemas()
 
     @log_xmlrpc_errors(log)
@@ -30,7 +31,7 @@ class RemoteConversion:
         """
         Returns the list of available conversions for delivered XML file.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             # list of dictionaries; 'convert_id' should be used to call the
             # convert or convertPush methods
             return proxy.ConversionService.listConversions(xml_schema_url)
@@ -46,7 +47,7 @@ class RemoteConversion:
 
         # file parameter value encoded as Base64 byte array
         contents = xmlrpc.client.Binary(contents)
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ConversionService.convertPush(contents, convert_id, result_file_name)
         # To Be Implemented
         # if result:
@@ -54,7 +55,12 @@ class RemoteConversion:
 
     @log_xmlrpc_errors(log)
     def convert_xml(self, xml_url, convert_id):
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        """
+        Converts the XML file at ``xml_url`` into the format of conversion ``convert_id``.
+        Returns {content-type:'text/html;charset=UTF-8', filename:'ResultFile.html', content:<BinaryFile> }
+        The caller should close the returned ``BinaryFile``.
+        """
+        with server_proxy(self.uri, stream_binary=True) as proxy:
             return proxy.ConversionService.convert(xml_url, convert_id)
 
     @log_xmlrpc_errors(log)
@@ -70,12 +76,13 @@ class RemoteConversion:
             {'resultCode': '0',
              'conversionLog': '<div class="feedback"><h2>Conversion log ...',
              'resultDescription': 'Conversion successful.',
-             'convertedFiles': [{'content': <xmlrpc.client.Binary object at 0x0472D770>,
+             'convertedFiles': [{'content': <reportek.core.rpc.BinaryFile>,
                                  'fileName': 'SE_Rivers_Revised_SoE2008.xml'}]
             }
+            The caller should close the returned ``BinaryFile``s.
 
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri, stream_binary=True) as proxy:
             return proxy.ConversionService.convertDD_XML(spreadsheet_url)
 
     @log_xmlrpc_errors(log)
@@ -92,12 +99,13 @@ class RemoteConversion:
             {'resultCode': '0',
              'conversionLog': '<div class="feedback"><h2>Conversion log ...',
              'resultDescription': 'Conversion successful.',
-             'convertedFiles': [{'content': <xmlrpc.client.Binary object at 0x0472D770>, 'fileName': 'Stations.xml'},
-                                {'content': <xmlrpc.client.Binary object at 0x0472D880>, 'fileName': 'Nutrients.xml'}]
+             'convertedFiles': [{'content': <reportek.core.rpc.BinaryFile>, 'fileName': 'Stations.xml'},
+                                {'content': <reportek.core.rpc.BinaryFile>, 'fileName': 'Nutrients.xml'}]
             }
+            The caller should close the returned ``BinaryFile``s.
 
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri, stream_binary=True) as proxy:
             return proxy.ConversionService.convertDD_XML_split(spreadsheet_url, sheet_name)
 
     @log_xmlrpc_errors(log)
@@ -118,7 +126,7 @@ class RemoteConversion:
             In case of error the result array has always 2 elements: status code and status description.
 
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ConversionService.convertExcelToXMLPush(file_contents, file_name)
 
     @log_xmlrpc_errors(log)
@@ -138,7 +146,7 @@ class RemoteConversion:
             In case of error the result array has always 2 elements: status code and status description.
 
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ConversionService.convertExcelToXML(file_url)
 
     @log_xmlrpc_errors(log)
@@ -151,5 +159,5 @@ class RemoteConversion:
             and list item elements are called “element”.
             Other element names are inherited from JSON parameter names.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ConversionService.convertJson2Xml(file_url)
@@ -0,0 +1,116 @@
+"""
+Size-capped on-disk caches of files served through nginx.
+"""
+import os
+import logging
+import tempfile
+from pathlib import Path
+
+
+__all__ = [
+    'DiskCache',
+]
+
+log = logging.getLogger('reportek.disk_cache')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+class DiskCache:
+    """
+    On-disk cache of files named after their keys, under ``root``,
+    and served from ``url``.
+
+    The cache is capped at ``max_size`` bytes, with least recently used files
+    evicted first by ``sweep()`` (file mtimes record usage).
+    """
+
+    SUFFIX = ''
+
+    def __init__(self, root, url, max_size):
+        self.root = Path(root)
+        self.url = url
+        self.max_size = max_size
+
+    def get_name(self, key):
+        return f'{key}{self.SUFFIX}'
+
+    def get_path(self, key):
+        return self.root / self.get_name(key)
+
+    def get_url(self, key):
+        return f'{self.url}{self.get_name(key)}'
+
+    def get(self, key):
+        """
+        Returns the path of the cached file, or `None` on a cache miss.
+        A hit refreshes the file's position in the LRU order.
+        """
+        path = self.get_path(key)
+        try:
+            os.utime(str(path))
+        except FileNotFoundError:
+            return None
+        return path
+
+    @staticmethod
+    def write_file(path, chunks):
+        """
+        Writes the iterable of byte ``chunks`` at ``path``.
+        The file only becomes visible once completely written.
+        """
+        os.makedirs(str(path.parent), exist_ok=True)
+        # Unique, as the same file may be written concurrently
+        fd, tmp_path = tempfile.mkstemp(
+            dir=str(path.parent), prefix=f'.{path.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(tmp_path, str(path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def put(self, key, chunks):
+        """
+        Writes the iterable of byte ``chunks`` to the cache, unless already cached.
+        """
+        path = self.get_path(key)
+        if not path.exists():
+            self.write_file(path, chunks)
+        return path
+
+    def remove(self, path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """
+        Evicts the least recently used files until the cache fits ``max_size``.
+        Returns the number of evicted files.
+        """
+        entries = []
+        for path in self.root.glob(f'*{self.SUFFIX}'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries, key=lambda e: e[0]):
+            if total_size <= self.max_size:
+                break
+            self.remove(path)
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            info(f'Evicted {evicted} file(s) from {self.root}, {total_size} bytes left')
+        return evicted
@@ -0,0 +1,419 @@
+"""
+Ingestion of finished `tusd` uploads into envelopes.
+
+The ``post-finish`` upload hook only records an ``UploadIngestionJob``;
+the actual work (copying files into envelope storage, unpacking archives,
+converting spreadsheets) is done here, from a Celery task.
+Progress is announced on the envelope's WebSocket channel.
+"""
+import os
+import errno
+import logging
+from collections import OrderedDict
+from zipfile import ZipFile, BadZipFile
+
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from reportek.core.consumers.envelope import EnvelopeEvents
+from reportek.core.conversion import RemoteConversion
+from reportek.core.utils import path_parts, copy_and_hash, hash_file
+
+from .models import (
+    EnvelopeFile,
+    EnvelopeOriginalFile,
+    EnvelopeSupportFile,
+    UploadIngestionJob,
+)
+
+log = logging.getLogger('reportek.ingestion')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+# Announce archive extraction progress every this many members
+ZIP_PROGRESS_STEP = 100
+ZIP_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class IngestionError(Exception):
+    pass
+
+
+def announce(envelope, event, payload):
+    """Sends an ingestion event to the envelope's notifications group."""
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        envelope.channel,
+        {
+            'type': f'envelope.{event.name}',
+            'data': payload
+        }
+    )
+
+
+def get_member_name(zip_member):
+    """
+    Builds the envelope file name for an archive member.
+    If setting ``ARCHIVE_PATH_PREFIX`` is ``True`` (default), the name is prefixed with
+    '_'-separated path components, i.e. 'dir1/dir2/file.xml' becomes 'dir1_dir2_file.xml'.
+    """
+    if not settings.ARCHIVE_PATH_PREFIX:
+        return os.path.basename(zip_member)
+    return '_'.join([p.replace(' ', '') for p in path_parts(zip_member)])
+
+
+def ingest_file(src, dst, mode=None):
+    """
+    Places the file at ``src`` at path ``dst``, according to ``mode``
+    (defaults to setting ``UPLOADS_INGEST_MODE``):
+        - ``'move'`` renames the file (``src`` is gone afterwards)
+        - ``'link'`` hard-links the file (``src`` is left in place)
+        - ``'copy'`` always makes a full copy
+
+    Renaming and hard-linking only work within the same filesystem -
+    in any other case the file is copied, in a single streamed pass.
+
+    Returns the size and SHA-256 checksum of the file.
+    """
+    mode = mode or settings.UPLOADS_INGEST_MODE
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+    content_info = None
+    if mode in ('move', 'link'):
+        try:
+            if mode == 'move':
+                os.rename(src, dst)
+            else:
+                os.link(src, dst)
+        except OSError as err:
+            if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            debug(f'INGEST cannot {mode} "{src}" to "{dst}" ({err}), copying instead')
+        else:
+            debug(f'INGEST {mode}d "{src}" to "{dst}"')
+            content_info = hash_file(dst)
+
+    if content_info is None:
+        with open(str(src), 'rb') as src_file, open(dst, 'wb') as dst_file:
+            content_info = copy_and_hash(src_file, dst_file)
+        debug(f'INGEST copied "{src}" to "{dst}"')
+
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(dst, settings.FILE_UPLOAD_PERMISSIONS)
+    return content_info
+
+
+class UploadIngestor:
+    """
+    Processes an ``UploadIngestionJob``:
+        - support files are stored as ``EnvelopeSupportFile``
+        - files with allowed extensions are stored as ``EnvelopeFile``
+        - spreadsheets are stored as ``EnvelopeOriginalFile`` and converted remotely to XML
+        - archives (only ZIPs currently) are extracted *without* directory structure
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.envelope = job.envelope
+        self.file_ids = []
+
+    def file_progress(self, envelope_file):
+        """Records and announces a successfully ingested file."""
+        self.file_ids.append(envelope_file.pk)
+        self.job.files_done += 1
+        self.job.save(update_fields=['files_done', 'updated_at'])
+        announce(self.envelope, EnvelopeEvents.INGESTED_FILE, {
+            'job_id': self.job.pk,
+            'file_id': envelope_file.pk,
+            'file_name': envelope_file.name,
+            'files_done': self.job.files_done,
+            'files_total': self.job.files_total,
+        })
+
+    def set_total(self, files_total):
+        self.job.files_total = files_total
+        self.job.save(update_fields=['files_total', 'updated_at'])
+
+    def prepare(self, model_cls, file_name):
+        """
+        Locates or creates an envelope file of type ``model_cls``.
+        The disk file of an existing one is removed, as it is about to be replaced.
+        """
+        envelope_file, is_new = model_cls.get_or_create(self.envelope, file_name)
+        if not is_new:
+            self.envelope.delete_disk_file(file_name)
+        return envelope_file
+
+    def finish(self, envelope_file, **attrs):
+        """Sets the upload-derived fields and saves the envelope file."""
+        if envelope_file.name.split('.')[-1].lower() == 'xml' and hasattr(envelope_file, 'xml_schema'):
+            envelope_file.xml_schema = envelope_file.extract_xml_schema()
+            envelope_file.validate_xml()
+
+        for attr, value in attrs.items():
+            setattr(envelope_file, attr, value)
+        envelope_file.uploader = self.job.uploader
+        envelope_file.save()
+        return envelope_file
+
+    def store(self, model_cls, file_name, content, **attrs):
+        """
+        Creates or replaces an envelope file of type ``model_cls`` from ``content``.
+        """
+        envelope_file = self.prepare(model_cls, file_name)
+        envelope_file.store_content(file_name, content)
+        return self.finish(envelope_file, **attrs)
+
+    def store_upload(self, model_cls, file_name, upload_path, **attrs):
+        """
+        Creates or replaces an envelope file of type ``model_cls`` by moving
+        the tusd upload into the envelope's storage directory (see ``ingest_file``).
+        """
+        envelope_file = self.prepare(model_cls, file_name)
+        _file = envelope_file.file
+        name = _file.field.generate_filename(envelope_file, file_name)
+        name = _file.storage.get_available_name(name, max_length=_file.field.max_length)
+        envelope_file.set_content_info(*ingest_file(upload_path, _file.storage.path(name)))
+        _file.name = name
+        return self.finish(envelope_file, **attrs)
+
+    def ingest_support_file(self, upload_path):
+        self.set_total(1)
+        support_file = self.store_upload(EnvelopeSupportFile, self.job.filename, upload_path)
+        self.file_progress(support_file)
+
+    def ingest_envelope_file(self, upload_path):
+        self.set_total(1)
+        envelope_file = self.store_upload(EnvelopeFile, self.job.filename, upload_path)
+        self.file_progress(envelope_file)
+
+    def ingest_spreadsheet(self, upload_path):
+        """
+        Saves the original spreadsheet, then every XML file resulted from its conversion.
+        """
+        original_file = self.store_upload(EnvelopeOriginalFile, self.job.filename, upload_path)
+
+        remote_conversion = RemoteConversion(
+            self.envelope.obligation_spec.qa_xmlrpc_uri
+        )
+        result = remote_conversion.convert_spreadsheet_to_xml(original_file.fq_download_url)
+
+        if result is None or result['resultCode'] != '0':
+            # This also deletes the actual disk file
+            original_file.delete()
+            description = 'no response' if result is None else result.get('resultDescription')
+            raise IngestionError(f'spreadsheet conversion failed: {description}')
+
+        converted_files = result['convertedFiles']
+        self.set_total(len(converted_files))
+        try:
+            for converted_file in converted_files:
+                envelope_file = self.store(
+                    EnvelopeFile,
+                    converted_file['fileName'],
+                    converted_file['content'],
+                    original_file=original_file
+                )
+                self.file_progress(envelope_file)
+        finally:
+            # The converted files are spooled to temporary files, removed on close
+            for converted_file in converted_files:
+                converted_file['content'].close()
+
+    def ingest_zip(self, upload_path):
+        """
+        Extracts the archive's members in bulk:
+            - existing envelope files are resolved with one query
+            - member files are streamed to disk, replacing existing files in place
+            - ``EnvelopeFile`` rows are inserted/updated in one transaction
+            - ``added_file``/``changed_file`` notifications are sent once all rows are saved
+        """
+        try:
+            with ZipFile(str(upload_path)) as up_zip:
+                # Skip directories and files with non-allowed extensions.
+                # Members mapping to the same name are replaced by the last one.
+                members = OrderedDict(
+                    (get_member_name(m.filename), m)
+                    for m in up_zip.infolist()
+                    if not m.is_dir() and EnvelopeFile.has_valid_extension(m.filename)
+                )
+                self.set_total(len(members))
+
+                existing = {
+                    f.name: f
+                    for f in EnvelopeFile.objects.filter(
+                        envelope=self.envelope, name__in=list(members)
+                    )
+                }
+                new_files = []
+                changed_files = []
+                for member_name, member_info in members.items():
+                    envelope_file = existing.get(member_name)
+                    if envelope_file is None:
+                        envelope_file = EnvelopeFile(envelope=self.envelope, name=member_name)
+                        _file = envelope_file.file
+                        name = _file.field.generate_filename(envelope_file, member_name)
+                        _file.name = _file.storage.get_available_name(
+                            name, max_length=_file.field.max_length)
+                        new_files.append(envelope_file)
+                    else:
+                        changed_files.append(envelope_file)
+
+                    file_path = envelope_file.file.path
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    with up_zip.open(member_info) as member_file, open(file_path, 'wb') as out:
+                        envelope_file.set_content_info(
+                            *copy_and_hash(member_file, out, ZIP_COPY_BUFFER_SIZE))
+                    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                        os.chmod(file_path, settings.FILE_UPLOAD_PERMISSIONS)
+
+                    if member_name.split('.')[-1].lower() == 'xml':
+                        envelope_file.xml_schema = envelope_file.extract_xml_schema()
+                        envelope_file.validate_xml()
+                    envelope_file.uploader = self.job.uploader
+
+                    self.member_progress(member_name, len(new_files) + len(changed_files))
+
+        except BadZipFile:
+            raise IngestionError(f'bad zip file: "{upload_path}"')
+
+        EnvelopeFile.bulk_save(new_files, changed_files, [
+            'xml_schema', 'xml_validation', 'xml_validation_errors',
+            'uploader', 'size', 'sha256', 'content_modified'
+        ])
+
+        file_ids = [f.pk for f in new_files + changed_files]
+        self.file_ids.extend(file_ids)
+        self.job.files_done = len(file_ids)
+        self.job.save(update_fields=['files_done', 'updated_at'])
+        # Same notifications as for files saved one by one
+        for envelope_file in new_files:
+            announce(self.envelope, EnvelopeEvents.ADDED_FILE, {'file_id': envelope_file.pk})
+        for envelope_file in changed_files:
+            announce(self.envelope, EnvelopeEvents.CHANGED_FILE, {'file_id': envelope_file.pk})
+
+    def member_progress(self, member_name, files_done):
+        """
+        Announces archive extraction progress, every ``ZIP_PROGRESS_STEP`` members.
+        """
+        if files_done % ZIP_PROGRESS_STEP and files_done != self.job.files_total:
+            return
+        announce(self.envelope, EnvelopeEvents.INGESTED_FILE, {
+            'job_id': self.job.pk,
+            'file_name': member_name,
+            'files_done': files_done,
+            'files_total': self.job.files_total,
+        })
+
+    def get_handler(self):
+        file_ext = self.job.filename.split('.')[-1].lower()
+        if self.job.is_support_file:
+            return self.ingest_support_file
+        elif file_ext in settings.ALLOWED_UPLOADS_EXTENSIONS:
+            return self.ingest_envelope_file
+        elif file_ext in settings.ALLOWED_UPLOADS_ORIGINAL_EXTENSIONS:
+            return self.ingest_spreadsheet
+        elif file_ext in settings.ALLOWED_UPLOADS_ARCHIVE_EXTENSIONS:
+            return self.ingest_zip
+        raise IngestionError(f'unsupported file extension: "{file_ext}"')
+
+    def cleanup(self):
+        """
+        Removes what is left of the tusd files pair
+        (the upload itself is gone if it was moved into storage).
+        """
+        for f in (self.job.upload_path, self.job.upload_info_path):
+            try:
+                f.unlink()
+            except FileNotFoundError:
+                debug(f'INGEST tusd file already removed: {f}')
+
+    def is_finished(self):
+        """
+        Whether the job was already processed - the task may be delivered
+        again, after a worker was lost before acknowledging it.
+        """
+        job = self.job
+        if job.status == UploadIngestionJob.STATUSES.COMPLETED.value:
+            return True
+        if job.status == UploadIngestionJob.STATUSES.FAILED.value:
+            # The upload is kept after unexpected errors, for a retry
+            return not job.upload_path.is_file()
+        return (job.status == UploadIngestionJob.STATUSES.RUNNING.value
+                and not job.error
+                and 0 < job.files_total <= job.files_done)
+
+    def run(self):
+        job = self.job
+        if self.is_finished():
+            info(f'INGEST skipped for "{job.filename}" on envelope "{self.envelope}": '
+                 f'job already {job.status.lower()}')
+            if job.status == UploadIngestionJob.STATUSES.RUNNING.value:
+                # Only the status update was lost
+                job.status = UploadIngestionJob.STATUSES.COMPLETED.value
+                job.save(update_fields=['status', 'updated_at'])
+                self.cleanup()
+            return self.file_ids
+
+        job.status = UploadIngestionJob.STATUSES.RUNNING.value
+        job.error = None
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        announce(self.envelope, EnvelopeEvents.STARTED_INGESTION, {
+            'job_id': job.pk,
+            'file_name': job.filename,
+        })
+
+        try:
+            # The envelope may have changed since the upload was queued,
+            # so this is checked before any envelope file is touched.
+            if self.envelope.finalized:
+                raise IngestionError('envelope is final')
+            if not self.envelope.workflow.upload_allowed:
+                raise IngestionError('envelope state does not allow uploads')
+
+            upload_path = job.upload_path
+            for f in (upload_path, job.upload_info_path):
+                if not f.is_file():
+                    raise IngestionError(f'tusd file not found: {f}')
+
+            self.get_handler()(upload_path)
+            self.cleanup()
+
+        except Exception as err:
+            error(f'INGEST failed for "{job.filename}" on envelope "{self.envelope}": {err}')
+            if isinstance(err, IngestionError):
+                # The upload can't be ingested, the user has to upload it again
+                self.cleanup()
+            job.status = UploadIngestionJob.STATUSES.FAILED.value
+            job.error = str(err)[:500]
+            job.save(update_fields=['status', 'error', 'updated_at'])
+            announce(self.envelope, EnvelopeEvents.FAILED_INGESTION, {
+                'job_id': job.pk,
+                'file_name': job.filename,
+                'error': job.error,
+                'file_ids': self.file_ids,
+            })
+            if not isinstance(err, IngestionError):
+                raise
+            return self.file_ids
+
+        job.status = UploadIngestionJob.STATUSES.COMPLETED.value
+        job.save(update_fields=['status', 'updated_at'])
+        info(f'INGEST completed for "{job.filename}" on envelope "{self.envelope}": '
+             f'{job.files_done} file(s)')
+        announce(self.envelope, EnvelopeEvents.COMPLETED_INGESTION, {
+            'job_id': job.pk,
+            'file_name': job.filename,
+            'file_ids': self.file_ids,
+        })
+        return self.file_ids
+
+
+def ingest_upload(job):
+    """
+    Ingests the upload tracked by ``job`` and returns the ids of affected envelope files.
+    """
+    return UploadIngestor(job).run()
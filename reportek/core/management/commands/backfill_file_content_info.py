@@ -0,0 +1,82 @@
+import os
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from edw.djutils.management import ProgressMixin
+
+from reportek.core.models import (
+    EnvelopeFile,
+    EnvelopeOriginalFile,
+    EnvelopeSupportFile,
+)
+from reportek.core.utils import hash_file
+
+
+DEFAULT_WORKERS = 4
+BATCH_SIZE = 500
+
+
+def get_content_info(pk, path):
+    """Returns the file's size, checksum and modification time."""
+    try:
+        modified = datetime.fromtimestamp(os.stat(path).st_mtime, tz=timezone.utc)
+        return pk, hash_file(path) + (modified,)
+    except FileNotFoundError:
+        return pk, None
+
+
+class Command(ProgressMixin, BaseCommand):
+    help = (
+        "Compute size and SHA-256 checksum for envelope files"
+        " that don't have them recorded yet."
+    )
+
+    PROGRESS_PREFIX = "Hashing envelope files: "
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--workers', type=int,
+                            default=DEFAULT_WORKERS, metavar='N',
+                            help=(
+                                "number of files hashed in parallel"
+                                " (default %s)" % DEFAULT_WORKERS
+                            ))
+        parser.add_argument('--all', action='store_true',
+                            dest='all_files',
+                            help="recompute for all files, not only missing ones")
+
+    def handle(self, workers=DEFAULT_WORKERS, all_files=False, **options):
+        for model in (EnvelopeFile, EnvelopeOriginalFile, EnvelopeSupportFile):
+            qs = model.objects.all() if all_files else model.objects.filter(sha256__isnull=True)
+            rows = list(qs.order_by('pk').values_list('pk', 'file'))
+            total = len(rows)
+            self.stdout.write(f'{model.__name__}: {total} file(s)')
+            if not total:
+                continue
+
+            storage = model._meta.get_field('file').storage
+            missing = 0
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for start in range(0, total, BATCH_SIZE):
+                    batch = rows[start:start + BATCH_SIZE]
+                    results = executor.map(
+                        get_content_info,
+                        [pk for pk, _ in batch],
+                        [storage.path(name) for _, name in batch]
+                    )
+                    for done, (pk, content_info) in enumerate(results, start + 1):
+                        if content_info is None:
+                            missing += 1
+                        else:
+                            size, sha256, modified = content_info
+                            # bypass save(), which refuses changes on final envelopes
+                            model.objects.filter(pk=pk).update(
+                                size=size,
+                                sha256=sha256,
+                                content_modified=modified
+                            )
+                        self.progress(done, total)
+
+            if missing:
+                self.stderr.write(f'{model.__name__}: {missing} file(s) not found on disk')
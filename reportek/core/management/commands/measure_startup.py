@@ -0,0 +1,55 @@
+import os
+import sys
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What each process type loads before serving, run in a fresh interpreter
+TARGETS = {
+    'web': (
+        'import reportek.site.asgi'
+    ),
+    'worker': (
+        'import django; django.setup()\n'
+        'from reportek.site.celery import app\n'
+        'app.loader.import_default_modules()'
+    ),
+    'beat': (
+        'import django; django.setup()\n'
+        'from reportek.site.celery import app\n'
+        'app.conf.beat_schedule'
+    ),
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Measures the start-up time of web, Celery worker and beat processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='*',
+                            help=f'Process types to measure: {", ".join(TARGETS)} (default: all)')
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Number of runs per process type (default: 5)')
+
+    def measure(self, code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=os.environ.copy(), check=True)
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        targets = options['targets'] or list(TARGETS)
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f'Unknown process type(s): {", ".join(sorted(unknown))}')
+
+        for target in targets:
+            timings = [self.measure(TARGETS[target]) for _ in range(options['runs'])]
+            self.stdout.write(
+                f'{target}: median {statistics.median(timings):.3f}s, '
+                f'min {min(timings):.3f}s, max {max(timings):.3f}s '
+                f'({len(timings)} runs)'
+            )
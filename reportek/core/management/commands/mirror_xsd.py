@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from reportek.core.models import EnvelopeFile, ObligationSpec
+from reportek.core.xsd import XSDMirror, SchemaUnavailable, compile_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Download XML schemas, with the documents they import or include,"
+        " into the XSD mirror used by local validation."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', metavar='URL',
+                            help=(
+                                "schema locations to mirror (default: the schemas"
+                                " of obligation specs and envelope files)"
+                            ))
+
+    def get_schemas(self):
+        schemas = set()
+        for spec_schemas in ObligationSpec.objects.values_list('schema', flat=True):
+            schemas.update((url,) for url in spec_schemas or [])
+        file_schemas = EnvelopeFile.objects.filter(
+            xml_schema__isnull=False
+        ).values_list('xml_schema', flat=True).distinct()
+        schemas.update(tuple(xml_schema.split()) for xml_schema in file_schemas)
+        return sorted(s for s in schemas if s)
+
+    def handle(self, urls=None, **options):
+        schemas = [(url,) for url in urls] if urls else self.get_schemas()
+        mirror = XSDMirror(offline=False)
+        self.stdout.write(f'Mirroring {len(schemas)} schema(s) into {mirror.root}')
+
+        failed = 0
+        for locations in schemas:
+            try:
+                compile_schema(locations, mirror)
+            except SchemaUnavailable as err:
+                failed += 1
+                self.stderr.write(f'{" ".join(locations)}: {err}')
+
+        if failed:
+            self.stderr.write(f'{failed} schema(s) could not be mirrored')
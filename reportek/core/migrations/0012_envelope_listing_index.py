@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_envelope_file_content_info'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='envelope',
+            index=models.Index(fields=['reporter', '-updated_at', '-id'], name='core_env_reporter_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_envelope_listing_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnvelopeQASummary',
+            fields=[
+                ('envelope', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='qa_summary', serialize=False, to='core.Envelope')),
+                ('jobs_total', models.PositiveIntegerField(default=0)),
+                ('jobs_completed', models.PositiveIntegerField(default=0)),
+                ('blocker_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('unknown_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'core_envelope_qa_summary',
+            },
+        ),
+    ]
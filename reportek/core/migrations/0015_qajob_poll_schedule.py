@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_obligationspec_workflow_class_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qajob',
+            name='next_poll_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='qajob',
+            name='poll_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_qajob_poll_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScriptRunJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('QA', 'QA'), ('CONVERSION', 'CONVERSION')], max_length=20)),
+                ('script_id', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('PENDING', 'PENDING'), ('RUNNING', 'RUNNING'), ('COMPLETED', 'COMPLETED'), ('FAILED', 'FAILED')], default='PENDING', max_length=20)),
+                ('error', models.CharField(blank=True, max_length=500, null=True)),
+                ('filename', models.CharField(blank=True, max_length=256, null=True)),
+                ('content_type', models.CharField(blank=True, max_length=200, null=True)),
+                ('feedback_status', models.CharField(blank=True, max_length=40, null=True)),
+                ('feedback_message', models.CharField(blank=True, max_length=200, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('envelope_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='script_runs', to='core.EnvelopeFile')),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='script_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'core_script_run_job',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
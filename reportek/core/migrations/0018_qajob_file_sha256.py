@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_envelopeqasummary_submission_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qajob',
+            name='file_sha256',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='qajob',
+            name='xml_schema',
+            field=models.CharField(blank=True, max_length=200, null=True),
+        ),
+    ]
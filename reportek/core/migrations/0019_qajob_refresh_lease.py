@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_qajob_file_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qajob',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Jobs left refreshing before leases existed are stuck for good
+        migrations.RunSQL(
+            'UPDATE core_qa_job SET refreshing = false WHERE refreshing',
+            migrations.RunSQL.noop,
+        ),
+        # The scheduler only polls incomplete jobs, which a partial index
+        # keeps cheap to find as completed jobs pile up.
+        migrations.AlterField(
+            model_name='qajob',
+            name='next_poll_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_qa_job_incomplete_next_poll_at '
+            'ON core_qa_job (next_poll_at) WHERE NOT completed',
+            'DROP INDEX core_qa_job_incomplete_next_poll_at',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import reportek.core.models.fields
+
+
+def compress_values(apps, schema_editor):
+    QAJobResult = apps.get_model('core', 'QAJobResult')
+    results = QAJobResult.objects.exclude(value=None).only('pk', 'value')
+    for result in results.iterator():
+        result.compressed_value = result.value
+        result.save(update_fields=['compressed_value'])
+
+
+def decompress_values(apps, schema_editor):
+    QAJobResult = apps.get_model('core', 'QAJobResult')
+    results = QAJobResult.objects.exclude(compressed_value=None).only('pk', 'compressed_value')
+    for result in results.iterator():
+        result.value = result.compressed_value
+        result.save(update_fields=['value'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_qajob_refresh_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='qajobresult',
+            name='compressed_value',
+            field=reportek.core.models.fields.CompressedTextField(blank=True, null=True),
+        ),
+        migrations.RunPython(compress_values, decompress_values),
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_qajobresult_compressed_value'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='qajobresult',
+            name='value',
+        ),
+        migrations.RenameField(
+            model_name='qajobresult',
+            old_name='compressed_value',
+            new_name='value',
+        ),
+    ]
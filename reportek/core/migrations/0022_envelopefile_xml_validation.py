@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_qajobresult_value_compressed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='envelopefile',
+            name='xml_validation',
+            field=models.CharField(blank=True, choices=[('VALID', 'VALID'), ('INVALID', 'INVALID'), ('NOT_WELL_FORMED', 'NOT_WELL_FORMED'), ('UNAVAILABLE', 'UNAVAILABLE'), ('SKIPPED', 'SKIPPED')], max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='envelopefile',
+            name='xml_validation_errors',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='envelopeqasummary',
+            name='invalid_files',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_envelopefile_xml_validation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='envelopefile',
+            name='xml_schema',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
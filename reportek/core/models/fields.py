@@ -0,0 +1,54 @@
+import zlib
+
+from django.db import models
+
+
+__all__ = [
+    'CompressedTextField',
+    'iter_decompressed',
+]
+
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Text stored zlib-compressed, in a `bytea` column.
+    Model instances hold the decompressed text.
+    """
+    description = 'Compressed text'
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return zlib.compress(value.encode('utf-8'))
+
+    def from_db_value(self, value, expression, connection, context):
+        if value is None:
+            return None
+        return zlib.decompress(bytes(value)).decode('utf-8')
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return zlib.decompress(bytes(value)).decode('utf-8')
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+def iter_decompressed(data, chunk_size=DECOMPRESS_CHUNK_SIZE):
+    """
+    Decompresses the compressed ``data`` of a ``CompressedTextField``
+    (e.g. fetched with ``Cast(field, BinaryField())``), in chunks of bytes.
+    """
+    decompressor = zlib.decompressobj()
+    data = memoryview(data)
+    for idx in range(0, len(data), chunk_size):
+        chunk = decompressor.decompress(data[idx:idx + chunk_size])
+        if chunk:
+            yield chunk
+    tail = decompressor.flush()
+    if tail:
+        yield tail
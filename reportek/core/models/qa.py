@@ -1,10 +1,18 @@
+import os
 import logging
 import enum
-from django.db import models
+import hashlib
+from pathlib import Path
+from collections import defaultdict
+from django.conf import settings
+from django.db import models, transaction, connections
+from django.db.models import F, Q
 from django.utils import timezone
 
 from reportek.core.qa import RemoteQA
 
+from .fields import CompressedTextField
+
 
 log = logging.getLogger('reportek.qa')
 info = log.info
@@ -12,7 +20,64 @@ debug = log.debug
 warn = log.warning
 error = log.error
 
-__all__ = ['QAJob', 'QAJobResult']
+__all__ = ['QAJob', 'QAJobResult', 'EnvelopeQASummary', 'ScriptRunJob']
+
+
+class QAJobQuerySet(models.QuerySet):
+
+    def due(self, now=None):
+        """
+        Incomplete jobs due for polling their result,
+        not being refreshed or with an expired refresh lease.
+        """
+        now = now or timezone.now()
+        return self.filter(
+            Q(refreshing=False) | Q(lease_expires_at__lt=now),
+            completed=False,
+            next_poll_at__lte=now
+        )
+
+    def claim(self, job_ids, lease_expires_at):
+        """
+        Atomically marks the incomplete jobs among ``job_ids`` as refreshing,
+        with a lease expiring at ``lease_expires_at``. Jobs refreshing under
+        an unexpired lease are not claimed, expired leases are taken over.
+        Returns the set of claimed job ids.
+        """
+        if not job_ids:
+            return set()
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        sql = (
+            f'UPDATE {qn(self.model._meta.db_table)} '
+            f'SET refreshing = true, lease_expires_at = %s '
+            f'WHERE id = ANY(%s) AND NOT completed '
+            f'AND (NOT refreshing OR lease_expires_at < %s) '
+            f'RETURNING id'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [lease_expires_at, list(job_ids), timezone.now()])
+            return {row[0] for row in cursor.fetchall()}
+
+    def with_results(self):
+        """
+        Prefetches the jobs' results, newest first, without their bodies,
+        for ``QAJob.latest_result``.
+        """
+        return self.prefetch_related(models.Prefetch(
+            'results',
+            queryset=QAJobResult.objects.defer('value').order_by('-updated_at')
+        ))
+
+    def release(self, job_ids, lease_expires_at):
+        """
+        Ends the refresh of jobs claimed with ``lease_expires_at``.
+        Jobs whose expired lease was taken over are left alone.
+        """
+        return self.filter(
+            pk__in=job_ids,
+            lease_expires_at=lease_expires_at
+        ).update(refreshing=False, lease_expires_at=None)
 
 
 class QAJob(models.Model):
@@ -29,75 +94,178 @@ class QAJob(models.Model):
     qa_job_id = models.IntegerField()
     qa_script_id = models.CharField(max_length=20, blank=True, null=True)
     qa_script_name = models.CharField(max_length=200, blank=True, null=True)
+    # Checksum and schema of the file as submitted, see `is_current()`
+    file_sha256 = models.CharField(max_length=64, blank=True, null=True)
+    xml_schema = models.CharField(max_length=200, blank=True, null=True)
     completed = models.BooleanField(default=False)
+    # Set while claimed for refreshing, until the lease expires (see `QAJobQuerySet.claim()`)
     refreshing = models.BooleanField(default=False)
+    lease_expires_at = models.DateTimeField(blank=True, null=True)
+    # Result polling schedule, see `schedule_next_poll()`.
+    # Indexed for incomplete jobs only (see migration 0019).
+    next_poll_at = models.DateTimeField(default=timezone.now)
+    poll_count = models.PositiveIntegerField(default=0)
+
+    objects = QAJobQuerySet.as_manager()
 
     class Meta:
         db_table = 'core_qa_job'
         unique_together = ('envelope_file', 'qa_job_id')
 
-    def add_or_update_result(self, rpc_result):
-        """
-        If ``rpc_result`` has different field values from the latest result,
-        a new ``QAJobResult`` is created. Otherwise, only the update timestamp
-        on the latest result is updated.
-
-        Args:
-            rpc_result (dict): Structured response a from QA/XMLCONV validation job.
-
-        Returns:
-            The updated or newly created ``QAJobResult`` instance.
-        """
-        job_not_found_err = '*** No such job or the job result has been already downloaded. ***'
-        if rpc_result is None or rpc_result.get('VALUE') == job_not_found_err:
-            return
-
-        prev_result = self.latest_result
-        if prev_result is not None and prev_result.same_as(**rpc_result):
-            prev_result.updated_at = timezone.now()
-            prev_result.save()
-            result = prev_result
-        else:
-            result = QAJobResult.objects.create(
-                job=self,
-                code=rpc_result['CODE'],
-                value=rpc_result['VALUE'],
-                metatype=rpc_result['METATYPE'],
-                script_title=rpc_result['SCRIPT_TITLE'],
-                feedback_status=rpc_result['FEEDBACK_STATUS'],
-                feedback_message=rpc_result['FEEDBACK_MESSAGE']
-            )
-            if not result.processing:
-                self.completed = True
-                self.save()
-        return result
+    JOB_NOT_FOUND = '*** No such job or the job result has been already downloaded. ***'
+
+    @staticmethod
+    def _result_fields(rpc_result):
+        return dict(
+            code=rpc_result['CODE'],
+            value=rpc_result['VALUE'],
+            metatype=rpc_result['METATYPE'],
+            script_title=rpc_result['SCRIPT_TITLE'],
+            feedback_status=rpc_result['FEEDBACK_STATUS'],
+            feedback_message=rpc_result['FEEDBACK_MESSAGE']
+        )
+
+    @classmethod
+    def refresh_batch(cls, jobs, cleanup=True):
+        """
+        Fetches the results of several jobs from the remote QA systems,
+        with one batched request per QA server, and stores them in bulk.
+
+        For each job, if the fetched result has different field values from
+        the latest result, a new ``QAJobResult`` is created. Otherwise, only
+        the update timestamp on the latest result is updated.
+
+        Jobs should have their envelope's obligation spec loaded
+        (``select_related('envelope_file__envelope__obligation_spec')``).
+
+        Jobs are claimed for the refresh with a lease of ``QA_REFRESH_LEASE``
+        seconds, after which they can be claimed again (e.g. if the worker died).
+
+        Returns: dict mapping job ids to the id of their created/updated
+        ``QAJobResult``, or `None` if no result could be fetched.
+        Completed jobs, and jobs claimed by another refresh, are skipped.
+        """
+        jobs = [job for job in jobs if not job.completed]
+        lease_expires_at = timezone.now() + timezone.timedelta(seconds=settings.QA_REFRESH_LEASE)
+        claimed = cls.objects.claim([job.pk for job in jobs], lease_expires_at)
+        jobs = [job for job in jobs if job.pk in claimed]
+        if not jobs:
+            return {}
+
+        try:
+            return cls._refresh_batch(jobs, cleanup)
+        finally:
+            cls.objects.release(claimed, lease_expires_at)
+
+    @classmethod
+    def _refresh_batch(cls, jobs, cleanup):
+        by_uri = defaultdict(list)
+        for job in jobs:
+            by_uri[job.envelope_file.envelope.obligation_spec.qa_xmlrpc_uri].append(job)
+
+        rpc_results = {}
+        for uri, uri_jobs in by_uri.items():
+            responses = RemoteQA(uri).get_job_results(job.qa_job_id for job in uri_jobs)
+            for job in uri_jobs:
+                rpc_results[job.pk] = responses.get(job.qa_job_id)
+
+        latest_results = {
+            result.job_id: result
+            for result in QAJobResult.objects.filter(
+                job__in=jobs
+            ).order_by('job_id', '-updated_at').distinct('job_id')
+        }
+
+        now = timezone.now()
+        results = {}
+        unchanged_ids = []
+        new_results = []
+        for job in jobs:
+            rpc_result = rpc_results[job.pk]
+            if rpc_result is None or rpc_result.get('VALUE') == cls.JOB_NOT_FOUND:
+                continue
+            prev_result = latest_results.get(job.pk)
+            if prev_result is not None and prev_result.same_as(**rpc_result):
+                prev_result.updated_at = now
+                unchanged_ids.append(prev_result.pk)
+                results[job.pk] = prev_result
+            else:
+                result = QAJobResult(job=job, **cls._result_fields(rpc_result))
+                new_results.append(result)
+                results[job.pk] = result
+
+        with transaction.atomic():
+            if unchanged_ids:
+                QAJobResult.objects.filter(pk__in=unchanged_ids).update(updated_at=now)
+            # Postgres sets the primary keys of bulk created objects
+            QAJobResult.objects.bulk_create(new_results)
+            if cleanup and results:
+                QAJobResult.objects.filter(
+                    job__in=list(results)
+                ).exclude(
+                    pk__in=[result.pk for result in results.values()]
+                ).delete()
+
+            completions = [
+                (job, results[job.pk]) for job in jobs
+                if job.pk in results and not results[job.pk].processing
+            ]
+            if completions:
+                cls.objects.filter(pk__in=[job.pk for job, _ in completions]).update(completed=True)
+                for job, _ in completions:
+                    job.completed = True
+                EnvelopeQASummary.record_completions(completions)
+
+        # Jobs sharing a poll schedule are rescheduled together
+        schedules = defaultdict(list)
+        for job in jobs:
+            if not job.completed:
+                job.schedule_next_poll()
+                schedules[(job.next_poll_at, job.poll_count)].append(job.pk)
+        for (next_poll_at, poll_count), pks in schedules.items():
+            cls.objects.filter(pk__in=pks).update(next_poll_at=next_poll_at, poll_count=poll_count)
+
+        return {
+            job.pk: results[job.pk].pk if job.pk in results else None
+            for job in jobs
+        }
+
+    def is_current(self, envelope_file, xml_schema):
+        """
+        Whether the job checked the current content of ``envelope_file``
+        against ``xml_schema``, so its results can be carried forward
+        to a new QA round.
+        """
+        return bool(envelope_file.sha256) and \
+            self.file_sha256 == envelope_file.sha256 and \
+            self.xml_schema == xml_schema
 
     def refresh(self, cleanup=True):
         """
         Fetches the job result from the remote QA system.
         Returns: id of created/updated QAJobResult, or `None` RPC .
         """
-        if not self.refreshing and not self.completed:
-            self.refreshing = True
-            self.save()
+        return self.refresh_batch([self], cleanup=cleanup).get(self.pk)
 
-            remote_qa = RemoteQA(
-                self.envelope_file.envelope.obligation_spec.qa_xmlrpc_uri
-            )
-            rpc_result = remote_qa.get_job_result(self.qa_job_id)
-            result = self.add_or_update_result(rpc_result)
-            if cleanup and result is not None:
-                self.cleanup_results()
-
-            self.refreshing = False
-            self.save()
-            return result.id if result is not None else None
+    def schedule_next_poll(self):
+        """
+        Sets the next time the result is polled, backing off exponentially
+        from `QA_POLL_MIN_DELAY` to at most `QA_POLL_MAX_DELAY` seconds.
+        """
+        delay = min(settings.QA_POLL_MIN_DELAY * 2 ** min(self.poll_count, 16),
+                    settings.QA_POLL_MAX_DELAY)
+        self.poll_count += 1
+        self.next_poll_at = timezone.now() + timezone.timedelta(seconds=delay)
 
     @property
     def latest_result(self):
         """
         Returns the most recent result, or `None`.
         """
+        if 'results' in getattr(self, '_prefetched_objects_cache', {}):
+            # prefetched newest first, see `QAJobQuerySet.with_results()`
+            results = self.results.all()
+            return results[0] if results else None
         try:
             return self.results.latest()
         except QAJobResult.DoesNotExist:
@@ -143,7 +311,8 @@ class QAJobResult(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     job = models.ForeignKey(QAJob, on_delete=models.CASCADE, related_name='results')
     code = models.IntegerField(choices=((c.value, c.name) for c in CODES))
-    value = models.TextField(blank=True, null=True)
+    # The result body, e.g. an HTML or XML report, often megabytes large
+    value = CompressedTextField(blank=True, null=True)
     metatype = models.CharField(max_length=60, blank=True, null=True)
     script_title = models.CharField(max_length=100)
     feedback_status = models.CharField(max_length=40, choices=((s.value, s.name) for s in FEEDBACK_STATUSES))
@@ -174,3 +343,220 @@ class QAJobResult(models.Model):
             self.script_title == kwargs.get('SCRIPT_TITLE') and \
             self.feedback_status == kwargs.get('FEEDBACK_STATUS') and \
             self.feedback_message == kwargs.get('FEEDBACK_MESSAGE')
+
+
+class EnvelopeQASummary(models.Model):
+    """
+    Per-envelope QA counters, maintained as QA jobs are submitted and completed,
+    so that envelope QA status checks don't need to go through all jobs.
+
+    The status counters only count completed jobs, by the feedback status
+    of their final result. XML files failing local XSD validation,
+    which are not submitted to QA, are counted as ``invalid_files``.
+    """
+    # Feedback statuses failing QA, mapped to their counter fields
+    STATUS_COUNTERS = {
+        QAJobResult.FEEDBACK_STATUSES.BLOCKER.value: 'blocker_count',
+        QAJobResult.FEEDBACK_STATUSES.ERROR.value: 'error_count',
+        QAJobResult.FEEDBACK_STATUSES.UNKNOWN.value: 'unknown_count',
+    }
+
+    envelope = models.OneToOneField(
+        'core.Envelope',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='qa_summary'
+    )
+    jobs_total = models.PositiveIntegerField(default=0)
+    jobs_completed = models.PositiveIntegerField(default=0)
+    blocker_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    unknown_count = models.PositiveIntegerField(default=0)
+    invalid_files = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Idempotency key of the latest QA submission, see `get_submission_key()`
+    submission_key = models.CharField(max_length=64, blank=True, default='')
+    submitted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'core_envelope_qa_summary'
+
+    @property
+    def complete(self):
+        return self.jobs_completed >= self.jobs_total
+
+    @property
+    def ok(self):
+        return self.complete and not (
+            self.blocker_count or self.error_count or self.unknown_count or self.invalid_files
+        )
+
+    @staticmethod
+    def get_submission_key(files, submission_id=None):
+        """
+        Returns the idempotency key of submitting the XML ``files`` of an
+        envelope to QA, derived from the files' checksums and schemas and
+        the ``submission_id`` (e.g. of the workflow transition), or `None`
+        if a file has no checksum.
+        """
+        if any(not f.sha256 for f in files):
+            return None
+        parts = sorted(f'{f.pk}:{f.sha256}:{f.xml_schema}' for f in files)
+        if submission_id is not None:
+            parts.append(f'submission:{submission_id}')
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+    def is_submitted(self, key):
+        """
+        Whether a QA submission with idempotency ``key`` happened
+        less than ``QA_SUBMISSION_KEY_TTL`` seconds ago.
+        """
+        if key is None or key != self.submission_key or self.submitted_at is None:
+            return False
+        age = timezone.now() - self.submitted_at
+        return age < timezone.timedelta(seconds=settings.QA_SUBMISSION_KEY_TTL)
+
+    @classmethod
+    def recompute(cls, envelope):
+        """
+        Rebuilds the envelope's counters from its QA jobs and the local
+        validation outcome of its files. Used when jobs are (re)submitted or removed.
+        """
+        latest_status = QAJobResult.objects.filter(
+            job=models.OuterRef('pk')
+        ).order_by('-updated_at').values('feedback_status')[:1]
+        jobs = QAJob.objects.filter(
+            envelope_file__envelope=envelope
+        ).annotate(
+            status=models.Subquery(latest_status)
+        ).values_list('completed', 'status')
+
+        counters = dict.fromkeys(cls.STATUS_COUNTERS.values(), 0)
+        counters.update(jobs_total=0, jobs_completed=0)
+        counters['invalid_files'] = envelope.files.filter(
+            xml_validation__in=envelope.files.model.XML_VALIDATION_FAILURES
+        ).count()
+        for completed, status in jobs:
+            counters['jobs_total'] += 1
+            if completed:
+                counters['jobs_completed'] += 1
+                counter = cls.STATUS_COUNTERS.get(status)
+                if counter is not None:
+                    counters[counter] += 1
+
+        summary, _ = cls.objects.update_or_create(envelope=envelope, defaults=counters)
+        return summary
+
+    @classmethod
+    def record_completion(cls, qa_job, result):
+        """
+        Atomically counts the completion of ``qa_job`` with its final ``result``.
+        """
+        cls.record_completions([(qa_job, result)])
+
+    @classmethod
+    def record_completions(cls, completions):
+        """
+        Atomically counts job completions, given as ``(qa_job, result)`` pairs,
+        with one update per envelope.
+        """
+        envelopes = {}
+        increments = defaultdict(lambda: defaultdict(int))
+        for qa_job, result in completions:
+            envelope = qa_job.envelope_file.envelope
+            envelopes[envelope.pk] = envelope
+            increments[envelope.pk]['jobs_completed'] += 1
+            counter = cls.STATUS_COUNTERS.get(result.feedback_status)
+            if counter is not None:
+                increments[envelope.pk][counter] += 1
+
+        now = timezone.now()
+        for envelope_pk, counts in increments.items():
+            updates = {
+                field: F(field) + count
+                for field, count in counts.items()
+            }
+            updates['updated_at'] = now
+            if not cls.objects.filter(envelope_id=envelope_pk).update(**updates):
+                # No counters yet for the envelope (e.g. jobs predating them)
+                cls.recompute(envelopes[envelope_pk])
+
+
+class ScriptRunJob(models.Model):
+    """
+    A QA script or conversion run on demand against an ``EnvelopeFile``.
+    Jobs are processed by a Celery task (see ``reportek.core.script_runs``),
+    which stores the result on disk under ``SCRIPT_RUNS_ROOT``.
+    """
+
+    @enum.unique
+    class KINDS(enum.Enum):
+        QA = 'QA'
+        CONVERSION = 'CONVERSION'
+
+    @enum.unique
+    class STATUSES(enum.Enum):
+        PENDING = 'PENDING'
+        RUNNING = 'RUNNING'
+        COMPLETED = 'COMPLETED'
+        FAILED = 'FAILED'
+
+    envelope_file = models.ForeignKey(
+        'core.EnvelopeFile',
+        on_delete=models.CASCADE,
+        related_name='script_runs'
+    )
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='script_runs'
+    )
+    kind = models.CharField(max_length=20, choices=((k.value, k.name) for k in KINDS))
+    script_id = models.CharField(max_length=200)
+
+    status = models.CharField(
+        max_length=20,
+        choices=((s.value, s.name) for s in STATUSES),
+        default=STATUSES.PENDING.value
+    )
+    error = models.CharField(max_length=500, blank=True, null=True)
+
+    # Result, once completed
+    filename = models.CharField(max_length=256, blank=True, null=True)
+    content_type = models.CharField(max_length=200, blank=True, null=True)
+    feedback_status = models.CharField(max_length=40, blank=True, null=True)
+    feedback_message = models.CharField(max_length=200, blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'core_script_run_job'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.get_kind_display()} script "{self.script_id}" on "{self.envelope_file}"'
+
+    @property
+    def envelope(self):
+        return self.envelope_file.envelope
+
+    @property
+    def result_name(self):
+        return f'{self.pk}.result'
+
+    @property
+    def result_path(self):
+        return Path(settings.SCRIPT_RUNS_ROOT) / self.result_name
+
+    @property
+    def result_url(self):
+        return f'{settings.SCRIPT_RUNS_URL}{self.result_name}'
+
+    def delete(self, *args, **kwargs):
+        result_path = self.result_path
+        super().delete(*args, **kwargs)
+        try:
+            os.remove(str(result_path))
+        except FileNotFoundError:
+            pass
@@ -1,7 +1,9 @@
 import os
+import enum
 import logging
+from pathlib import Path
 from django.conf import settings
-from django.db import models, transaction
+from django.db import models, transaction, connection
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.utils import timezone
@@ -24,11 +26,14 @@ from .rod import (
     ReportingCycle
 )
 
-from .qa import QAJob, QAJobResult
+from .qa import QAJob, QAJobResult, EnvelopeQASummary
 
+from reportek.core import xsd
 from reportek.core.utils import (
     get_xsd_uri,
     fully_qualify_url,
+    hash_file,
+    HashingFile,
 )
 
 log = logging.getLogger('reportek.workflows')
@@ -49,12 +54,32 @@ __all__ = [
     'EnvelopeOriginalFile',
     'EnvelopeSupportFile',
     'EnvelopeLink',
-    'UploadToken'
+    'UploadToken',
+    'UploadIngestionJob',
 ]
 
 
 class EnvelopeQuerySet(models.QuerySet):
-    pass
+
+    def for_listing(self):
+        """
+        Prefetches everything `EnvelopeSerializer` renders, so that serializing
+        a page of envelopes costs a fixed number of queries, whatever its size.
+        Nested files and links get their `envelope` back-reference set by the
+        prefetch, which the nested URL fields rely on.
+        """
+        return self.select_related(
+            'reporter',
+            'obligation_spec',
+            'reporting_cycle',
+            'workflow',
+            'assigned_to',
+        ).prefetch_related(
+            models.Prefetch('files', queryset=EnvelopeFile.objects.order_by('name')),
+            models.Prefetch('original_files', queryset=EnvelopeOriginalFile.objects.order_by('name')),
+            models.Prefetch('support_files', queryset=EnvelopeSupportFile.objects.order_by('name')),
+            models.Prefetch('links', queryset=EnvelopeLink.objects.order_by('pk')),
+        )
 
 
 class EnvelopeManager(models.Manager.from_queryset(EnvelopeQuerySet)):
@@ -98,6 +123,13 @@ class Envelope(models.Model):
     objects = EnvelopeManager()
     tracker = FieldTracker()
 
+    class Meta:
+        indexes = [
+            # Matches the keyset pagination ordering of envelope listings
+            models.Index(fields=['reporter', '-updated_at', '-id'],
+                         name='core_env_reporter_updated_idx'),
+        ]
+
     @property
     def obligation(self):
         if self.obligation_spec is None:
@@ -117,39 +149,41 @@ class Envelope(models.Model):
     def fq_url(self):
         return fully_qualify_url(self.url)
 
+    @property
+    def auto_qa_summary(self):
+        """
+        The envelope's QA counters (see ``EnvelopeQASummary``),
+        computed from its QA jobs on first use.
+        """
+        summary = EnvelopeQASummary.objects.filter(envelope=self).first()
+        if summary is None:
+            summary = EnvelopeQASummary.recompute(self)
+        return summary
+
     @property
     def auto_qa_jobs(self):
         """
-        The envelope's most recent QA job for each file.
+        The envelope's QA jobs, for all files.
         """
-        return [
-            job
-            for file in self.files.all()
-            for job in file.qa_jobs.all()
-        ]
+        return list(QAJob.objects.filter(envelope_file__envelope=self))
 
     @property
     def auto_qa_complete(self):
         """
         Is `True` when every QA job on the envelope's files is complete.
-        The most recent QA job per file is considered.
         """
-        return all([job.completed for job in self.auto_qa_jobs])
+        return self.auto_qa_summary.complete
 
     @property
     def auto_qa_results(self):
         """
         Latest QA job results for the envelope's files.
         """
-        return [
-            result
-            for file in self.files.all()
-            for result in file.qa_results
-        ]
+        return list(QAJobResult.objects.filter(job__envelope_file__envelope=self))
 
     @property
     def auto_qa_ok(self):
-        return self.auto_qa_complete and all([r.ok for r in self.auto_qa_results])
+        return self.auto_qa_summary.ok
 
     @property
     def channel(self):
@@ -169,13 +203,9 @@ class Envelope(models.Model):
 
         # On first save:
         if not self.pk or kwargs.get('force_insert', False):
-            # - import the workflow class set on the envelope's obligation spec
-            wf_path_components = self.obligation_spec.workflow_class.split('.')
-            module_name = '.'.join(wf_path_components[:-1])
-            class_name = wf_path_components[-1]
-            module = __import__(module_name, fromlist=[class_name])
+            # - get the workflow class set on the envelope's obligation spec
+            wf_class = BaseWorkflow.get_workflow_class(self.obligation_spec.workflow_class)
             # Instantiate a new workflow and set it on the envelope
-            wf_class = getattr(module, class_name)
             workflow = wf_class(name=f'Envelope "{self.name}"\'s workflow')
             workflow.save()
             self.workflow = workflow
@@ -282,11 +312,50 @@ class BaseEnvelopeFile(models.Model):
         null=True
     )
 
+    # Content information, set whenever the file content is written,
+    # so it never has to be read back from the storage
+    size = models.BigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, null=True, blank=True)
+    content_modified = models.DateTimeField(null=True, blank=True)
+
     objects = EnvelopeFileQuerySet.as_manager()
 
-    @property
-    def size(self):
-        return self.file.size
+    def set_content_info(self, size, sha256):
+        """Records the size and checksum of newly written file content."""
+        self.size = size
+        self.sha256 = sha256
+        self.content_modified = timezone.now()
+
+    def store_content(self, name, content):
+        """
+        Writes ``content`` to the storage as ``name``, recording its size
+        and checksum, computed while it is written.
+        """
+        if hasattr(content, 'temporary_file_path'):
+            # Moved into the storage without being read
+            content_info = hash_file(content.temporary_file_path())
+            self.file.save(name, content, save=False)
+        else:
+            content = HashingFile(content)
+            self.file.save(name, content, save=False)
+            content_info = content.content_info
+        self.set_content_info(*content_info)
+
+    def get_size(self):
+        """
+        Returns the content size, read from the storage for files whose
+        content info isn't recorded yet (see ``backfill_file_content_info``).
+        """
+        if self.size is not None:
+            return self.size
+        try:
+            return self.file.size
+        except (OSError, ValueError):
+            return None
+
+    def compute_content_info(self):
+        """Reads the file from disk to set its size and checksum."""
+        self.set_content_info(*hash_file(self.file.path))
 
     @property
     def download_url(self):
@@ -327,6 +396,55 @@ class BaseEnvelopeFile(models.Model):
 
         return obj, is_new
 
+    @classmethod
+    def bulk_save(cls, new_files, changed_files, update_fields):
+        """
+        Saves many files of the same envelope in one transaction, bypassing ``save()``:
+            - ``new_files`` are inserted with a single ``bulk_create``
+            - ``update_fields`` of ``changed_files`` are set with a single UPDATE
+
+        Files must already be in place on disk, as no renames are handled here,
+        and no notifications are sent - callers are expected to announce changes.
+        """
+        files = new_files + changed_files
+        if not files:
+            return
+        if files[0].envelope.finalized:
+            raise RuntimeError("Envelope is final.")
+
+        with transaction.atomic():
+            for f in new_files:
+                f.name = os.path.basename(f.file.name)
+            cls.objects.bulk_create(new_files)
+
+            if changed_files:
+                now = timezone.now()
+                for f in changed_files:
+                    f.updated = now
+
+                qn = connection.ops.quote_name
+                fields = [cls._meta.get_field(name) for name in update_fields + ['updated']]
+                row_sql = '(%s::integer, {})'.format(
+                    ', '.join(f'%s::{f.db_type(connection)}' for f in fields)
+                )
+                params = []
+                for obj in changed_files:
+                    params.append(obj.pk)
+                    params.extend(
+                        f.get_db_prep_save(getattr(obj, f.attname), connection)
+                        for f in fields
+                    )
+                columns = [qn(f.column) for f in fields]
+                sql = (
+                    f'UPDATE {qn(cls._meta.db_table)} AS t '
+                    f'SET {", ".join(f"{c} = v.{c}" for c in columns)} '
+                    f'FROM (VALUES {", ".join([row_sql] * len(changed_files))}) '
+                    f'AS v(id, {", ".join(columns)}) '
+                    f'WHERE t.id = v.id'
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+
     def save(self, *args, **kwargs):
         # don't allow any operations on a final envelope
         if self.envelope.finalized:
@@ -359,6 +477,10 @@ class BaseEnvelopeFile(models.Model):
         else:
             new_path = old_path = self.file.path
 
+        # content that is about to be stored by the file field
+        if self.file and not self.file._committed:
+            self.store_content(self.file.name, self.file.file)
+
         debug(f'saving file name: {self.file.name}')
         # save first to catch data integrity errors.
         # TODO: wrap this in a transaction with below, who knows
@@ -447,9 +569,33 @@ class EnvelopeFile(BaseEnvelopeFile):
     # Overriding so notifications work
     _class_specifier = 'file'
 
+    @enum.unique
+    class XML_VALIDATION_STATUSES(enum.Enum):
+        VALID = 'VALID'
+        INVALID = 'INVALID'
+        NOT_WELL_FORMED = 'NOT_WELL_FORMED'
+        # the schema could not be loaded
+        UNAVAILABLE = 'UNAVAILABLE'
+        # too large to be validated locally
+        SKIPPED = 'SKIPPED'
+
+    # Files with these statuses are not submitted to QA
+    XML_VALIDATION_FAILURES = (
+        XML_VALIDATION_STATUSES.INVALID.value,
+        XML_VALIDATION_STATUSES.NOT_WELL_FORMED.value,
+    )
+
     envelope = models.ForeignKey(Envelope, related_name=f'{_class_specifier}s')
 
-    xml_schema = models.CharField(max_length=200, blank=True, null=True)
+    xml_schema = models.TextField(blank=True, null=True)
+    # Outcome of the local XSD validation, reset when the content changes
+    xml_validation = models.CharField(
+        max_length=20,
+        choices=((s.value, s.name) for s in XML_VALIDATION_STATUSES),
+        blank=True,
+        null=True
+    )
+    xml_validation_errors = models.TextField(blank=True, null=True)
 
     original_file = models.ForeignKey(EnvelopeOriginalFile,
                                       related_name='envelope_files',
@@ -479,6 +625,50 @@ class EnvelopeFile(BaseEnvelopeFile):
     def extract_xml_schema(self):
         return get_xsd_uri(self.file.path)
 
+    def set_content_info(self, size, sha256):
+        super().set_content_info(size, sha256)
+        self.xml_validation = None
+        self.xml_validation_errors = None
+
+    def validate_xml(self):
+        """
+        Validates the file against its XML schema(s), setting `xml_validation`
+        and `xml_validation_errors` (one error per line) without saving.
+        Does nothing if local validation is disabled or the file declares no schema.
+        """
+        if not settings.XSD_VALIDATION or not self.xml_schema:
+            return
+        STATUSES = self.XML_VALIDATION_STATUSES
+        if self.size is not None and self.size > settings.XSD_VALIDATION_MAX_SIZE:
+            self.xml_validation = STATUSES.SKIPPED.value
+            self.xml_validation_errors = None
+            return
+
+        try:
+            well_formed, errors = xsd.validate(self.file.path, self.xml_schema)
+        except xsd.SchemaUnavailable as err:
+            self.xml_validation = STATUSES.UNAVAILABLE.value
+            self.xml_validation_errors = str(err)
+            return
+        except OSError as err:
+            error(f'XSD validation of {self.file.path} failed: {err}')
+            return
+
+        if not well_formed:
+            self.xml_validation = STATUSES.NOT_WELL_FORMED.value
+        elif errors:
+            self.xml_validation = STATUSES.INVALID.value
+        else:
+            self.xml_validation = STATUSES.VALID.value
+        self.xml_validation_errors = '\n'.join(errors) or None
+        debug(f'XSD validation of {self.file.path}: {self.xml_validation}')
+
+    def delete(self, *args, **kwargs):
+        envelope = self.envelope
+        super().delete(*args, **kwargs)
+        # the file's QA jobs are gone with it
+        EnvelopeQASummary.recompute(envelope)
+
 
 class EnvelopeSupportFile(BaseEnvelopeFile):
     """
@@ -551,3 +741,59 @@ class UploadToken(models.Model):
     def has_expired(self):
         return self.valid_until < (
             timezone.now() + timezone.timedelta(seconds=self.GRACE_SECONDS))
+
+
+class UploadIngestionJob(models.Model):
+    """
+    Tracks the ingestion of a finished `tusd` upload into an envelope.
+    Jobs are recorded by the ``post-finish`` hook and processed by a Celery task.
+    """
+
+    @enum.unique
+    class STATUSES(enum.Enum):
+        PENDING = 'PENDING'
+        RUNNING = 'RUNNING'
+        COMPLETED = 'COMPLETED'
+        FAILED = 'FAILED'
+
+    envelope = models.ForeignKey(
+        Envelope,
+        related_name='ingestion_jobs',
+        on_delete=models.CASCADE
+    )
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='ingestion_jobs',
+        on_delete=models.CASCADE
+    )
+
+    filename = models.CharField(max_length=256)
+    tus_id = models.CharField(max_length=32)
+    is_support_file = models.BooleanField(default=False)
+
+    status = models.CharField(
+        max_length=20,
+        choices=((s.value, s.name) for s in STATUSES),
+        default=STATUSES.PENDING.value
+    )
+    files_total = models.PositiveIntegerField(default=0)
+    files_done = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=500, blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'core_upload_ingestion_job'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'Ingestion of "{self.filename}" on envelope "{self.envelope}"'
+
+    @property
+    def upload_path(self):
+        return Path(settings.TUSD_UPLOADS_DIR, f'{self.tus_id}.bin').resolve()
+
+    @property
+    def upload_info_path(self):
+        return Path(settings.TUSD_UPLOADS_DIR, f'{self.tus_id}.info').resolve()
@@ -10,7 +10,6 @@ from .demo_auto_qa import (
     DemoPassQAWorkflow,
 )
 
-from reportek.core.utils import get_based_classes
 
-
-WORKFLOW_CLASSES = get_based_classes(__path__, __package__, 'BaseWorkflow')
+# Workflow types register themselves on import - see `BaseWorkflow.__init_subclass__`
+WORKFLOW_CLASSES = BaseWorkflow.get_workflow_choices()
@@ -1,7 +1,9 @@
 import re
+import uuid
 import logging
-from django.db import models
-from django.utils.functional import cached_property
+from importlib import import_module
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericRelation
 from typedmodels.models import TypedModel
 import xworkflows as xwf
@@ -21,6 +23,12 @@ debug = log.debug
 warn = log.warning
 error = log.error
 
+# Workflow types by dotted path, registered on class creation
+_workflow_classes = {}
+
+# XWorkflow-enabled classes, per concrete workflow type
+_xwf_enabled_classes = {}
+
 
 class BaseWorkflow(TypedModel):
     """
@@ -45,6 +53,35 @@ class BaseWorkflow(TypedModel):
     class TransitionNotAvailable(Exception):
         pass
 
+    # Explicit classmethod, as Django sets model class attributes after creation
+    @classmethod
+    def __init_subclass__(cls, **kwargs):
+        """Registers workflow types by their dotted path."""
+        super().__init_subclass__(**kwargs)
+        # Skip the historical models built by migrations
+        if cls.__module__ != '__fake__':
+            _workflow_classes[f'{cls.__module__}.{cls.__name__}'] = cls
+
+    @staticmethod
+    def get_workflow_class(path):
+        """
+        Returns the workflow type registered under the dotted `path`,
+        importing its module if not yet loaded.
+        """
+        if path not in _workflow_classes:
+            import_module(path.rpartition('.')[0])
+        try:
+            return _workflow_classes[path]
+        except KeyError:
+            raise LookupError(f'No workflow class registered as "{path}"')
+
+    @staticmethod
+    def get_workflow_choices():
+        """Registered workflow types, as model field choices."""
+        return tuple(sorted(
+            (path, cls.__name__) for path, cls in _workflow_classes.items()
+        ))
+
     def __str__(self):
         return self.name
 
@@ -76,19 +113,23 @@ class BaseWorkflow(TypedModel):
         Property returning the list of available transitions from the current state.
         Availability takes into account the workflow's checks.
         """
-        state = self.xwf.state.workflow.states[self.current_state]
+        wf = self.xwf
         return [
-            t.name
-            for t in self.xwf.state.workflow.transitions
-            if state.name in [s.name for s in t.source]
-            and getattr(self.xwf, t.name).is_available()  # ImplementationWrapper
+            name
+            for name in wf.transitions_from[self.current_state]
+            if getattr(wf, name).is_available()  # ImplementationWrapper
         ]
 
     def submit_xml_to_qa(self):
         """
-        Sends the envelope to QA, providing the result callback.
+        Schedules the envelope's submission to QA, once the current transaction
+        (i.e. the transition) is committed, so that no row locks are held during
+        the remote call. The QA results handler runs as results come in.
+        Each call is a new submission, even if the XML files are unchanged.
         """
-        return submit_xml_to_qa(self.envelope.pk)
+        envelope_pk = self.envelope.pk
+        submission_id = uuid.uuid4().hex
+        transaction.on_commit(lambda: submit_xml_to_qa.delay(envelope_pk, submission_id))
 
     def handle_auto_qa_results(self, *args, **kwargs):
         """
@@ -111,56 +152,107 @@ class BaseWorkflow(TypedModel):
             }
         )
 
-    @cached_property
-    def xwf_cls_name(self):
-        """Builds a cleaned-up name for the XWorkflow class"""
-        pattern = re.compile('[\W_]+')
-        return f'XWFDef_{re.sub(pattern, "", self.name.capitalize())}'
-
-    @property
-    def xwf_cls(self):
+    @classmethod
+    def get_xwf_enabled_cls(cls):
+        """
+        Returns the concrete type's XWorkflow-enabled class, compiled on first use.
+        The class is shared by all workflows of the type: `xwf` binds its
+        instances to the workflow and the workflow's current state.
+        """
+        try:
+            return _xwf_enabled_classes[cls]
+        except KeyError:
+            enabled_cls = _xwf_enabled_classes[cls] = cls.compile_xwf()
+            return enabled_cls
+
+    @classmethod
+    def compile_xwf(cls):
         """
-        Builds a custom XWorkflow class from the concrete type's specs.
+        Builds an XWorkflow-enabled class from the concrete type's specs,
+        with its transition & hook methods.
         """
-        def log_transition(self, transition, from_state, workflow):
+        cls_name = re.sub(r'[\W_]+', '', cls.__name__)
+
+        def log_transition(self, transition, from_state, instance, *args, **kwargs):
             """
             Transition event logger - supplied to the XWorkflow class.
             """
-            trans, src, dst = transition.name, from_state, workflow.state
-            info(f'Logging transition "{trans}"')
-            TransitionEvent.objects.create(
-                content_object=self.bearer,
-                transition=trans,
-                from_state=src,
-                to_state=dst
-            )
-            info(f'"{self.bearer.envelope.name}" is now in state "{dst}".')
-
-        bases = (xwf.Workflow,)
-        attrs = {
-            'bearer': self,
-            'envelope': self.envelope,
-            'states': self.states,
-            'transitions': self.transitions,
-            'initial_state': self.initial_state,
+            trans, src, dst = transition.name, from_state, instance.state.name
+            bearer = instance.bearer
+
+            def create_event():
+                info(f'Logging transition "{trans}"')
+                TransitionEvent.objects.create(
+                    content_object=bearer,
+                    transition=trans,
+                    from_state=src,
+                    to_state=dst
+                )
+
+            transaction.on_commit(create_event)
+            info(f'"{bearer.envelope.name}" is now in state "{dst}".')
+
+        workflow = type(f'XWFDef_{cls_name}', (xwf.Workflow,), {
+            'states': cls.states,
+            'transitions': cls.transitions,
+            'initial_state': cls.initial_state,
             'log_transition': log_transition
-        }
+        })()
 
-        return type(self.xwf_cls_name, bases, attrs)
+        def transition_check_if_assigned(self, *args, **kwargs):
+            # Automatic transitions (e.g. on QA results) need no assignee
+            return self.automatic or self.bearer.envelope.is_assigned
 
-    # Resist the temptation to cache this - it will noop the XWF transitions
-    @property
-    def xwf_methods(self):
-        """
-        Builds an 'attrs'-style dict of transition & hook methods.
+        def post_transition(self, *args, **kwargs):
+            """After transition hook applied to all workflows"""
+            bearer = self.bearer
+            envelope = bearer.envelope
 
-        XWorkflows methods are identified based on the effects of their decorators:
-        - @transition wraps methods in a TransisionWrapper
-        - hook decorators (@before|after_transition, @on_enter|leave_state)
-          set a `xworkflows_hook` attribute on the method
-        """
-        cls = self.__class__
-        return {
+            info(f'Persisting state change to "{self.state.name}".')
+            bearer.previous_state = bearer.current_state
+            bearer.current_state = self.state.name
+            bearer.save(update_fields=['previous_state', 'current_state', 'updated_at'])
+
+            # Persist unassignment & (un)finalization in a single update
+            changes = {}
+            if bearer.unassign_after_transition and envelope.assigned_to_id is not None:
+                changes['assigned_to'] = None
+            if envelope.finalized != bearer.finished:
+                changes['finalized'] = bearer.finished
+            if changes:
+                changes['updated_at'] = timezone.now()
+                type(envelope)._base_manager.filter(pk=envelope.pk).update(**changes)
+                for field, value in changes.items():
+                    setattr(envelope, field, value)
+                envelope.tracker.set_saved_fields(
+                    fields=[envelope._meta.get_field(f).attname for f in changes])
+
+            if 'finalized' in changes:
+                if envelope.finalized:
+                    info(f'Envelope "{envelope.name}" has been finalized.')
+                else:
+                    info(f'Envelope "{envelope.name}" is no longer finalized.')
+
+            channel = envelope.channel
+            message = {
+                'type': f'envelope.{EnvelopeEvents.ENTERED_STATE.name}',
+                'data': {
+                    'previous_state': bearer.previous_state,
+                    'current_state': bearer.current_state,
+                    'finalized': envelope.finalized
+                }
+            }
+            transaction.on_commit(
+                lambda: async_to_sync(get_channel_layer().group_send)(channel, message)
+            )
+
+        # Transplant the transition & hook methods. XWorkflows methods are
+        # identified based on the effects of their decorators:
+        # - @transition wraps methods in a TransisionWrapper
+        # - hook decorators (@before|after_transition, @on_enter|leave_state)
+        #   set a `xworkflows_hook` attribute on the method
+        # The metaclass replaces them in `attrs`, so this dict must not be reused.
+        attrs = {
             fname: getattr(cls, fname)
             for fname in dir(cls)
             if callable(getattr(cls, fname)) and (
@@ -168,92 +260,70 @@ class BaseWorkflow(TypedModel):
                 hasattr(getattr(cls, fname), 'xworkflows_hook')
             )
         }
-
-    @cached_property
-    def xwf_enabled_cls_name(self):
-        """Builds a cleaned-up name for the inner XWorkflow-enabled class"""
-        pattern = re.compile('[\W_]+')
-        return f'XWFEnabled_{re.sub(pattern, "", self.name.capitalize())}'
+        attrs.update({
+            'state': workflow,
+            'bearer': None,
+            'automatic': False,
+            'transition_check': xwf.transition_check()(transition_check_if_assigned),
+            'post_transition': xwf.after_transition()(post_transition),
+            # XWorkflows needs __module__ set on the enabled class
+            '__module__': __name__
+        })
+        enabled_cls = type(f'XWFEnabled_{cls_name}', (xwf.WorkflowEnabled,), attrs)
+
+        # Transition names available from each state, ignoring checks
+        enabled_cls.transitions_from = {
+            state.name: [t.name for t in workflow.transitions.available_from(state)]
+            for state in workflow.states
+        }
+        return enabled_cls
 
     @property
     def xwf(self):
         """
-        Builds a workflow-enabled class and returns an instance set to the current state.
+        Returns an instance of the XWorkflow-enabled class, bound to this
+        workflow and set to its current state.
         """
-
-        def transition_check_if_assigned(self, *args, **kwargs):
-            return self.bearer.envelope.is_assigned
-
-        def post_transition(self, *args, **kwargs):
-            """After transition hook applied to all workflows"""
-
-            info(f'Persisting state change to "{self.state.name}".')
-            # Persist state
-            self.bearer.previous_state = self.bearer.current_state
-            self.bearer.current_state = self.state.name
-            self.bearer.save()
-            if self.bearer.unassign_after_transition:
-                self.bearer.envelope.assigned_to = None
-                self.bearer.envelope.save()
-            # Mark envelope as finazized when workflow is done
-            if self.bearer.finished:
-                self.bearer.envelope.finalized = True
-                self.bearer.envelope.save()
-                info(f'Envelope "{self.bearer.envelope.name}" has been finalized.')
-            elif self.bearer.envelope.finalized:
-                self.bearer.envelope.finalized = False
-                self.bearer.envelope.save()
-                info(f'Envelope "{self.bearer.envelope.name}" is no longer finalized.')
-
-            channel_layer = get_channel_layer()
-            payload = {
-                'previous_state': self.bearer.previous_state,
-                'current_state': self.bearer.current_state,
-                'finalized': self.bearer.envelope.finalized
-            }
-            async_to_sync(channel_layer.group_send)(
-                self.bearer.envelope.channel,
-                {
-                    'type': f'envelope.{EnvelopeEvents.ENTERED_STATE.name}',
-                    'data': payload
-                }
-            )
-
-        # Transplant the transition methods
-        attrs = self.xwf_methods
-        attrs.update(
-            {
-                'state': self.xwf_cls(),
-                'bearer': self,
-                'transition_check': xwf.transition_check()(transition_check_if_assigned),
-                'post_transition': xwf.after_transition()(post_transition),
-                # XWorkflows needs __module__ set on the enabled class
-                '__module__': __name__
-            }
-        )
-        cls = type(
-            self.xwf_enabled_cls_name,
-            (xwf.WorkflowEnabled,),
-            attrs)
-        wf = cls()
+        wf = self.get_xwf_enabled_cls()()
+        wf.bearer = self
         wf.state = self.current_state  # Force to current state
         return wf
 
-    def start_transition(self, name):
-        """Starts a transition on the inner XWorkflow"""
-        wf = self.xwf
-        if name not in [t.name for t in wf.state.workflow.transitions]:
-            raise self.TransitionDoesNotExist('Invalid transition name')
+    def lock_for_transition(self):
+        """
+        Locks the workflow and envelope rows until the end of the transaction,
+        and reloads the fields transitions depend on.
+        Concurrent transitions on the same envelope are thus serialized.
+        """
+        for obj, fields in ((self, ['previous_state', 'current_state']),
+                            (self.envelope, ['assigned_to', 'finalized'])):
+            list(type(obj)._base_manager.select_for_update().filter(pk=obj.pk).values_list('pk'))
+            obj.refresh_from_db(fields=fields)
+        self.envelope.tracker.set_saved_fields(fields=['assigned_to_id', 'finalized'])
+
+    def start_transition(self, name, automatic=False):
+        """
+        Starts a transition on the inner XWorkflow, atomically.
+        Transition events and notifications are only sent once committed.
+        `automatic` transitions are triggered by the system rather than
+        by the envelope's assignee, so they skip the assignment check.
+        """
+        with transaction.atomic():
+            self.lock_for_transition()
+            wf = self.xwf
+            wf.automatic = automatic
+            if name not in wf.state.workflow.transitions:
+                raise self.TransitionDoesNotExist('Invalid transition name')
 
-        if name not in [t.name for t in wf.state.transitions()]:
-            raise self.TransitionNotAvailable('Transition not allowed from current state')
+            if name not in wf.transitions_from[self.current_state]:
+                raise self.TransitionNotAvailable('Transition not allowed from current state')
 
-        transition = getattr(wf, name)
+            transition = getattr(wf, name)
 
-        if not transition.is_available():
-            raise self.TransitionNotAvailable('Transition checks not satisfied')
+            if not transition.is_available():
+                raise self.TransitionNotAvailable('Transition checks not satisfied')
 
-        transition()
+            transition()
 
     def to_json_graph(self):
         """
@@ -44,14 +44,7 @@ class DemoAutoQAWorkflow(BaseWorkflow):
     @xwf.transition()
     def send_to_qa(self):
         info(f'Sending envelope "{self.bearer.envelope.name}" to QA ...')
-        qa_jobs_count = len(self.bearer.submit_xml_to_qa())
-        info(f'QA started {qa_jobs_count} job(s) for envelope "{self.bearer.envelope.name}"')
-
-    @xwf.on_enter_state('auto_qa')
-    def on_enter_auto_qa(self, *args, **kwargs):
-        if len(self.bearer.envelope.auto_qa_jobs) == 0:
-            info('No QA jobs found on entering auto_qa state')
-            self.pass_qa()
+        self.bearer.submit_xml_to_qa()
 
     def handle_auto_qa_results(self):
         """
@@ -68,9 +61,8 @@ class DemoAutoQAWorkflow(BaseWorkflow):
 
         self.announce_auto_qa_status(EnvelopeEvents.COMPLETED_AUTO_QA)
         trans_name = 'pass_qa' if self.envelope.auto_qa_ok else 'fail_qa'
-        trans_meth = getattr(self.xwf, trans_name)
         info(f'Automatic transition "{trans_name}" triggered by Auto QA response(s)')
-        return trans_meth()
+        return self.start_transition(trans_name, automatic=True)
 
     @xwf.transition()
     def fail_qa(self):
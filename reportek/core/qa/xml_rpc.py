@@ -1,6 +1,8 @@
 import xmlrpc.client
 import logging
+from django.conf import settings
 
+from reportek.core.rpc import server_proxy
 from reportek.core.utils import bin_to_str, get_content_encoding, log_xmlrpc_errors
 
 log = logging.getLogger('reportek.qa')
@@ -9,6 +11,9 @@ debug = log.debug
 warn = log.warning
 error = log.error
 
+# URIs of QA servers found not to support `system.multicall`
+_multicall_unsupported_uris = set()
+
 
 class RemoteQA:
     """
@@ -22,7 +27,7 @@ class RemoteQA:
         """
         Validates the source XML file against the XML Schema or DOCTYPE defined within the XML file.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ValidationService.validate(file_url)
 
     @log_xmlrpc_errors(log)
@@ -30,7 +35,7 @@ class RemoteQA:
         """
         Validates the source XML file against the specified XML Schema.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.ValidationService.validateSchema(file_url, xml_schema)
 
     @log_xmlrpc_errors(log)
@@ -41,7 +46,7 @@ class RemoteQA:
         Args:
             files (dict): Mapping of XML schemas to lists of file URLs.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             response = proxy.XQueryService.analyzeXMLFiles(files)
             debug(f'QA analyzeXMLFiles response: {response}')
             return response or []
@@ -51,7 +56,7 @@ class RemoteQA:
         """
         Analyses an XML file using the given XQuery script.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.XQueryService.analyze(file_url, xquery_script)
 
     @log_xmlrpc_errors(log)
@@ -59,11 +64,62 @@ class RemoteQA:
         """
         Returns the result of QA for given job ID.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             response = proxy.XQueryService.getResult(str(job_id))
             debug(f'QA getResult({job_id}) response: {response}')
             return response
 
+    def get_job_results(self, job_ids, chunk_size=None):
+        """
+        Returns the results of QA for several job IDs, as a dict mapping
+        each job ID to its result, or `None` if it could not be fetched.
+
+        Results are fetched in chunks of `QA_MULTICALL_CHUNK_SIZE` jobs,
+        with a single `system.multicall` request per chunk where the server
+        supports it, or one call per job over the same connection otherwise.
+        """
+        chunk_size = chunk_size or settings.QA_MULTICALL_CHUNK_SIZE
+        job_ids = list(job_ids)
+        results = dict.fromkeys(job_ids)
+        for idx in range(0, len(job_ids), chunk_size):
+            chunk = job_ids[idx:idx + chunk_size]
+            results.update(self._get_job_results_chunk(chunk) or {})
+        return results
+
+    @log_xmlrpc_errors(log)
+    def _get_job_results_chunk(self, job_ids):
+        with server_proxy(self.uri) as proxy:
+            if self.uri not in _multicall_unsupported_uris:
+                multicall = xmlrpc.client.MultiCall(proxy)
+                for job_id in job_ids:
+                    multicall.XQueryService.getResult(str(job_id))
+                try:
+                    responses = multicall()
+                except xmlrpc.client.Fault as err:
+                    # A fault for the whole call means multicall is not available
+                    warn(f'QA server {self.uri} does not support system.multicall '
+                         f'({err.faultString}), falling back to single calls')
+                    _multicall_unsupported_uris.add(self.uri)
+                else:
+                    return dict(zip(job_ids, self._iter_multicall_results(responses, job_ids)))
+
+            results = {}
+            for job_id in job_ids:
+                try:
+                    results[job_id] = proxy.XQueryService.getResult(str(job_id))
+                except xmlrpc.client.Fault as err:
+                    error(f'QA getResult({job_id}) fault: code={err.faultCode}, error={err.faultString}')
+            return results
+
+    @staticmethod
+    def _iter_multicall_results(responses, job_ids):
+        for idx, job_id in enumerate(job_ids):
+            try:
+                yield responses[idx]
+            except xmlrpc.client.Fault as err:
+                error(f'QA getResult({job_id}) fault: code={err.faultCode}, error={err.faultString}')
+                yield None
+
     @log_xmlrpc_errors(log)
     def get_scripts(self, xml_schema):
         """
@@ -74,7 +130,7 @@ class RemoteQA:
             `last_updated`
             `max_size`
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             scripts = proxy.XQueryService.listQAScripts(xml_schema)
             scripts = scripts or []
             return [
@@ -87,7 +143,7 @@ class RemoteQA:
         """
         Returns the list of available QA rules for one particular schema.
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             return proxy.XQueryService.listQueries(xml_schema)
 
     @log_xmlrpc_errors(log)
@@ -100,7 +156,7 @@ class RemoteQA:
             `feedback_status`
             `feedback_message`
         """
-        with xmlrpc.client.ServerProxy(self.uri) as proxy:
+        with server_proxy(self.uri) as proxy:
             result = proxy.XQueryService.runQAScript(file_url, script_id)
             if result:
                 encoding = get_content_encoding(result[0]) or 'utf-8'
@@ -0,0 +1,334 @@
+"""
+Pooled XML-RPC connections to the QA and conversion (XMLCONV) servers.
+
+Each process keeps, per server URI, a pool of transports holding HTTP/1.1
+keep-alive connections, so consecutive calls skip connection setup.
+The number of concurrent calls per URI is bounded by ``XMLRPC_POOL_SIZE``,
+and calls time out after ``XMLRPC_CONNECT_TIMEOUT`` seconds when connecting,
+or ``XMLRPC_READ_TIMEOUT`` seconds waiting on the server.
+
+Call latencies are logged, and aggregated per URI and method
+(see ``get_call_stats()``).
+
+Proxies opened with ``stream_binary=True`` decode base64 values to temporary
+files while the response is read, and return them as ``BinaryFile``s,
+so large conversion results are never held in memory.
+"""
+import os
+import re
+import gzip
+import time
+import queue
+import binascii
+import tempfile
+import logging
+import threading
+import http.client
+import xmlrpc.client
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files import File
+
+
+__all__ = [
+    'BinaryFile',
+    'PoolTimeout',
+    'server_proxy',
+    'get_call_stats',
+]
+
+log = logging.getLogger('reportek.rpc')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+class PoolTimeout(ConnectionError):
+    """No pooled connection became available in time."""
+
+
+class _TimeoutsMixin:
+    """
+    Applies the connect timeout while connecting, and the read timeout
+    to the established socket.
+    """
+    read_timeout = None
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+
+class _HTTPConnection(_TimeoutsMixin, http.client.HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_TimeoutsMixin, http.client.HTTPSConnection):
+    pass
+
+
+class BinaryFile(File):
+    """
+    Base64 value of a streamed XML-RPC response, decoded to a temporary file.
+    Stands in for ``xmlrpc.client.Binary``; the file is removed once closed.
+    """
+
+
+class _Base64Spool:
+    """
+    Decodes base64 text, as it is received, to a temporary file.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+        self.pending = ''
+
+    def write(self, text):
+        # Only whole 4-character groups can be decoded
+        text = self.pending + ''.join(text.split())
+        end = len(text) - len(text) % 4
+        self.pending = text[end:]
+        if end:
+            self.file.write(binascii.a2b_base64(text[:end]))
+
+    def close(self):
+        if self.pending:
+            # Raises binascii.Error on truncated payloads
+            self.file.write(binascii.a2b_base64(self.pending))
+        self.file.seek(0)
+        return BinaryFile(self.file)
+
+
+class _StreamingUnmarshaller(xmlrpc.client.Unmarshaller):
+    """
+    Unmarshaller spooling ``<base64>`` values to ``BinaryFile``s.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spool = None
+
+    def start(self, tag, attrs):
+        super().start(tag, attrs)
+        if tag.split(':')[-1] == 'base64':
+            self._spool = _Base64Spool()
+
+    def data(self, text):
+        if self._spool is not None:
+            self._spool.write(text)
+        else:
+            super().data(text)
+
+    def end(self, tag):
+        if self._spool is not None and tag.split(':')[-1] == 'base64':
+            spool, self._spool = self._spool, None
+            self.append(spool.close())
+            self._value = 0
+        else:
+            super().end(tag)
+
+
+METHOD_NAME_RE = re.compile(rb'<methodName>([^<]*)</methodName>')
+
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+
+class _PooledTransportMixin:
+    """
+    Transport keeping its connection open between calls, with timeouts
+    and latency metrics.
+    """
+    connection_class = None
+    # Set while the transport is used by a streaming proxy
+    stream_binary = False
+
+    def __init__(self, *args, uri=None, connect_timeout=None, read_timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uri = uri
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def get_connection_kwargs(self, x509):
+        return {}
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        conn = self.connection_class(chost, timeout=self.connect_timeout,
+                                     **self.get_connection_kwargs(x509))
+        conn.read_timeout = self.read_timeout
+        self._connection = host, conn
+        return conn
+
+    def getparser(self):
+        if not self.stream_binary:
+            return super().getparser()
+        unmarshaller = _StreamingUnmarshaller(
+            use_datetime=self._use_datetime,
+            use_builtin_types=self._use_builtin_types
+        )
+        return xmlrpc.client.ExpatParser(unmarshaller), unmarshaller
+
+    def parse_response(self, response):
+        # Unlike the stock transport, gzipped responses are decompressed
+        # as they are read, instead of being buffered whole in memory.
+        if response.getheader('Content-Encoding', '') == 'gzip':
+            stream = gzip.GzipFile(fileobj=response, mode='rb')
+        else:
+            stream = response
+
+        parser, unmarshaller = self.getparser()
+        while True:
+            data = stream.read(RESPONSE_CHUNK_SIZE)
+            if not data:
+                break
+            if self.verbose:
+                print('body:', repr(data))
+            parser.feed(data)
+
+        if stream is not response:
+            stream.close()
+        parser.close()
+        return unmarshaller.close()
+
+    def request(self, host, handler, request_body, verbose=False):
+        match = METHOD_NAME_RE.search(request_body)
+        method = match.group(1).decode() if match else '?'
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = super().request(host, handler, request_body, verbose=verbose)
+            failed = False
+            return response
+        except xmlrpc.client.Fault:
+            # The call went through, the server reported an error
+            failed = False
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _record_call(self.uri, method, elapsed, failed)
+            debug(f'XMLRPC {self.uri} {method}: {elapsed:.3f}s{" (failed)" if failed else ""}')
+
+
+class _Transport(_PooledTransportMixin, xmlrpc.client.Transport):
+    connection_class = _HTTPConnection
+
+
+class _SafeTransport(_PooledTransportMixin, xmlrpc.client.SafeTransport):
+    connection_class = _HTTPSConnection
+
+    def get_connection_kwargs(self, x509):
+        return dict(context=self.context, **(x509 or {}))
+
+
+class _TransportPool:
+    """
+    Transports for one server URI. Idle transports are reused most recently
+    used first, so surplus keep-alive connections are left to expire.
+    """
+
+    def __init__(self, uri, size, timeout, connect_timeout, read_timeout):
+        self.uri = uri
+        self.timeout = timeout
+        self.transport_class = _SafeTransport if urlsplit(uri).scheme == 'https' else _Transport
+        self.transport_kwargs = dict(
+            uri=uri,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout
+        )
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def transport(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No XMLRPC connection to {self.uri} available after {self.timeout}s')
+        try:
+            try:
+                transport = self.idle.get_nowait()
+            except queue.Empty:
+                transport = self.transport_class(**self.transport_kwargs)
+            try:
+                yield transport
+            finally:
+                # Transports drop their connection themselves on errors
+                self.idle.put(transport)
+        finally:
+            self.slots.release()
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def _get_pool(uri):
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Connections must not be shared with a forked parent process
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(uri)
+        if pool is None:
+            pool = _pools[uri] = _TransportPool(
+                uri,
+                size=settings.XMLRPC_POOL_SIZE,
+                timeout=settings.XMLRPC_POOL_TIMEOUT,
+                connect_timeout=settings.XMLRPC_CONNECT_TIMEOUT,
+                read_timeout=settings.XMLRPC_READ_TIMEOUT
+            )
+        return pool
+
+
+@contextmanager
+def server_proxy(uri, stream_binary=False, **kwargs):
+    """
+    Context manager providing a ``ServerProxy`` for ``uri`` over a pooled connection.
+    With ``stream_binary``, base64 values are returned as ``BinaryFile``s,
+    which callers should close.
+    Raises ``PoolTimeout`` if all the connections to ``uri`` stay busy
+    for ``XMLRPC_POOL_TIMEOUT`` seconds.
+    """
+    with _get_pool(uri).transport() as transport:
+        transport.stream_binary = stream_binary
+        try:
+            yield xmlrpc.client.ServerProxy(uri, transport=transport, **kwargs)
+        finally:
+            transport.stream_binary = False
+
+
+CallStats = namedtuple('CallStats', ['count', 'failed', 'total_time', 'max_time'])
+CallStats.__doc__ = """
+Aggregated XML-RPC calls of a method: number of calls, of failed calls
+(not counting faults), and total and maximum duration in seconds.
+"""
+
+_call_stats = {}
+_call_stats_lock = threading.Lock()
+
+
+def _record_call(uri, method, elapsed, failed):
+    with _call_stats_lock:
+        stats = _call_stats.get((uri, method), CallStats(0, 0, 0.0, 0.0))
+        _call_stats[(uri, method)] = CallStats(
+            count=stats.count + 1,
+            failed=stats.failed + failed,
+            total_time=stats.total_time + elapsed,
+            max_time=max(stats.max_time, elapsed)
+        )
+
+
+def get_call_stats():
+    """
+    Returns the ``CallStats`` of calls made by the current process,
+    as a dict keyed by (URI, method name).
+    """
+    with _call_stats_lock:
+        return dict(_call_stats)
@@ -0,0 +1,110 @@
+"""
+Cached listings of the QA scripts and conversions available per XML schema.
+
+Listings are fetched from the QA/conversion XML-RPC servers and kept in the
+``script_listings`` Django cache (shared by all processes), keyed by server
+URI and schema. Listings older than ``SCRIPT_LISTINGS_TTL`` seconds are still
+served, while being refreshed in the background, until
+``SCRIPT_LISTINGS_MAX_AGE`` seconds after they were fetched.
+
+All listings of a server are invalidated at once (see ``invalidate()``)
+by bumping the server's cache generation, which is part of the keys.
+"""
+import time
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from reportek.core.qa import RemoteQA
+from reportek.core.conversion import RemoteConversion
+
+
+__all__ = [
+    'KINDS',
+    'get_listing',
+    'fetch_listing',
+    'invalidate',
+]
+
+log = logging.getLogger('reportek.script_listings')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+def _cache():
+    return caches['script_listings']
+
+
+# Listing kinds, mapped to the remote method fetching them for a schema
+KINDS = {
+    'qa_scripts': lambda uri, schema: RemoteQA(uri).get_scripts(schema),
+    'conversions': lambda uri, schema: RemoteConversion(uri).get_conversions(schema),
+}
+
+
+def _digest(*parts):
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+def _generation_key(uri):
+    return f'script-listings:generation:{_digest(uri)}'
+
+
+def _get_generation(uri):
+    return _cache().get_or_set(_generation_key(uri), 0, timeout=None)
+
+
+def _listing_key(kind, uri, schema, generation):
+    return f'script-listings:{kind}:{generation}:{_digest(uri, schema)}'
+
+
+def fetch_listing(kind, uri, schema):
+    """
+    Fetches a listing from the remote server and caches it.
+    Returns the listing, or `None` if the remote call failed.
+    """
+    items = KINDS[kind](uri, schema)
+    if items is None:
+        return None
+
+    key = _listing_key(kind, uri, schema, _get_generation(uri))
+    _cache().set(key, (time.time(), items), timeout=settings.SCRIPT_LISTINGS_MAX_AGE)
+    debug(f'Cached {kind} listing for {schema} from {uri}: {len(items)} item(s)')
+    return items
+
+
+def get_listing(kind, uri, schema):
+    """
+    Returns the listing of ``kind`` ('qa_scripts' or 'conversions')
+    available on the server at ``uri`` for ``schema``.
+    Cache misses are fetched right away, expired listings are refreshed
+    in the background. Returns an empty list if the listing is not
+    cached and cannot be fetched.
+    """
+    key = _listing_key(kind, uri, schema, _get_generation(uri))
+    entry = _cache().get(key)
+    if entry is None:
+        return fetch_listing(kind, uri, schema) or []
+
+    fetched_at, items = entry
+    if time.time() - fetched_at > settings.SCRIPT_LISTINGS_TTL:
+        # Only one refresh is queued per listing at a time
+        if _cache().add(f'{key}:refreshing', True, timeout=settings.SCRIPT_LISTINGS_TTL):
+            # imported here, as the tasks module imports this one
+            from reportek.core.tasks import refresh_script_listing
+            refresh_script_listing.delay(kind, uri, schema)
+    return items
+
+
+def invalidate(uri):
+    """
+    Invalidates all the cached listings of the server at ``uri``.
+    """
+    key = _generation_key(uri)
+    _cache().add(key, 0, timeout=None)
+    _cache().incr(key)
+    info(f'Invalidated cached script listings for {uri}')
@@ -0,0 +1,201 @@
+"""
+QA scripts and conversions run on demand against envelope files.
+
+Runs requested through the API are recorded as ``ScriptRunJob``s and processed
+here, from a Celery task, so that requests don't wait on the remote server.
+Results are stored on disk under ``SCRIPT_RUNS_ROOT`` for download, and the
+outcome of each run is announced on the envelope's WebSocket channel.
+"""
+import os
+import errno
+import shutil
+import logging
+import mimetypes
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from reportek.core.consumers.envelope import EnvelopeEvents
+from reportek.core.conversion import RemoteConversion, ConversionCache
+from reportek.core.disk_cache import DiskCache
+from reportek.core.qa import RemoteQA
+from reportek.core.utils import get_content_encoding
+
+from .ingestion import announce
+from .models import ScriptRunJob
+
+log = logging.getLogger('reportek.script_runs')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+
+class ScriptRunError(Exception):
+    pass
+
+
+def write_result(job, chunks):
+    """
+    Writes the result of ``job`` (an iterable of byte chunks) to disk.
+    The result only becomes visible once completely written.
+    """
+    DiskCache.write_file(job.result_path, chunks)
+
+
+def link_result(job, path):
+    """
+    Uses the file at ``path`` as the result of ``job``, hard-linked if possible.
+    """
+    result_path = job.result_path
+    os.makedirs(str(result_path.parent), exist_ok=True)
+    try:
+        os.link(str(path), str(result_path))
+    except OSError as err:
+        if err.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        shutil.copyfile(str(path), str(result_path))
+
+
+def use_cached_conversion(job):
+    """
+    Sets the result of a conversion job from the conversion cache.
+    Returns `False` on a cache miss.
+    """
+    sha256 = job.envelope_file.sha256
+    if job.kind != ScriptRunJob.KINDS.CONVERSION.value or not sha256:
+        return False
+
+    cache = ConversionCache()
+    key = cache.get_key(sha256, job.script_id)
+    meta = cache.get_meta(key)
+    if meta is None:
+        return False
+    try:
+        link_result(job, cache.get_path(key))
+    except FileNotFoundError:
+        # evicted meanwhile
+        return False
+
+    job.content_type = meta['content-type']
+    job.filename = meta['filename']
+    debug(f'SCRIPT RUN job {job.pk} result taken from the conversion cache')
+    return True
+
+
+def run_qa_script(job, uri, file_url):
+    result = RemoteQA(uri).run_script(file_url, job.script_id)
+    if not result:
+        raise ScriptRunError('QA script run failed')
+
+    content_type = result['content-type']
+    encoding = get_content_encoding(content_type) or 'utf-8'
+    extension = mimetypes.guess_extension(content_type.split(';')[0].strip()) or '.txt'
+    job.content_type = content_type
+    job.filename = f'{Path(job.envelope_file.name).stem}_qa_{job.script_id}{extension}'
+    job.feedback_status = result['feedback_status']
+    job.feedback_message = result['feedback_message'][:200]
+    write_result(job, [result['result'].encode(encoding, errors='replace')])
+
+
+def run_conversion(job, uri, file_url):
+    if use_cached_conversion(job):
+        return
+
+    result = RemoteConversion(uri).convert_xml(file_url, job.script_id)
+    if not result:
+        raise ScriptRunError('Conversion failed')
+
+    job.content_type = result['content-type']
+    job.filename = result['filename']
+    sha256 = job.envelope_file.sha256
+    with result['content'] as content:
+        if sha256:
+            cache = ConversionCache()
+            path = cache.put(
+                cache.get_key(sha256, job.script_id),
+                content,
+                job.content_type,
+                job.filename
+            )
+            link_result(job, path)
+        else:
+            write_result(job, content.chunks())
+
+
+RUNNERS = {
+    ScriptRunJob.KINDS.QA.value: run_qa_script,
+    ScriptRunJob.KINDS.CONVERSION.value: run_conversion,
+}
+
+
+def run_script_job(job):
+    """
+    Processes a pending ``ScriptRunJob``, and announces its outcome.
+    """
+    if job.status != ScriptRunJob.STATUSES.PENDING.value:
+        warn(f'SCRIPT RUN job {job.pk} already processed, status: {job.status}')
+        return
+
+    envelope_file = job.envelope_file
+    envelope = envelope_file.envelope
+    job.status = ScriptRunJob.STATUSES.RUNNING.value
+    job.save(update_fields=['status', 'updated_at'])
+
+    try:
+        RUNNERS[job.kind](job, envelope.obligation_spec.qa_xmlrpc_uri, envelope_file.fq_download_url)
+    except Exception as err:
+        if isinstance(err, ScriptRunError):
+            error(f'SCRIPT RUN job {job.pk} failed: {err}')
+        else:
+            log.exception(f'SCRIPT RUN job {job.pk} failed')
+        job.status = ScriptRunJob.STATUSES.FAILED.value
+        job.error = str(err)[:500]
+        job.save()
+        event = EnvelopeEvents.FAILED_SCRIPT_RUN
+    else:
+        job.status = ScriptRunJob.STATUSES.COMPLETED.value
+        job.save()
+        info(f'SCRIPT RUN job {job.pk} completed: {job}')
+        event = EnvelopeEvents.COMPLETED_SCRIPT_RUN
+
+    announce(envelope, event, {
+        'job_id': job.pk,
+        'file_id': envelope_file.pk,
+        'kind': job.kind,
+        'script_id': job.script_id,
+        'status': job.status,
+        'feedback_status': job.feedback_status,
+        'feedback_message': job.feedback_message,
+        'error': job.error,
+    })
+
+
+def sweep_script_runs():
+    """
+    Removes jobs older than ``SCRIPT_RUNS_MAX_AGE`` seconds with their results,
+    and results left behind by deleted jobs. Returns the number of removed jobs.
+    """
+    cutoff = timezone.now() - timezone.timedelta(seconds=settings.SCRIPT_RUNS_MAX_AGE)
+    old_jobs = ScriptRunJob.objects.filter(updated_at__lt=cutoff)
+    removed = 0
+    for job in old_jobs.iterator():
+        job.delete()
+        removed += 1
+
+    root = Path(settings.SCRIPT_RUNS_ROOT)
+    result_names = {path.name for path in root.glob('*.result')}
+    if result_names:
+        job_ids = ScriptRunJob.objects.filter(
+            pk__in=[name.split('.')[0] for name in result_names]
+        ).values_list('pk', flat=True)
+        for name in result_names - {f'{pk}.result' for pk in job_ids}:
+            try:
+                (root / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    if removed:
+        info(f'Removed {removed} script run job(s)')
+    return removed
@@ -25,6 +25,7 @@ from .models import (
     UploadToken,
     QAJob,
     QAJobResult,
+    ScriptRunJob,
     ReportekUser,
 )
 
@@ -205,19 +206,33 @@ class PendingObligationSerializer(serializers.ModelSerializer):
                   'updated_at', 'reporting_cycles')
 
 
+# Fields common to envelope, original and support files
+BASE_FILE_FIELDS = ('id', 'name', 'content_url', 'restricted', 'uploader',
+                    'size', 'sha256', 'content_modified', 'created', 'updated')
+BASE_FILE_READ_ONLY_FIELDS = ('content', 'uploader', 'size', 'sha256', 'content_modified',
+                              'created', 'updated')
+# Outcome of the local XSD validation, only recorded on envelope files
+XML_VALIDATION_FIELDS = ('xml_validation', 'xml_validation_errors')
+
+
 class EnvelopeFileSerializer(serializers.ModelSerializer):
     uploader = serializers.PrimaryKeyRelatedField(read_only=True)
     content_url = serializers.SerializerMethodField()
+    size = serializers.SerializerMethodField()
 
     class Meta:
         model = EnvelopeFile
-        fields = ('id', 'name', 'content_url', 'restricted', 'uploader', 'size', 'created', 'updated')
-        read_only_fields = ('content', 'uploader', 'size', 'created', 'updated')
+        fields = BASE_FILE_FIELDS + XML_VALIDATION_FIELDS
+        read_only_fields = BASE_FILE_READ_ONLY_FIELDS + XML_VALIDATION_FIELDS
 
     @staticmethod
     def get_content_url(obj):
         return obj.fq_download_url
 
+    @staticmethod
+    def get_size(obj):
+        return obj.get_size()
+
 
 class NestedEnvelopeFileSerializer(NestedHyperlinkedModelSerializer,
                                    EnvelopeFileSerializer):
@@ -244,12 +259,16 @@ class EnvelopeOriginalFileSerializer(EnvelopeFileSerializer):
 
     class Meta(EnvelopeFileSerializer.Meta):
         model = EnvelopeOriginalFile
+        fields = BASE_FILE_FIELDS
+        read_only_fields = BASE_FILE_READ_ONLY_FIELDS
 
 
 class NestedEnvelopeOriginalFileSerializer(NestedEnvelopeFileSerializer):
 
     class Meta(NestedEnvelopeFileSerializer.Meta):
         model = EnvelopeOriginalFile
+        fields = ('url', ) + BASE_FILE_FIELDS
+        read_only_fields = BASE_FILE_READ_ONLY_FIELDS
         extra_kwargs = {
             'url': {
                 'view_name': 'api:envelope-original-file-detail',
@@ -266,12 +285,16 @@ class EnvelopeSupportFileSerializer(EnvelopeFileSerializer):
 
     class Meta(EnvelopeFileSerializer.Meta):
         model = EnvelopeSupportFile
+        fields = BASE_FILE_FIELDS
+        read_only_fields = BASE_FILE_READ_ONLY_FIELDS
 
 
 class NestedEnvelopeSupportFileSerializer(NestedEnvelopeFileSerializer):
 
     class Meta(NestedEnvelopeFileSerializer.Meta):
         model = EnvelopeOriginalFile
+        fields = ('url', ) + BASE_FILE_FIELDS
+        read_only_fields = BASE_FILE_READ_ONLY_FIELDS
         extra_kwargs = {
             'url': {
                 'view_name': 'api:envelope-support-file-detail',
@@ -379,12 +402,16 @@ class EnvelopeSerializer(serializers.ModelSerializer):
 
 
 class QAJobResultSerializer(serializers.ModelSerializer):
+    """
+    QA job result summary. Result bodies are fetched on demand, from
+    the result's ``body`` route.
+    """
     code = serializers.CharField(source='get_code_display')
     feedback_status = serializers.CharField(source='get_feedback_status_display')
 
     class Meta:
         model = QAJobResult
-        fields = '__all__'
+        exclude = ('value',)
 
 
 class QAJobSerializer(serializers.ModelSerializer):
@@ -395,6 +422,13 @@ class QAJobSerializer(serializers.ModelSerializer):
         fields = ['latest_result'] + [f.name for f in QAJob._meta.fields]
 
 
+class ScriptRunJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ScriptRunJob
+        fields = '__all__'
+
+
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = Group
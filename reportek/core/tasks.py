@@ -1,12 +1,17 @@
 import logging
 from collections import defaultdict
-from celery import group, chord
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
 from reportek.site.celery import app
 
 import reportek.core.models  # avoid circular import errors
 
 from reportek.core.qa import RemoteQA
+from reportek.core.conversion import ConversionCache
+from reportek.core.archives import ArchiveCache, ZipStream, get_envelope_files_entries
+from reportek.core import script_listings
 from reportek.core.utils import fully_qualify_url
 
 log = logging.getLogger('reportek.tasks')
@@ -17,97 +22,282 @@ error = log.error
 
 
 @app.task(ignore_result=True)
-def submit_xml_to_qa(envelope_pk):
+def ingest_upload(job_pk):
     """
-    Sends an envelope's XML files to remote QA, for batch analysis.
+    Ingests a finished tusd upload into its envelope, as recorded
+    by the ``post-finish`` upload hook.
     """
+    # imported here, as the ingestion module needs the models fully loaded
+    from reportek.core.ingestion import ingest_upload as _ingest_upload
+
+    job = reportek.core.models.UploadIngestionJob.objects.get(pk=job_pk)
+    return _ingest_upload(job)
+
 
+@app.task(ignore_result=True)
+def cache_envelope_archive(envelope_pk, file_ids):
+    """
+    Builds and caches the archive of a finalized envelope's files.
+    """
     envelope = reportek.core.models.Envelope.objects.get(pk=envelope_pk)
-    remote_qa = RemoteQA(
-        envelope.obligation_spec.qa_xmlrpc_uri
-    )
+    if not envelope.finalized:
+        warn(f'Not caching archive of envelope "{envelope}" - envelope is not final')
+        return
+
+    files = list(envelope.files.filter(pk__in=file_ids))
+    cache = ArchiveCache()
+    key = cache.get_key(envelope_pk, files)
+    try:
+        if cache.get(key) is None:
+            cache.put(key, ZipStream(get_envelope_files_entries(files)))
+    finally:
+        cache.release_build_lock(key)
+
+
+@app.task(ignore_result=True)
+def sweep_archive_cache():
+    """
+    Scheduled task evicting least recently used archives from the cache.
+    """
+    ArchiveCache().sweep()
+
+
+@app.task(ignore_result=True)
+def run_script_job(job_pk):
+    """
+    Runs a QA script or conversion requested on an envelope file.
+    """
+    # imported here, as the script runs module needs the models fully loaded
+    from reportek.core.script_runs import run_script_job as _run_script_job
+
+    job = reportek.core.models.ScriptRunJob.objects.select_related(
+        'envelope_file__envelope__obligation_spec'
+    ).get(pk=job_pk)
+    _run_script_job(job)
+
+
+@app.task(ignore_result=True)
+def sweep_script_runs():
+    """
+    Scheduled task removing old script run jobs and their results.
+    """
+    from reportek.core.script_runs import sweep_script_runs as _sweep_script_runs
+
+    _sweep_script_runs()
+
+
+@app.task(ignore_result=True)
+def refresh_script_listing(kind, uri, schema):
+    """
+    Refreshes a cached listing of QA scripts or conversions for a schema.
+    """
+    script_listings.fetch_listing(kind, uri, schema)
+
+
+@app.task(ignore_result=True)
+def sweep_conversion_cache():
+    """
+    Scheduled task evicting least recently used conversion results from the cache.
+    """
+    ConversionCache().sweep()
+
+
+@app.task(ignore_result=True)
+def submit_xml_to_qa(envelope_pk, submission_id=None):
+    """
+    Sends an envelope's XML files to remote QA, for batch analysis.
+
+    QA is incremental: the jobs of files whose checksum and schema are
+    unchanged since they were submitted are carried forward, with their
+    results, and only new or modified files are submitted.
+
+    Submissions are also idempotent: an envelope whose XML files are unchanged
+    since a submission with the same ``submission_id`` less than
+    ``QA_SUBMISSION_KEY_TTL`` seconds ago (e.g. when the task is redelivered)
+    is not submitted again. The submission
+    is marked as in progress under a short lock, the remote call runs outside
+    any transaction, and the returned jobs are recorded in a second one.
+
+    Files are validated against their schemas locally first (unless already
+    validated on ingestion), and files failing validation are not submitted.
+
+    The QA results handler runs right away if there are no QA jobs to wait for,
+    e.g. when all results were carried forward.
+
+    Returns the envelope's jobs as ``(job_id, file_url, script_id, script_name)`` tuples.
+    """
+    QAJob = reportek.core.models.QAJob
+    EnvelopeQASummary = reportek.core.models.EnvelopeQASummary
+    EnvelopeFile = reportek.core.models.EnvelopeFile
+
+    envelope = reportek.core.models.Envelope.objects.select_related(
+        'obligation_spec'
+    ).get(pk=envelope_pk)
+    # only consider XML files
+    files = [file for file in envelope.files.all() if file.xml_schema is not None]
+    submission_key = EnvelopeQASummary.get_submission_key(files, submission_id)
+
+    # e.g. files uploaded through the API, or whose schema was unavailable
+    for file in files:
+        if file.xml_validation in (None, EnvelopeFile.XML_VALIDATION_STATUSES.UNAVAILABLE.value):
+            file.validate_xml()
+            if file.xml_validation is not None:
+                # unless replaced meanwhile
+                EnvelopeFile.objects.filter(pk=file.pk, sha256=file.sha256).update(
+                    xml_validation=file.xml_validation,
+                    xml_validation_errors=file.xml_validation_errors
+                )
+
+    def get_jobs():
+        return [
+            (job.qa_job_id, job.envelope_file.fq_download_url, job.qa_script_id, job.qa_script_name)
+            for job in QAJob.objects.filter(envelope_file__in=files).select_related('envelope_file')
+        ]
+
+    submitted_at = timezone.now()
+    summary_qs = EnvelopeQASummary.objects.filter(envelope=envelope)
+    with transaction.atomic():
+        # Serializes the submissions of the envelope, until the submission is
+        # marked as in progress. No lock is held during the remote call.
+        summary, _ = EnvelopeQASummary.objects.select_for_update().get_or_create(envelope=envelope)
+        if summary.is_submitted(submission_key):
+            info(f'QA submission of envelope "{envelope}" skipped - XML files unchanged')
+            return get_jobs()
+        if submission_key is not None:
+            summary_qs.update(submission_key=submission_key, submitted_at=submitted_at)
+
+    jobs_by_file = defaultdict(list)
+    for job in QAJob.objects.filter(envelope_file__in=files):
+        jobs_by_file[job.envelope_file_id].append(job)
 
     params = defaultdict(list)
     urls_to_files = {}
-    for file in envelope.files.all():
-        if file.xml_schema is not None:  # only consider XML files
-            file.qa_jobs.all().delete()  # delete existing jobs and results
-            xml_schema = file.xml_schema.split(' ')[0]  # use the first schema listed in file
-            file_url = file.fq_download_url
-            params[xml_schema].append(file_url)
-            urls_to_files[file_url] = file.pk
-
-    params = dict(params)  # XMLRPC cannot marshall defaultdicts
+    invalid_files = []
+    for file in files:
+        if file.xml_validation in EnvelopeFile.XML_VALIDATION_FAILURES:
+            invalid_files.append(file)
+            continue
+        xml_schema = file.xml_schema.split(' ')[0]  # use the first schema listed in file
+        file_jobs = jobs_by_file.get(file.pk)
+        if file_jobs and all(job.is_current(file, xml_schema) for job in file_jobs):
+            continue
+        file_url = file.fq_download_url
+        params[xml_schema].append(file_url)
+        urls_to_files[file_url] = file
+
+    if invalid_files:
+        info(f'{len(invalid_files)} XML file(s) of envelope "{envelope}" '
+             f'failed XSD validation - not submitted to QA')
+
+    # Failed submissions are retried in full
+    in_progress = summary_qs.filter(submission_key=submission_key, submitted_at=submitted_at)
     if params:
-        jobs = remote_qa.analyze_xml_files(params) or []
-        for job_id, file_url, script_id, script_name in jobs:
-            try:
-                file = reportek.core.models.EnvelopeFile.objects.get(pk=urls_to_files.get(file_url))
-                qa_job = reportek.core.models.QAJob.objects.create(
-                        envelope_file=file,
-                        qa_job_id=job_id,
-                        qa_script_id=script_id,
-                        qa_script_name=script_name
-                )
-            except reportek.core.models.EnvelopeFile.DoesNotExist:
-                continue
+        info(f'Submitting {len(urls_to_files)} of {len(files)} XML file(s) '
+             f'of envelope "{envelope}" to QA')
+        try:
+            # XMLRPC cannot marshall defaultdicts
+            jobs = RemoteQA(envelope.obligation_spec.qa_xmlrpc_uri).analyze_xml_files(dict(params))
+        except Exception:
+            in_progress.update(submission_key='')
+            raise
     else:
+        info(f'QA results of envelope "{envelope}" carried forward - XML files unchanged')
         jobs = []
 
-    return jobs
+    with transaction.atomic():
+        summary = EnvelopeQASummary.objects.select_for_update().get(envelope=envelope)
+        if submission_key is not None and \
+                (summary.submission_key, summary.submitted_at) != (submission_key, submitted_at):
+            info(f'QA submission of envelope "{envelope}" superseded - jobs not recorded')
+            return get_jobs()
 
+        QAJob.objects.filter(envelope_file__in=invalid_files).delete()
+        if jobs is None:
+            in_progress.update(submission_key='')
+        else:
+            # files deleted during the submission are skipped
+            existing = set(
+                EnvelopeFile.objects.filter(
+                    pk__in=[f.pk for f in urls_to_files.values()]
+                ).values_list('pk', flat=True)
+            )
+            # replace the outdated jobs, and their results
+            QAJob.objects.filter(envelope_file__in=list(urls_to_files.values())).delete()
+            QAJob.objects.bulk_create(
+                QAJob(
+                    envelope_file=urls_to_files[file_url],
+                    qa_job_id=job_id,
+                    qa_script_id=script_id,
+                    qa_script_name=script_name,
+                    file_sha256=urls_to_files[file_url].sha256,
+                    xml_schema=urls_to_files[file_url].xml_schema.split(' ')[0]
+                )
+                for job_id, file_url, script_id, script_name in jobs
+                if file_url in urls_to_files and urls_to_files[file_url].pk in existing
+            )
+        EnvelopeQASummary.recompute(envelope)
 
-@app.task(ignore_result=False)
-def get_qa_result(job_id):
-    """
-    Gets the result of a QA job.
-    The corresponding `QAJobResult` will be created or updated.
-    Returns:
-        A tuple of the envelope id and `QAJobResult` id,
-        or (None, None) if the job does not exist.
-    """
-    qa_job = reportek.core.models.QAJob.objects.get(pk=job_id)
-    if qa_job is None:
-        return None, None
-    return qa_job.envelope_file.envelope_id, qa_job.refresh()
+    if jobs is not None and EnvelopeQASummary.objects.get(envelope=envelope).complete:
+        envelope.handle_auto_qa_results()
+    return get_jobs()
 
 
 @app.task(ignore_result=True)
 def get_qa_results():
     """
-    Scheduled task to fetch results for all QAJobs not yet completed
-    or currently refreshing.
-    Spawns a group of subtasks, one per job.
+    Scheduled task dispatching the QA jobs due for polling, in batches.
+    Dispatched jobs are postponed by the maximum poll delay, so they
+    are not dispatched again while waiting to be refreshed.
     """
-    qa_jobs = reportek.core.models.QAJob.objects.filter(
-        completed=False, refreshing=False
-    ).all()
+    QAJob = reportek.core.models.QAJob
+    with transaction.atomic():
+        job_ids = list(
+            QAJob.objects.due().select_for_update(skip_locked=True).
+            order_by('next_poll_at').values_list('pk', flat=True)
+        )
+        QAJob.objects.filter(pk__in=job_ids).update(
+            next_poll_at=timezone.now() + timezone.timedelta(seconds=settings.QA_POLL_MAX_DELAY)
+        )
 
-    chord(
-        (get_qa_result.s(job.id) for job in qa_jobs),
-        process_qa_results.s()
-    )()
+    batch_size = settings.QA_POLL_BATCH_SIZE
+    for idx in range(0, len(job_ids), batch_size):
+        refresh_qa_jobs.delay(job_ids[idx:idx + batch_size])
 
+    if job_ids:
+        debug(f'Dispatched {len(job_ids)} QA job(s) for polling')
 
-@app.task(ignore_result=False)
-def process_qa_results(results):
+
+@app.task(ignore_result=True)
+def refresh_qa_jobs(job_ids):
     """
-    Processes the results of QA jobs. Spawns group of subtasks that run
-    the QA results handler for each affected envelope.
+    Fetches the results of a batch of QA jobs, with one batched request
+    per QA server. The corresponding `QAJobResult`s are created or updated
+    in bulk, and the QA results handler runs for each envelope that got results.
     """
+    QAJob = reportek.core.models.QAJob
+    jobs = list(
+        QAJob.objects.filter(
+            pk__in=job_ids
+        ).select_related('envelope_file__envelope__obligation_spec')
+    )
+
+    try:
+        results = QAJob.refresh_batch(jobs)
+    except Exception:
+        log.exception(f'Could not refresh QA jobs {job_ids}')
+        return
+
     envelope_ids = {
-        r[0] for r in results
-        if r[0] is not None and r[1] is not None
+        job.envelope_file.envelope_id for job in jobs
+        if results.get(job.pk) is not None
     }
-    group(
-        process_envelope_qa_results.s(env_id)
-        for env_id in envelope_ids
-    )()
+
+    for envelope_id in envelope_ids:
+        process_envelope_qa_results.delay(envelope_id)
 
 
-@app.task(ignore_result=False)
+@app.task(ignore_result=True)
 def process_envelope_qa_results(envelope_id):
     env = reportek.core.models.Envelope.objects.get(pk=envelope_id)
     env.workflow.handle_auto_qa_results()
     return envelope_id
-
@@ -1,18 +1,14 @@
 import os
-import sys
 import logging
-from collections import defaultdict
-import pkgutil
-import pyclbr
 import base64
+import hashlib
+import socket
 import xmlrpc.client
 from functools import wraps
-from importlib import import_module
-from inspect import getmro
-from traceback import print_tb
 from lxml import etree
 
 from django.conf import settings
+from django.core.files import File
 from django.http import HttpResponse
 from django.contrib.auth import authenticate, login
 
@@ -23,92 +19,127 @@ warn = log.warning
 error = log.error
 
 
-def on_import_error(name):
-    error(f'Error importing module {name}')
-    _type, value, traceback = sys.exc_info()
-    print_tb(traceback)
+def path_parts(path):
+    # Courtesy of Python Cookbook
+    allparts = []
+    while 1:
+        parts = os.path.split(path)
+        if parts[0] == path:  # sentinel for absolute paths
+            allparts.insert(0, parts[0])
+            break
+        elif parts[1] == path:  # sentinel for relative paths
+            allparts.insert(0, parts[1])
+            break
+        else:
+            path = parts[0]
+            allparts.insert(0, parts[1])
+    return allparts
+
 
+XSI_NAMESPACE = 'http://www.w3.org/2001/XMLSchema-instance'
+XSI_SCHEMA_LOCATION = f'{{{XSI_NAMESPACE}}}schemaLocation'
+XSI_NO_NAMESPACE_SCHEMA_LOCATION = f'{{{XSI_NAMESPACE}}}noNamespaceSchemaLocation'
 
-def get_package_modules(path, name):
+
+def get_root_element(source):
     """
-    Walks a package's directory recursively, and returns a list of modules therein.
+    Streams ``source`` (a file path or binary file-like object) only up to the
+    end of the root element's start tag, and returns the (childless) root element.
+    Returns `None` if the document is not well-formed up to that point.
     """
-    modules = []
-    for _, mod_name, is_pkg in pkgutil.walk_packages(path, name + '.', onerror=on_import_error):
-        if not is_pkg:
-            modules.append(mod_name)
-    return modules
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return get_root_element(f)
+
+    parser = etree.iterparse(source, events=('start',),
+                             resolve_entities=False, no_network=True, huge_tree=True)
+    try:
+        _, root = next(parser)
+    except (etree.XMLSyntaxError, StopIteration):
+        return None
+    return root
 
 
-def get_pkg_classes(path, name):
+def get_xsd_uri(source):
     """
-    Builds and returns a dict of modules names in package `pkg`, and their classes.
+    Returns the XML schema location(s) declared on the root element, as a
+    space-separated string, or `None` if the file is not XML or declares no schema.
+
+    Both ``xsi:schemaLocation`` (namespace/location pairs, of which only the
+    locations are kept) and ``xsi:noNamespaceSchemaLocation`` are considered.
+    Only the root start tag is parsed, so this is cheap even on very large files.
     """
-    classes = defaultdict(list)
-    for mod in get_package_modules(path, name):
-        module_classes = pyclbr.readmodule(mod)
-        for cls_name in module_classes:
-            classes[mod].append(cls_name)
+    root = get_root_element(source)
+    if root is None:
+        return None
 
-    return classes
+    locations = []
+    no_ns_location = root.get(XSI_NO_NAMESPACE_SCHEMA_LOCATION)
+    if no_ns_location:
+        locations.extend(no_ns_location.split())
 
+    ns_locations = root.get(XSI_SCHEMA_LOCATION)
+    if ns_locations:
+        # pairs of namespace URI and schema location
+        locations.extend(ns_locations.split()[1::2])
+
+    return ' '.join(locations) or None
 
-def get_based_classes(path, package, base_classes, skip_bases=True):
-    """
-    Identifies classes based on specified base classes in a package.
 
-    Returns a set of tuples of the form:
+HASH_BUFFER_SIZE = 1024 * 1024
 
-        ```
-        (reportek.core.models.workflows.<module>.<class>, <class>)
-        ```
 
-    The tuples are meant for model choice usage.
+def copy_and_hash(src, dst, buffer_size=HASH_BUFFER_SIZE):
+    """
+    Copies binary file-like object ``src`` to ``dst`` (``dst`` may be `None` to
+    only read ``src``), computing the SHA-256 checksum in the same pass.
+    Returns a tuple of the size in bytes and the hex digest.
     """
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = src.read(buffer_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        if dst is not None:
+            dst.write(chunk)
+    return size, digest.hexdigest()
 
-    wf_classes = set()
-    for mod, classes in get_pkg_classes(path, package).items():
-        live_mod = import_module(mod)
-        for cls_name in classes:
-            # Skip base classes
-            if skip_bases and cls_name in base_classes:
-                continue
-            cls = getattr(live_mod, cls_name)
-            cls_ancestors = [cls.__name__ for cls in getmro(cls)]
-            if any(base_cls in base_classes for base_cls in cls_ancestors):
-                wf_classes.add(('.'.join([mod, cls_name]), cls_name))
 
-    return wf_classes
+def hash_file(source):
+    """
+    Returns the size and SHA-256 checksum of ``source``,
+    which is a file path or a binary file-like object.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return copy_and_hash(f, None)
+    return copy_and_hash(source, None)
 
 
-def path_parts(path):
-    # Courtesy of Python Cookbook
-    allparts = []
-    while 1:
-        parts = os.path.split(path)
-        if parts[0] == path:  # sentinel for absolute paths
-            allparts.insert(0, parts[0])
-            break
-        elif parts[1] == path:  # sentinel for relative paths
-            allparts.insert(0, parts[1])
-            break
-        else:
-            path = parts[0]
-            allparts.insert(0, parts[1])
-    return allparts
+class HashingFile(File):
+    """
+    Wraps file-like ``content``, computing its size and SHA-256 checksum
+    as it is read in chunks, e.g. while a storage writes it.
+    """
 
+    def __init__(self, content):
+        super().__init__(content)
+        self.digest = hashlib.sha256()
+        self.hashed_size = 0
 
-def get_xsd_uri(file_path):
-    try:
-        tree = etree.parse(file_path)
-    except etree.XMLSyntaxError:
-        return None
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.digest.update(chunk)
+            self.hashed_size += len(chunk)
+            yield chunk
 
-    root = tree.getroot()
-    try:
-        return root.attrib[root.keys()[0]]
-    except (AttributeError, IndexError):
-        return None
+    @property
+    def content_info(self):
+        """The size in bytes and the hex digest of the content read so far."""
+        return self.hashed_size, self.digest.hexdigest()
 
 
 def fully_qualify_url(url):
@@ -232,7 +263,8 @@ def has_perm_or_basicauth(perm, realm=''):
 def log_xmlrpc_errors(logger):
     def log_decorator(f):
         """
-        Method wrapper, ensures logging of XMLRPC faults and protocol errors.
+        Method wrapper, ensures logging of XMLRPC faults, protocol errors,
+        timeouts and connection errors.
         """
         @wraps(f)
         def wrapper(self, *args, **kwargs):
@@ -243,6 +275,8 @@ def log_xmlrpc_errors(logger):
             except xmlrpc.client.ProtocolError as err:
                 logger.error(f'XMLRPC protocol error: url={err.download_url}, headers={err.headers}, '
                              f'code={err.errcode}, msg={err.errmsg}')
+            except (socket.timeout, ConnectionError) as err:
+                logger.error(f'XMLRPC connection error: {err!r}')
         return wrapper
     return log_decorator
 
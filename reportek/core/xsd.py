@@ -0,0 +1,229 @@
+"""
+Local validation of XML files against their XML schemas, ahead of remote QA.
+
+XSD documents are read from an on-disk mirror under ``XSD_MIRROR_ROOT``,
+laid out by URL host and path. Documents missing from the mirror are
+downloaded into it, unless ``XSD_MIRROR_OFFLINE`` is set, so that validation
+runs without network access once the mirror is populated
+(see the ``mirror_xsd`` management command). Imported and included
+schema documents are resolved through the mirror as well.
+
+Compiled schemas are cached in process (up to ``XSD_SCHEMA_CACHE_SIZE``),
+as compiling a large schema usually takes longer than validating a file.
+"""
+import os
+import time
+import logging
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from lxml import etree
+
+
+__all__ = [
+    'SchemaUnavailable',
+    'XSDMirror',
+    'compile_schema',
+    'get_schema',
+    'validate',
+]
+
+log = logging.getLogger('reportek.xsd')
+info = log.info
+debug = log.debug
+warn = log.warning
+error = log.error
+
+XS_NAMESPACE = 'http://www.w3.org/2001/XMLSchema'
+
+# Schemas that could not be loaded are not retried for this many seconds
+UNAVAILABLE_RETRY_DELAY = 300
+
+
+class SchemaUnavailable(Exception):
+    """An XML schema could not be loaded or compiled."""
+
+
+class XSDMirror:
+    """
+    On-disk mirror of XSD documents, downloading missing documents
+    unless ``offline``.
+    """
+
+    def __init__(self, root=None, offline=None):
+        self.root = Path(root or settings.XSD_MIRROR_ROOT)
+        self.offline = settings.XSD_MIRROR_OFFLINE if offline is None else offline
+
+    def get_path(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise SchemaUnavailable(f'unsupported schema location: {url}')
+        segments = [s for s in parts.path.split('/') if s not in ('', '.', '..')]
+        return self.root.joinpath(parts.netloc, *(segments or ['index.xsd']))
+
+    def get(self, url):
+        """
+        Returns the path of the mirrored document at ``url``,
+        downloading it first if missing.
+        """
+        path = self.get_path(url)
+        if path.is_file():
+            return path
+        if self.offline:
+            raise SchemaUnavailable(f'{url} is not mirrored')
+
+        try:
+            with urllib.request.urlopen(url, timeout=settings.XSD_FETCH_TIMEOUT) as response:
+                data = response.read()
+        except (OSError, ValueError) as err:
+            raise SchemaUnavailable(f'cannot download {url}: {err}')
+
+        # The document only becomes visible once completely written
+        os.makedirs(str(path.parent), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix=f'.{path.name}.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, str(path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        info(f'Mirrored XSD {url}')
+        return path
+
+
+class _MirrorResolver(etree.Resolver):
+    """
+    Resolves schema documents referenced over HTTP through the mirror.
+    """
+
+    def __init__(self, mirror):
+        super().__init__()
+        self.mirror = mirror
+        self.failures = []
+
+    def resolve(self, url, pubid, context):
+        if urlsplit(url).scheme not in ('http', 'https'):
+            return None
+        try:
+            path = self.mirror.get(url)
+        except SchemaUnavailable as err:
+            self.failures.append(str(err))
+            return None
+        # Relative references in the document resolve against its URL
+        return self.resolve_file(path.open('rb'), context, base_url=url)
+
+
+def compile_schema(locations, mirror=None):
+    """
+    Compiles the XML schema(s) at ``locations`` into an ``etree.XMLSchema``.
+    Several schemas are combined into one, by importing (or including,
+    for schemas without target namespace) each of them.
+    Raises ``SchemaUnavailable`` if a schema cannot be loaded or compiled.
+    """
+    mirror = mirror or XSDMirror()
+    resolver = _MirrorResolver(mirror)
+    # Network access only goes through the mirror
+    parser = etree.XMLParser(no_network=True, resolve_entities=False)
+    parser.resolvers.add(resolver)
+
+    def parse(url):
+        with mirror.get(url).open('rb') as f:
+            return etree.parse(f, parser, base_url=url)
+
+    try:
+        if len(locations) == 1:
+            doc = parse(locations[0])
+        else:
+            wrapper = etree.Element(f'{{{XS_NAMESPACE}}}schema', nsmap={'xs': XS_NAMESPACE})
+            for url in locations:
+                namespace = parse(url).getroot().get('targetNamespace')
+                if namespace:
+                    etree.SubElement(wrapper, f'{{{XS_NAMESPACE}}}import',
+                                     namespace=namespace, schemaLocation=url)
+                else:
+                    etree.SubElement(wrapper, f'{{{XS_NAMESPACE}}}include', schemaLocation=url)
+            doc = etree.fromstring(etree.tostring(wrapper), parser).getroottree()
+        return etree.XMLSchema(doc)
+    except (etree.XMLSyntaxError, etree.XMLSchemaParseError) as err:
+        if resolver.failures:
+            raise SchemaUnavailable(resolver.failures[0])
+        raise SchemaUnavailable(f'cannot compile {" ".join(locations)}: {err}')
+
+
+_schemas = OrderedDict()
+_unavailable = {}
+_schemas_lock = threading.Lock()
+
+
+def get_schema(xml_schema):
+    """
+    Returns the compiled schema for ``xml_schema`` (space-separated schema
+    locations, as in ``EnvelopeFile.xml_schema``), from the in-process cache
+    if possible. Raises ``SchemaUnavailable`` if it cannot be compiled.
+    """
+    locations = tuple(xml_schema.split())
+    with _schemas_lock:
+        schema = _schemas.get(locations)
+        if schema is not None:
+            _schemas.move_to_end(locations)
+            return schema
+        retry_at, err = _unavailable.get(locations, (0, None))
+        if time.monotonic() < retry_at:
+            raise err
+
+    started = time.perf_counter()
+    try:
+        schema = compile_schema(locations)
+    except SchemaUnavailable as err:
+        warn(f'XSD unavailable: {err}')
+        with _schemas_lock:
+            _unavailable[locations] = (time.monotonic() + UNAVAILABLE_RETRY_DELAY, err)
+        raise
+    debug(f'Compiled XSD {xml_schema} in {time.perf_counter() - started:.3f}s')
+
+    with _schemas_lock:
+        _unavailable.pop(locations, None)
+        _schemas[locations] = schema
+        while len(_schemas) > settings.XSD_SCHEMA_CACHE_SIZE:
+            _schemas.popitem(last=False)
+    return schema
+
+
+def _format_errors(error_log, max_errors):
+    return [
+        f'line {entry.line}: {entry.message}'
+        for entry in error_log.filter_from_errors()[:max_errors]
+    ]
+
+
+def validate(source, xml_schema, max_errors=None):
+    """
+    Validates the XML file at path ``source`` against ``xml_schema``.
+
+    Returns a tuple of whether the file is well-formed, and the list of
+    (at most ``max_errors``) error messages - empty for a valid file.
+    Raises ``SchemaUnavailable`` if the schema cannot be loaded.
+    """
+    max_errors = max_errors or settings.XSD_VALIDATION_MAX_ERRORS
+    schema = get_schema(xml_schema)
+    # External entities are neither loaded nor expanded
+    parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+    try:
+        doc = etree.parse(str(source), parser)
+    except etree.XMLSyntaxError:
+        return False, _format_errors(parser.error_log, max_errors)
+
+    dtd = doc.docinfo.internalDTD
+    if dtd is not None and any(True for _ in dtd.iterentities()):
+        # Left unexpanded by the parser, so the content cannot be validated
+        return True, ['Entity declarations are not allowed']
+
+    if schema.validate(doc):
+        return True, []
+    return True, _format_errors(schema.error_log, max_errors)
@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from celery.schedules import crontab
+from django.conf import settings
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reportek.site.settings')
@@ -19,6 +20,18 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'get-qa-job-results': {
         'task': 'reportek.core.tasks.get_qa_results',
-        'schedule': crontab(),
+        'schedule': settings.QA_POLL_INTERVAL,
+    },
+    'sweep-archive-cache': {
+        'task': 'reportek.core.tasks.sweep_archive_cache',
+        'schedule': crontab(minute='*/15'),
+    },
+    'sweep-conversion-cache': {
+        'task': 'reportek.core.tasks.sweep_conversion_cache',
+        'schedule': crontab(minute='*/15'),
+    },
+    'sweep-script-runs': {
+        'task': 'reportek.core.tasks.sweep_script_runs',
+        'schedule': crontab(minute=30),
     },
 }
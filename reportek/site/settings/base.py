@@ -80,12 +80,61 @@ REPORTEK_DOMAIN = get_env_var('REPORTEK_DOMAIN')
 REPORTEK_USE_TLS = get_bool_env_var('REPORTEK_USE_TLS')
 
 TUSD_UPLOADS_DIR = get_env_var('TUSD_UPLOADS_DIR')
+# How finished uploads are placed in envelope storage: 'move', 'link' or 'copy'.
+# 'move' and 'link' avoid copying when TUSD_UPLOADS_DIR and PROTECTED_ROOT are on
+# the same filesystem, and fall back to copying otherwise.
+UPLOADS_INGEST_MODE = get_env_var('UPLOADS_INGEST_MODE', 'move')
+if UPLOADS_INGEST_MODE not in ('move', 'link', 'copy'):
+    raise ImproperlyConfigured('UPLOADS_INGEST_MODE must be one of: move, link, copy')
 ALLOWED_UPLOADS_ARCHIVE_EXTENSIONS = split_env_var('ALLOWED_UPLOADS_ARCHIVE_EXTENSIONS')
 ALLOWED_UPLOADS_ORIGINAL_EXTENSIONS = split_env_var('ALLOWED_UPLOADS_ORIGINAL_EXTENSIONS')
 ALLOWED_UPLOADS_EXTENSIONS = split_env_var('ALLOWED_UPLOADS_EXTENSIONS')
 
 # QA
 QA_DEFAULT_XMLRPC_URI = get_env_var('QA_DEFAULT_XMLRPC_URI')
+# QA job results are polled with exponential backoff: the delay between polls
+# of a job doubles from QA_POLL_MIN_DELAY up to QA_POLL_MAX_DELAY seconds.
+# Due jobs are dispatched every QA_POLL_INTERVAL seconds, in batches.
+QA_POLL_MIN_DELAY = get_int_env_var('QA_POLL_MIN_DELAY', '10')
+QA_POLL_MAX_DELAY = get_int_env_var('QA_POLL_MAX_DELAY', '600')
+QA_POLL_INTERVAL = 10
+QA_POLL_BATCH_SIZE = 50
+# Seconds a QA job stays claimed by a refresh; leases of dead workers expire after that.
+# Must exceed the duration of a batch refresh.
+QA_REFRESH_LEASE = get_int_env_var('QA_REFRESH_LEASE', '1800')
+# Maximum number of QA job results fetched in one XML-RPC multicall
+QA_MULTICALL_CHUNK_SIZE = 50
+# Envelopes are not resubmitted to QA by the same request if their XML files are
+# unchanged since a submission less than QA_SUBMISSION_KEY_TTL seconds ago
+# (e.g. on task redelivery).
+QA_SUBMISSION_KEY_TTL = get_int_env_var('QA_SUBMISSION_KEY_TTL', '3600')
+
+# XML files are validated locally against their schemas before QA (XSD_VALIDATION).
+# Schema documents are mirrored under XSD_MIRROR_ROOT; with XSD_MIRROR_OFFLINE,
+# only mirrored documents are used (see the `mirror_xsd` management command).
+# Files larger than XSD_VALIDATION_MAX_SIZE bytes are left to remote QA.
+XSD_VALIDATION = get_bool_env_var('XSD_VALIDATION', 'yes')
+XSD_VALIDATION_MAX_SIZE = get_int_env_var('XSD_VALIDATION_MAX_SIZE', str(200 * 1024 ** 2))
+XSD_VALIDATION_MAX_ERRORS = 20
+XSD_MIRROR_ROOT = PARENT_DIR / 'xsd-mirror'
+XSD_MIRROR_OFFLINE = get_bool_env_var('XSD_MIRROR_OFFLINE', 'no')
+XSD_FETCH_TIMEOUT = get_int_env_var('XSD_FETCH_TIMEOUT', '30')
+# Maximum number of compiled schemas cached per process
+XSD_SCHEMA_CACHE_SIZE = 32
+
+# XML-RPC calls to QA & conversion servers go over pooled keep-alive connections,
+# at most XMLRPC_POOL_SIZE concurrent calls per server and process.
+# Timeouts are in seconds; XMLRPC_READ_TIMEOUT must allow for the slowest conversions.
+XMLRPC_POOL_SIZE = get_int_env_var('XMLRPC_POOL_SIZE', '4')
+XMLRPC_POOL_TIMEOUT = get_int_env_var('XMLRPC_POOL_TIMEOUT', '30')
+XMLRPC_CONNECT_TIMEOUT = get_int_env_var('XMLRPC_CONNECT_TIMEOUT', '10')
+XMLRPC_READ_TIMEOUT = get_int_env_var('XMLRPC_READ_TIMEOUT', '600')
+
+# QA script & conversion listings are cached per server and schema.
+# Listings older than SCRIPT_LISTINGS_TTL seconds are served while refreshed
+# in the background, up to SCRIPT_LISTINGS_MAX_AGE seconds.
+SCRIPT_LISTINGS_TTL = get_int_env_var('SCRIPT_LISTINGS_TTL', '3600')
+SCRIPT_LISTINGS_MAX_AGE = get_int_env_var('SCRIPT_LISTINGS_MAX_AGE', '604800')
 
 # ROD
 ROD_ROOT_URL = 'http://rod.eionet.europa.eu'
@@ -140,6 +189,20 @@ MIDDLEWARE = [
 
 REDIS_HOST = get_env_var('REDIS_HOST')
 
+# QA script & conversion listings are shared by all processes, through Redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'script_listings': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    },
+}
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
@@ -302,6 +365,24 @@ PROTECTED_URL = '/protected-files/'
 DOWNLOAD_STAGING_ROOT = validate_dir(PARENT_DIR / 'download_staging')
 DOWNLOAD_STAGING_URL = '/transient-files/'
 
+# Archives of finalized envelopes are cached in the staging directory,
+# up to this many bytes (least recently used archives are evicted first).
+ARCHIVE_CACHE_ROOT = DOWNLOAD_STAGING_ROOT
+ARCHIVE_CACHE_URL = DOWNLOAD_STAGING_URL
+ARCHIVE_CACHE_MAX_SIZE = get_int_env_var('ARCHIVE_CACHE_MAX_SIZE', str(10 * 1024 ** 3))
+
+# Results of QA scripts and conversions run on demand are kept in the staging
+# directory for SCRIPT_RUNS_MAX_AGE seconds.
+SCRIPT_RUNS_ROOT = DOWNLOAD_STAGING_ROOT / 'script-runs'
+SCRIPT_RUNS_URL = f'{DOWNLOAD_STAGING_URL}script-runs/'
+SCRIPT_RUNS_MAX_AGE = get_int_env_var('SCRIPT_RUNS_MAX_AGE', str(7 * 24 * 3600))
+
+# Conversion results are cached in the staging directory by file checksum and
+# conversion id, up to this many bytes (least recently used results are evicted first).
+CONVERSION_CACHE_ROOT = DOWNLOAD_STAGING_ROOT / 'conversions'
+CONVERSION_CACHE_URL = f'{DOWNLOAD_STAGING_URL}conversions/'
+CONVERSION_CACHE_MAX_SIZE = get_int_env_var('CONVERSION_CACHE_MAX_SIZE', str(5 * 1024 ** 3))
+
 # TODO: this part should be synchronized with Webpack
 # (see /frontend/config/conf.js)
 _WEBPACK_DIST_DIR = ROOT_DIR / 'frontend' / 'dist'
@@ -393,5 +474,37 @@ LOGGING = {
             'handlers': ['console'],
             'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
         },
+        'reportek.ingestion': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.archives': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.disk_cache': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.script_runs': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.script_listings': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.conversions': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.rpc': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
+        'reportek.xsd': {
+            'handlers': ['console'],
+            'level': get_env_var('DJANGO_LOG_LEVEL', 'INFO'),
+        },
     },
 }
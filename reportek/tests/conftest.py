@@ -1,6 +1,22 @@
 import pytest
 
 from django.core.management import call_command
+from django.utils import timezone
+
+from reportek.core.models import (
+    Client,
+    Obligation,
+    ObligationSpec,
+    Reporter,
+    ReportingCycle,
+    Envelope,
+    EnvelopeFile,
+    EnvelopeOriginalFile,
+    EnvelopeSupportFile,
+    EnvelopeLink,
+)
+
+from .common import fake_name
 
 
 @pytest.fixture(autouse=True)
@@ -18,3 +34,51 @@ def django_db_setup(django_db_setup, django_db_blocker):
         # call_command('loaddata', 'data/fixtures/obligations.yaml')
 
 
+WORKFLOW = 'reportek.core.models.workflows.demo_auto_qa.DemoAutoQAWorkflow'
+ENVELOPES_COUNT = 12
+
+
+@pytest.fixture
+def fix_envelopes():
+    client = Client.objects.create(name=fake_name('Client '))
+    obligation = Obligation.objects.create(
+        title=fake_name('Obligation '),
+        client=client,
+        active_since=timezone.now()
+    )
+    spec = ObligationSpec.objects.create(
+        obligation=obligation,
+        schema=['http://example.com/schema.xsd'],
+        workflow_class=WORKFLOW,
+        is_current=True
+    )
+    cycle = ReportingCycle.objects.create(
+        obligation=obligation,
+        obligation_spec=spec,
+        reporting_start_date=timezone.now().date()
+    )
+    reporter = Reporter.objects.create(name=fake_name('Reporter '), abbr=fake_name('R'))
+
+    envelopes = []
+    for idx in range(ENVELOPES_COUNT):
+        envelope = Envelope(
+            name=f'Envelope {idx}',
+            reporter=reporter,
+            obligation_spec=spec,
+            reporting_cycle=cycle
+        )
+        envelope.save()
+        envelopes.append(envelope)
+
+    # bulk_create skips the storage & notification logic in `save()`
+    for model_cls in (EnvelopeFile, EnvelopeOriginalFile, EnvelopeSupportFile):
+        model_cls.objects.bulk_create([
+            model_cls(envelope=envelope, name=name, file=f'{envelope.pk}/{name}')
+            for envelope in envelopes
+            for name in ('a.xml', 'b.xml')
+        ])
+    EnvelopeLink.objects.bulk_create([
+        EnvelopeLink(envelope=envelope, link=f'http://example.com/{envelope.pk}')
+        for envelope in envelopes
+    ])
+    return envelopes
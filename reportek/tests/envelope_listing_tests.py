@@ -0,0 +1,73 @@
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from reportek.core.models import Envelope
+
+from reportek.site.urls import API_VERSION
+
+from .common import fake_name
+
+
+@pytest.fixture
+def api_admin_client():
+    admin = get_user_model().objects.create(username=fake_name('admin'), is_superuser=True)
+    client = APIClient()
+    client.force_authenticate(user=admin)
+    return client
+
+
+@pytest.fixture
+def assigned_envelopes(fix_envelopes):
+    """The workflow checks rendered for assigned envelopes read the assignee"""
+    reporter = get_user_model().objects.create(username=fake_name('reporter'))
+    Envelope.objects.filter(pk__in=[e.pk for e in fix_envelopes]).update(assigned_to=reporter)
+    return fix_envelopes
+
+
+def count_queries(client, url, limit):
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url, {'limit': limit})
+    assert response.status_code == 200
+    assert len(response.data['results']) == limit
+    return len(ctx.captured_queries)
+
+
+@pytest.mark.parametrize('url', [
+    f'/api/{API_VERSION}/envelopes/',
+    f'/api/{API_VERSION}/envelopes/status/',
+])
+def test_envelope_listing_query_count(assigned_envelopes, api_admin_client, url):
+    """The number of queries per page must not depend on the page size"""
+    small_page = count_queries(api_admin_client, url, 2)
+    large_page = count_queries(api_admin_client, url, len(assigned_envelopes))
+    assert small_page == large_page
+
+
+def test_envelope_status_cursor_pagination(fix_envelopes, api_admin_client):
+    """Following `next` links walks all envelopes once, in listing order"""
+    url = f'/api/{API_VERSION}/envelopes/status/?pagination=cursor&limit=5&count=estimate'
+    seen = []
+    while url is not None:
+        response = api_admin_client.get(url)
+        assert response.status_code == 200
+        assert 'count' in response.data
+        seen += [e['id'] for e in response.data['results']]
+        url = response.data['next']
+
+    expected = Envelope.objects.order_by('reporter_id', '-updated_at', '-id')
+    assert seen == list(expected.values_list('id', flat=True))
+
+
+def test_envelope_detail_files(fix_envelopes, api_admin_client):
+    """XSD validation fields are only serialized for envelope files"""
+    envelope = fix_envelopes[0]
+    response = api_admin_client.get(f'/api/{API_VERSION}/envelopes/{envelope.pk}/')
+    assert response.status_code == 200
+    assert 'xml_validation' in response.data['files'][0]
+    for key in ('original_files', 'support_files'):
+        assert len(response.data[key]) == 2
+        assert 'xml_validation' not in response.data[key][0]
@@ -0,0 +1,97 @@
+import threading
+import pytest
+
+from xmlrpc.client import Binary
+from xmlrpc.server import SimpleXMLRPCServer
+
+from reportek.core.qa import RemoteQA
+from reportek.core.rpc import BinaryFile, get_call_stats
+from reportek.core.conversion import RemoteConversion
+from reportek.core import script_listings
+from reportek.core.qa import xml_rpc
+
+
+class XQueryService:
+
+    def getResult(self, job_id):
+        if job_id == '13':
+            raise Exception('No such job')
+        return {'CODE': 0, 'VALUE': f'result {job_id}'}
+
+    def listQAScripts(self, schema):
+        return [['1', f'Script for {schema}', '2018-01-01', '10MB']]
+
+
+class ConversionService:
+
+    def convert(self, xml_url, convert_id):
+        return {
+            'content-type': 'text/csv',
+            'filename': 'converted.csv',
+            'content': Binary(bytes(range(256)) * 1000),
+        }
+
+
+class QAService:
+    XQueryService = XQueryService()
+    ConversionService = ConversionService()
+
+
+@pytest.fixture(params=[True, False], ids=['multicall', 'single calls'])
+def qa_server(request):
+    server = SimpleXMLRPCServer(('127.0.0.1', 0), logRequests=False, allow_none=True)
+    server.register_instance(QAService(), allow_dotted_names=True)
+    if request.param:
+        server.register_multicall_functions()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    uri = f'http://127.0.0.1:{server.server_address[1]}/'
+    yield uri
+    server.shutdown()
+    server.server_close()
+    xml_rpc._multicall_unsupported_uris.discard(uri)
+
+
+def test_get_job_results(qa_server):
+    results = RemoteQA(qa_server).get_job_results([1, 2, 13, 4, 5], chunk_size=2)
+    assert results == {
+        1: {'CODE': 0, 'VALUE': 'result 1'},
+        2: {'CODE': 0, 'VALUE': 'result 2'},
+        13: None,
+        4: {'CODE': 0, 'VALUE': 'result 4'},
+        5: {'CODE': 0, 'VALUE': 'result 5'},
+    }
+
+
+def test_call_stats(qa_server):
+    remote_qa = RemoteQA(qa_server)
+    remote_qa.get_job_result(1)
+    remote_qa.get_job_result(2)
+    stats = get_call_stats()[(qa_server, 'XQueryService.getResult')]
+    assert stats.count == 2
+    assert stats.failed == 0
+    assert 0 < stats.max_time <= stats.total_time
+
+
+def test_cached_script_listing(qa_server):
+    schema = 'http://example.com/schema.xsd'
+    expected = [{'id': '1', 'title': f'Script for {schema}', 'last_updated': '2018-01-01', 'max_size': '10MB'}]
+
+    def fetches():
+        return get_call_stats()[(qa_server, 'XQueryService.listQAScripts')].count
+
+    assert script_listings.get_listing('qa_scripts', qa_server, schema) == expected
+    assert script_listings.get_listing('qa_scripts', qa_server, schema) == expected
+    assert fetches() == 1
+
+    script_listings.invalidate(qa_server)
+    assert script_listings.get_listing('qa_scripts', qa_server, schema) == expected
+    assert fetches() == 2
+
+
+def test_streamed_binary(qa_server):
+    result = RemoteConversion(qa_server).convert_xml('http://example.com/a.xml', '7')
+    assert result['filename'] == 'converted.csv'
+    with result['content'] as content:
+        assert isinstance(content, BinaryFile)
+        assert content.read() == bytes(range(256)) * 1000
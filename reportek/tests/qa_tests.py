@@ -0,0 +1,203 @@
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import BinaryField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from reportek.core import tasks, xsd
+from reportek.core.models import Envelope, EnvelopeFile, EnvelopeQASummary, QAJob, QAJobResult
+from reportek.core.models.workflows import base
+from reportek.site.urls import API_VERSION
+
+from .common import fake_name
+
+
+class FakeRemoteQA:
+    submissions = 0
+
+    def __init__(self, uri):
+        self.uri = uri
+
+    def analyze_xml_files(self, files):
+        FakeRemoteQA.submissions += 1
+        return [
+            (str(100 * FakeRemoteQA.submissions + idx), file_url, '1', 'Script 1')
+            for idx, file_url in enumerate(sorted(url for urls in files.values() for url in urls))
+        ]
+
+
+class FakeChannelLayer:
+
+    async def group_send(self, group, message):
+        pass
+
+
+@pytest.fixture
+def qa_envelope(fix_envelopes, monkeypatch, settings, tmpdir):
+    # the schema is not mirrored, so files are not validated locally
+    settings.XSD_MIRROR_ROOT = str(tmpdir)
+    settings.XSD_MIRROR_OFFLINE = True
+    monkeypatch.setattr(tasks, 'RemoteQA', FakeRemoteQA)
+    monkeypatch.setattr(FakeRemoteQA, 'submissions', 0)
+    envelope = fix_envelopes[0]
+    # skips the storage logic in `save()`
+    EnvelopeFile.objects.filter(envelope=envelope).update(
+        xml_schema='http://example.com/schema.xsd',
+        sha256='a' * 64
+    )
+    return envelope
+
+
+def test_submit_xml_to_qa_is_idempotent(qa_envelope):
+    jobs = tasks.submit_xml_to_qa(qa_envelope.pk)
+    assert len(jobs) == 2
+    # e.g. the task being redelivered
+    assert len(tasks.submit_xml_to_qa(qa_envelope.pk)) == 2
+    assert FakeRemoteQA.submissions == 1
+    assert QAJob.objects.filter(envelope_file__envelope=qa_envelope).count() == 2
+    assert qa_envelope.qa_summary.jobs_total == 2
+
+
+def test_submit_xml_to_qa_is_incremental(qa_envelope, settings):
+    settings.QA_SUBMISSION_KEY_TTL = 0
+    tasks.submit_xml_to_qa(qa_envelope.pk)
+    tasks.submit_xml_to_qa(qa_envelope.pk)
+    assert FakeRemoteQA.submissions == 1
+
+    EnvelopeFile.objects.filter(envelope=qa_envelope, name='a.xml').update(sha256='b' * 64)
+    assert len(tasks.submit_xml_to_qa(qa_envelope.pk)) == 2
+    assert FakeRemoteQA.submissions == 2
+    # only the modified file got a new job
+    assert dict(
+        QAJob.objects.filter(
+            envelope_file__envelope=qa_envelope
+        ).values_list('envelope_file__name', 'qa_job_id')
+    ) == {'a.xml': 200, 'b.xml': 101}
+    assert QAJob.objects.get(qa_job_id=200).file_sha256 == 'b' * 64
+    assert qa_envelope.auto_qa_summary.jobs_total == 2
+
+
+def test_send_to_qa_with_carried_forward_results(qa_envelope, monkeypatch):
+    monkeypatch.setattr(base, 'get_channel_layer', FakeChannelLayer)
+    # a completed QA round on the current file contents, within QA_SUBMISSION_KEY_TTL
+    tasks.submit_xml_to_qa(qa_envelope.pk)
+    jobs = QAJob.objects.filter(envelope_file__envelope=qa_envelope)
+    for job in jobs:
+        QAJobResult.objects.create(job=job, code=0, script_title='Script', feedback_status='INFO')
+    jobs.update(completed=True)
+    EnvelopeQASummary.recompute(qa_envelope)
+
+    reporter = get_user_model().objects.create(username=fake_name('reporter'))
+    Envelope.objects.filter(pk=qa_envelope.pk).update(assigned_to=reporter)
+    workflow = Envelope.objects.get(pk=qa_envelope.pk).workflow
+    callbacks = []
+    monkeypatch.setattr(transaction, 'on_commit', callbacks.append)
+    monkeypatch.setattr(tasks.submit_xml_to_qa, 'delay', tasks.submit_xml_to_qa)
+    workflow.start_transition('send_to_qa')
+    # submitted once the transition is committed
+    assert workflow.current_state == 'auto_qa'
+    assert QAJob.objects.filter(envelope_file__envelope=qa_envelope).count() == 2
+
+    for callback in callbacks:
+        callback()
+    assert FakeRemoteQA.submissions == 1
+    workflow.refresh_from_db()
+    assert workflow.current_state == 'review'
+
+
+def test_invalid_files_not_submitted(qa_envelope):
+    EnvelopeFile.objects.filter(envelope=qa_envelope, name='a.xml').update(
+        xml_validation=EnvelopeFile.XML_VALIDATION_STATUSES.INVALID.value
+    )
+    jobs = tasks.submit_xml_to_qa(qa_envelope.pk)
+    assert [file_url.split('/')[-1] for _, file_url, _, _ in jobs] == ['b.xml']
+    summary = qa_envelope.auto_qa_summary
+    assert summary.invalid_files == 1
+    assert not summary.ok
+
+
+def test_xsd_validation(settings, tmpdir):
+    settings.XSD_MIRROR_ROOT = str(tmpdir.mkdir('mirror'))
+    settings.XSD_MIRROR_OFFLINE = True
+    schema_dir = tmpdir.join('mirror', 'example.com', 'xsd-test').ensure(dir=True)
+    schema_dir.join('main.xsd').write(
+        '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">'
+        '<xs:include schemaLocation="common.xsd"/>'
+        '<xs:element name="root"><xs:complexType><xs:sequence>'
+        '<xs:element name="item" type="count" maxOccurs="unbounded"/>'
+        '</xs:sequence></xs:complexType></xs:element>'
+        '</xs:schema>'
+    )
+    schema_dir.join('common.xsd').write(
+        '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">'
+        '<xs:simpleType name="count"><xs:restriction base="xs:int"/></xs:simpleType>'
+        '</xs:schema>'
+    )
+    xml_schema = 'http://example.com/xsd-test/main.xsd'
+    files = {
+        'valid.xml': '<root><item>1</item></root>',
+        'invalid.xml': '<root><item>x</item></root>',
+        'broken.xml': '<root><item>1</item>',
+    }
+    for name, content in files.items():
+        tmpdir.join(name).write(content)
+
+    assert xsd.validate(str(tmpdir.join('valid.xml')), xml_schema) == (True, [])
+    well_formed, errors = xsd.validate(str(tmpdir.join('invalid.xml')), xml_schema)
+    assert well_formed and len(errors) == 1
+    well_formed, errors = xsd.validate(str(tmpdir.join('broken.xml')), xml_schema)
+    assert not well_formed and errors
+    with pytest.raises(xsd.SchemaUnavailable):
+        xsd.validate(str(tmpdir.join('valid.xml')), 'http://example.com/xsd-test/missing.xsd')
+
+
+def test_claim_qa_jobs(fix_envelopes):
+    envelope_file = fix_envelopes[0].files.first()
+    job = QAJob.objects.create(envelope_file=envelope_file, qa_job_id=1)
+    now = timezone.now()
+    lease = now + timezone.timedelta(minutes=5)
+
+    assert QAJob.objects.claim([job.pk], lease) == {job.pk}
+    assert QAJob.objects.claim([job.pk], lease) == set()
+    assert not QAJob.objects.due().filter(pk=job.pk).exists()
+
+    # the worker holding the lease died
+    QAJob.objects.filter(pk=job.pk).update(lease_expires_at=now - timezone.timedelta(seconds=1))
+    assert QAJob.objects.due().filter(pk=job.pk).exists()
+    assert QAJob.objects.claim([job.pk], lease) == {job.pk}
+    # the stale refresh doesn't release the new claim
+    assert QAJob.objects.release([job.pk], now - timezone.timedelta(seconds=1)) == 0
+    assert QAJob.objects.release([job.pk], lease) == 1
+    assert QAJob.objects.due().filter(pk=job.pk).exists()
+
+
+def test_compressed_result_body(fix_envelopes):
+    envelope_file = fix_envelopes[0].files.first()
+    job = QAJob.objects.create(envelope_file=envelope_file, qa_job_id=1, completed=True)
+    body = '<table>' + '<tr><td>Row ok</td></tr>' * 10000 + '</table>'
+    result = QAJobResult.objects.create(
+        job=job, code=0, value=body, metatype='text/html',
+        script_title='Script', feedback_status='INFO'
+    )
+    stored = QAJobResult.objects.annotate(
+        compressed=Cast('value', BinaryField())
+    ).values_list('compressed', flat=True).get(pk=result.pk)
+    assert len(stored) < len(body) / 10
+    assert QAJobResult.objects.get(pk=result.pk).value == body
+
+    client = APIClient()
+    admin = get_user_model().objects.create(username=fake_name('admin'), is_superuser=True)
+    client.force_authenticate(user=admin)
+    file_url = f'/api/{API_VERSION}/envelopes/{envelope_file.envelope_id}/files/{envelope_file.pk}'
+
+    response = client.get(f'{file_url}/feedback/')
+    latest_result, = [job['latest_result'] for job in response.data]
+    assert latest_result['id'] == result.pk
+    assert 'value' not in latest_result
+
+    response = client.get(f'{file_url}/qa-results/{result.pk}/body/')
+    assert response['Content-Type'] == 'text/html; charset=utf-8'
+    assert b''.join(response.streaming_content).decode() == body
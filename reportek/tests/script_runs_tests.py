@@ -0,0 +1,120 @@
+import io
+import pytest
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APIClient
+
+from reportek.core import script_runs
+from reportek.core.models import ScriptRunJob
+from reportek.core.rpc import BinaryFile
+from reportek.core.consumers.envelope import EnvelopeEvents
+from reportek.site.urls import API_VERSION
+
+from .common import fake_name
+
+
+class FakeRemoteQA:
+
+    def __init__(self, uri):
+        self.uri = uri
+
+    def run_script(self, file_url, script_id):
+        return {
+            'content-type': 'text/html;charset=UTF-8',
+            'result': f'<p>Script {script_id} on {file_url}</p>',
+            'feedback_status': 'INFO',
+            'feedback_message': 'All good',
+        }
+
+
+class FakeRemoteConversion:
+    calls = 0
+
+    def __init__(self, uri):
+        self.uri = uri
+
+    def convert_xml(self, xml_url, convert_id):
+        FakeRemoteConversion.calls += 1
+        return {
+            'content-type': 'text/csv',
+            'filename': 'converted.csv',
+            'content': BinaryFile(io.BytesIO(b'a,b\n1,2\n')),
+        }
+
+
+@pytest.fixture
+def qa_job(fix_envelopes, settings, tmpdir):
+    settings.SCRIPT_RUNS_ROOT = str(tmpdir)
+    user = get_user_model().objects.create(username=fake_name('reporter'))
+    return ScriptRunJob.objects.create(
+        envelope_file=fix_envelopes[0].files.first(),
+        requested_by=user,
+        kind=ScriptRunJob.KINDS.QA.value,
+        script_id='42'
+    )
+
+
+def test_run_qa_script(qa_job, monkeypatch):
+    announced = []
+    monkeypatch.setattr(script_runs, 'RemoteQA', FakeRemoteQA)
+    monkeypatch.setattr(script_runs, 'announce', lambda *args: announced.append(args))
+
+    script_runs.run_script_job(qa_job)
+
+    qa_job.refresh_from_db()
+    assert qa_job.status == ScriptRunJob.STATUSES.COMPLETED.value
+    assert qa_job.feedback_status == 'INFO'
+    assert qa_job.filename.startswith('a_qa_42.htm')
+    assert qa_job.result_path.read_text().startswith('<p>Script 42 on ')
+
+    (envelope, event, payload), = announced
+    assert event is EnvelopeEvents.COMPLETED_SCRIPT_RUN
+    assert payload['job_id'] == qa_job.pk
+
+
+def test_conversion_cache(fix_envelopes, settings, tmpdir, monkeypatch):
+    settings.SCRIPT_RUNS_ROOT = str(tmpdir.mkdir('runs'))
+    settings.CONVERSION_CACHE_ROOT = str(tmpdir.mkdir('conversions'))
+    monkeypatch.setattr(script_runs, 'RemoteConversion', FakeRemoteConversion)
+    monkeypatch.setattr(script_runs, 'announce', lambda *args: None)
+    monkeypatch.setattr(FakeRemoteConversion, 'calls', 0)
+
+    envelope_file = fix_envelopes[0].files.first()
+    # skips the storage logic in `save()`
+    type(envelope_file).objects.filter(pk=envelope_file.pk).update(sha256='f' * 64)
+    envelope_file.refresh_from_db()
+    user = get_user_model().objects.create(username=fake_name('reporter'))
+
+    jobs = []
+    for _ in range(2):
+        job = ScriptRunJob.objects.create(
+            envelope_file=envelope_file,
+            requested_by=user,
+            kind=ScriptRunJob.KINDS.CONVERSION.value,
+            script_id='7'
+        )
+        script_runs.run_script_job(job)
+        jobs.append(job)
+
+    assert FakeRemoteConversion.calls == 1
+    for job in jobs:
+        assert job.status == ScriptRunJob.STATUSES.COMPLETED.value
+        assert job.filename == 'converted.csv'
+        assert job.result_path.read_bytes() == b'a,b\n1,2\n'
+
+
+def test_script_runs_of_other_reporters_hidden(qa_job):
+    envelope_file = qa_job.envelope_file
+    url = f'/api/{API_VERSION}/envelopes/{envelope_file.envelope_id}/files/{envelope_file.pk}/script-runs/'
+
+    admin = get_user_model().objects.create(username=fake_name('admin'), is_superuser=True)
+    client = APIClient()
+    client.force_authenticate(user=admin)
+    assert [job['id'] for job in client.get(url).data] == [qa_job.pk]
+
+    # no permission to report for the envelope's reporter
+    other = get_user_model().objects.create(username=fake_name('other'))
+    client.force_authenticate(user=other)
+    assert client.get(url).data == []
+    assert client.get(f'{url}{qa_job.pk}/').status_code == 404
+    assert client.get(f'{url}{qa_job.pk}/download/').status_code == 404
@@ -0,0 +1,35 @@
+import io
+import pytest
+
+from reportek.core.utils import get_xsd_uri, hash_file, HashingFile
+
+
+XSI = 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+
+
+@pytest.mark.parametrize('xml,expected', [
+    (f'<root {XSI} xsi:noNamespaceSchemaLocation="http://x.eu/a.xsd"/>',
+     'http://x.eu/a.xsd'),
+    (f'<r:root xmlns:r="urn:r" {XSI} a="b" '
+     f'xsi:schemaLocation="urn:r http://x.eu/r.xsd urn:s http://x.eu/s.xsd"/>',
+     'http://x.eu/r.xsd http://x.eu/s.xsd'),
+    ('<root a="http://x.eu/a.xsd"/>', None),
+    ('not xml', None),
+    ('', None),
+])
+def test_get_xsd_uri(xml, expected):
+    assert get_xsd_uri(io.BytesIO(xml.encode())) == expected
+
+
+def test_get_xsd_uri_stops_at_root(tmpdir):
+    """Content after the root start tag is never parsed"""
+    xml_file = tmpdir.join('truncated.xml')
+    xml_file.write(f'<root {XSI} xsi:noNamespaceSchemaLocation="http://x.eu/a.xsd"><a><b>')
+    assert get_xsd_uri(str(xml_file)) == 'http://x.eu/a.xsd'
+
+
+def test_hashing_file():
+    data = bytes(range(256)) * 1000
+    content = HashingFile(io.BytesIO(data))
+    assert b''.join(content.chunks(chunk_size=1000)) == data
+    assert content.content_info == hash_file(io.BytesIO(data))
@@ -0,0 +1,60 @@
+import pytest
+
+from django.contrib.auth import get_user_model
+
+from reportek.core.models import Envelope, DemoAutoQAWorkflow
+from reportek.core.models.workflows import base
+
+
+@pytest.fixture
+def workflow():
+    """An unsaved workflow in its initial state, on an unassigned envelope"""
+    wf = DemoAutoQAWorkflow(name='Benchmark workflow')
+    wf.current_state = wf.initial_state
+    wf.envelope = Envelope(name='Benchmark envelope')
+    return wf
+
+
+def start_unavailable_transition(wf):
+    # 'release' is a valid transition, not available from 'draft'
+    with pytest.raises(wf.TransitionNotAvailable):
+        wf.start_transition('release')
+
+
+def test_compiled_workflow_is_shared(workflow):
+    other = DemoAutoQAWorkflow(name='Other workflow')
+    assert type(workflow.xwf) is type(other.xwf)
+    assert workflow.xwf.bearer is workflow
+    assert other.xwf.bearer is other
+
+
+def test_available_transitions(workflow):
+    # checks fail on unassigned envelopes
+    assert workflow.available_transitions == []
+    workflow.envelope.assigned_to = get_user_model()(username='reviewer')
+    assert workflow.available_transitions == ['send_to_qa']
+
+
+@pytest.mark.parametrize('func', [
+    lambda wf: wf.available_transitions,
+    start_unavailable_transition,
+])
+def test_compiled_workflow_reused(workflow, func, monkeypatch):
+    # the fixture rows aren't saved
+    monkeypatch.setattr(DemoAutoQAWorkflow, 'lock_for_transition', lambda wf: None)
+    monkeypatch.setattr(base, '_xwf_enabled_classes', {})
+    compiled = []
+    compile_xwf = DemoAutoQAWorkflow.compile_xwf.__func__
+
+    def spy(cls):
+        compiled.append(cls)
+        return compile_xwf(cls)
+
+    monkeypatch.setattr(DemoAutoQAWorkflow, 'compile_xwf', classmethod(spy))
+
+    func(workflow)
+    xwf_cls = type(workflow.xwf)
+    for _ in range(3):
+        func(workflow)
+        assert type(workflow.xwf) is xwf_cls
+    assert compiled == [DemoAutoQAWorkflow]